@@ -2,6 +2,8 @@ from app import create_app, db
 from app.models.user import User
 from app.models.product import Product
 from app.models.picture import Picture, PictureFormat
+from app.models.image_job import ImageJob
+from app.models.search_outbox import SearchOutbox
 
 app = create_app()
 
@@ -9,4 +11,5 @@ app = create_app()
 @app.shell_context_processor
 def make_shell_context():
     return {'db': db, 'User': User, 'Product': Product, 'Picture': Picture,
-            'PictureFormat': PictureFormat}
+            'PictureFormat': PictureFormat, 'ImageJob': ImageJob,
+            'SearchOutbox': SearchOutbox}
@@ -9,6 +9,7 @@ from flask_jwt_extended import JWTManager
 from elasticsearch import Elasticsearch
 
 from config import Config
+from app.cache import make_cache
 
 db = SQLAlchemy()
 migrate = Migrate()
@@ -24,6 +25,7 @@ def create_app(config_class: Type[Config] = Config) -> Flask:
     jwt.init_app(app)
     app.elasticsearch = Elasticsearch([app.config['ELASTICSEARCH_URL']]) \
         if app.config['ELASTICSEARCH_URL'] else None
+    app.cache = make_cache(app)
 
     from app.models import bp as models_bp
     app.register_blueprint(models_bp, url_prefix='/api_v1/models')
@@ -37,6 +39,33 @@ def create_app(config_class: Type[Config] = Config) -> Flask:
     from app.api_v1.resources import bp as resources_bp
     app.register_blueprint(resources_bp, url_prefix='/api_v1')
 
+    from app.cli import bp as cli_bp
+    app.register_blueprint(cli_bp)
+
+    from app.utils.image_jobs import ImageJobQueue
+    app.image_jobs = ImageJobQueue(app)
+
+    from app.utils.image_gc import ImageGarbageCollector
+    app.image_gc = ImageGarbageCollector(app)
+
+    from app.passwords import PasswordHasher
+    app.password_hasher = PasswordHasher(app)
+
+    from app.search_backends import ElasticsearchHealth, make_search_backend
+    from app.utils.search import SearchIndexer, searchable_models
+    app.elasticsearch_health = ElasticsearchHealth(
+        app.elasticsearch, refresh_interval=app.config['ELASTICSEARCH_HEALTH_INTERVAL'],
+        failure_threshold=app.config['ELASTICSEARCH_FAILURE_THRESHOLD'],
+        reset_timeout=app.config['ELASTICSEARCH_RESET_TIMEOUT'])
+    app.search_backend = make_search_backend(
+        app, {name: model.search_schema() for name, model in searchable_models().items()})
+    if app.config['SEARCH_INIT_ON_STARTUP'] and app.search_backend is not None:
+        try:
+            app.search_backend.init()
+        except Exception as e:
+            app.logger.warning(f'Search index initialization failed: {e}')
+    app.search_indexer = SearchIndexer(app)
+
     if not app.debug:
         if app.config['MAIL_SERVER']:
             auth = None
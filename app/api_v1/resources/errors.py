@@ -2,7 +2,9 @@ from app import db
 from flask import Response, request
 from werkzeug.exceptions import HTTPException
 from app.api_v1.resources import bp
-from app.main.errors import error_response
+from app.main.errors import bad_request, error_response
+from app.models.paginated import InvalidCursor
+from app.passwords import HashingOverloaded
 
 
 def wants_json_response():
@@ -20,3 +22,15 @@ def internal_error(error: HTTPException) -> Response:
     db.session.rollback()
     if wants_json_response():
         return error_response(500)
+
+
+@bp.app_errorhandler(InvalidCursor)
+def invalid_cursor_error(error: InvalidCursor) -> Response:
+    return bad_request(str(error))
+
+
+@bp.app_errorhandler(HashingOverloaded)
+def hashing_overloaded_error(error: HashingOverloaded) -> Response:
+    response = error_response(429, 'too many logins in progress, try again shortly')
+    response.headers['Retry-After'] = '1'
+    return response
@@ -1,19 +1,24 @@
 from app.api_v1.resources import bp
-import os
 from sqlalchemy.exc import SQLAlchemyError
-from flask import jsonify, Response, request, url_for, current_app, make_response
-from app.models.product import Product
+from flask import jsonify, Response, request, url_for, current_app, make_response, abort
+from app.models.product import Product, cart
 from app.models.user import User
-from app.models.picture import Picture, PictureFormat
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required, current_user
 from app import db
+from app.cache import cached_response, versioned_response
 from app.main.errors import bad_request, error_response
+from app.utils.identity import current_user_model
+from app.utils.image_helper import delete_pictures
 
 
 @bp.route('/products/<int:id>/', methods=['GET'])
 @jwt_required()
 def get_product(id: int) -> Response:
-    return jsonify(Product.query.get_or_404(id).to_dict())
+    version = db.session.query(Product.version).filter(Product.id == id).scalar()
+    if version is None:
+        abort(404)
+    return versioned_response(
+        f'product:{id}', version, lambda: Product.query.get_or_404(id).to_dict())
 
 
 @bp.route('/products/', methods=['GET'])
@@ -21,9 +26,10 @@ def get_product(id: int) -> Response:
 def get_products() -> Response:
     page = request.args.get('page', 1, type=int)
     per_page = min(request.args.get('per_page', 10, type=int), 100)
-    data = Product.to_collection_dict(
-        Product.query, page, per_page, 'resources.get_products')
-    return jsonify(data)
+    cursor = request.args.get('cursor')
+    return cached_response(
+        'products', f'all:{page}:{per_page}:{cursor}', lambda: Product.to_collection_dict(
+            Product.query, page, per_page, 'resources.get_products', cursor=cursor))
 
 
 @bp.route('/products/user/<int:id>/', methods=['GET'])
@@ -31,19 +37,19 @@ def get_products() -> Response:
 def get_users_products(id: int) -> Response:
     page = request.args.get('page', 1, type=int)
     per_page = min(request.args.get('per_page', 10, type=int), 100)
-    data = Product.to_collection_dict(
-        Product.query.filter(
-            Product.user_id == id).order_by(
-            Product.timestamp.desc()), page, per_page,
-        'resources.get_users_products', id=id)
-    return jsonify(data)
+    cursor = request.args.get('cursor')
+    return cached_response(
+        'products', f'user:{id}:{page}:{per_page}:{cursor}', lambda: Product.to_collection_dict(
+            Product.query.filter(
+                Product.user_id == id).order_by(
+                Product.timestamp.desc()), page, per_page,
+            'resources.get_users_products', cursor=cursor, id=id))
 
 
 @bp.route('/products/', methods=['POST'])
 @jwt_required()
 def create_product() -> Response:
-    user_id = get_jwt_identity()
-    user = User.query.get_or_404(user_id)
+    user = current_user_model()
     data = request.get_json() or {}
     if 'name' not in data or 'price' not in data:
         return bad_request('must include name and price fields')
@@ -64,42 +70,28 @@ def create_product() -> Response:
 @jwt_required()
 def delete_product(id: int) -> Response:
     product = Product.query.get_or_404(id)
-    user_id = get_jwt_identity()
-    user = User.query.get_or_404(user_id)
-    if product.user_id != user.id:
+    if product.user_id != current_user.id:
         return error_response(
             403, 'You can only delete products that you have created.')
+    files_to_remove = delete_pictures(product, 'product')
+    db.session.delete(product)
     try:
-        last_picture = Picture.query.filter_by(product_id=product.id).order_by(Picture.id.desc()).first()
-        if last_picture:
-            last_formats = PictureFormat.query.filter_by(picture_id=last_picture.id).all()
-            files_to_remove = [os.path.join(current_app.root_path, 'static/product_pics', pic_format.filename) for
-                               pic_format in last_formats]
-            for file_path in files_to_remove:
-                os.remove(file_path)
-            for pic_format in last_formats:
-                db.session.delete(pic_format)
-            db.session.delete(last_picture)
-        db.session.delete(product)
         db.session.commit()
-        response = jsonify({'message': 'Product and associated picture have been deleted.'})
-        response.status_code = 200
-        return response
     except SQLAlchemyError as e:
+        db.session.rollback()
         return error_response(400,
                               f'A database error occurred while deleting product or picture:'
                               f' {str(e)}')
-    except OSError as e:
-        return error_response(
-            400, f'An error occurred while deleting picture files: {str(e)}')
+    # файлы удаляются только после коммита и не валят запрос, остатки подберёт flask images gc
+    current_app.image_jobs.sweep(files_to_remove)
+    return jsonify({'message': 'Product and associated picture have been deleted.'})
 
 
 @bp.route('/products/update/<int:id>/', methods=['PUT'])
 @jwt_required()
 def update_product(id: int) -> Response:
     product = Product.query.get_or_404(id)
-    user_id = get_jwt_identity()
-    if product.user_id != user_id:
+    if product.user_id != current_user.id:
         return error_response(
             403, 'You can only update products that you have created.')
     data = request.get_json() or {}
@@ -116,11 +108,10 @@ def update_product(id: int) -> Response:
 def add_to_cart(id: int) -> Response:
     try:
         product = Product.query.get_or_404(id)
-        user_id = get_jwt_identity()
-        if product.user_id == user_id:
+        if product.user_id == current_user.id:
             return error_response(
                 403, 'You cannot add your own product.')
-        user = User.query.get_or_404(user_id)
+        user = current_user_model()
         product.add_to_cart(user)
         db.session.commit()
         response = make_response(jsonify({'message': f'You added product {product.name}.'}), 200)
@@ -135,11 +126,10 @@ def add_to_cart(id: int) -> Response:
 def remove_from_cart(id: int) -> Response:
     try:
         product = Product.query.get_or_404(id)
-        user_id = get_jwt_identity()
-        if product.user_id == user_id:
+        if product.user_id == current_user.id:
             return error_response(
                 403, 'You cannot remove your own product from the cart.')
-        user = User.query.get_or_404(user_id)
+        user = current_user_model()
         product.remove_from_cart(user)
         db.session.commit()
         response = jsonify({'message': f'You removed product {product.name}.'})
@@ -154,11 +144,12 @@ def remove_from_cart(id: int) -> Response:
 def products_in_cart() -> Response:
     page = request.args.get('page', 1, type=int)
     per_page = min(request.args.get('per_page', 10, type=int), 100)
-    user_id = get_jwt_identity()
-    user = User.query.get_or_404(user_id)
+    cursor = request.args.get('cursor')
     data = Product.to_collection_dict(
-        user.added_products.order_by(
-            Product.timestamp.desc()), page, per_page, 'resources.products_in_cart')
+        Product.query.join(cart, cart.c.product_id == Product.id).filter(
+            cart.c.user_cart_id == current_user.id).order_by(
+            Product.timestamp.desc()), page, per_page, 'resources.products_in_cart',
+        cursor=cursor)
     return jsonify(data)
 
 
@@ -167,9 +158,11 @@ def products_in_cart() -> Response:
 def liked_users(id: int) -> Response:
     page = request.args.get('page', 1, type=int)
     per_page = min(request.args.get('per_page', 10, type=int), 100)
+    cursor = request.args.get('cursor')
     product = Product.query.get_or_404(id)
     data = User.to_collection_dict(
-        product.users_liked(), page, per_page, 'resources.liked_users', id=id)
+        product.users_liked(), page, per_page, 'resources.liked_users',
+        cursor=cursor, id=id)
     return jsonify(data)
 
 
@@ -177,8 +170,7 @@ def liked_users(id: int) -> Response:
 @jwt_required()
 def purchase(id: int) -> Response:
     product = Product.query.get_or_404(id)
-    user_id = get_jwt_identity()
-    if product.user_id == user_id:
+    if product.user_id == current_user.id:
         return error_response(
             403, 'You cannot buy your own product.')
     buy = product.purchase()
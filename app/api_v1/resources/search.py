@@ -1,9 +1,34 @@
+from datetime import datetime
+from typing import Any, Dict
 from flask_jwt_extended import jwt_required
+from app.main.errors import bad_request
 from app.models.user import User
-from app.utils.search import search_multiple_models
-from flask import request, jsonify, Response, url_for
+from app.utils.search import search_from_source, search_multiple_models, serialize_hits, suggest
+from flask import request, jsonify, Response, url_for, current_app
 from app.api_v1.resources import bp
 
+FILTER_ARGS = ('min_price', 'max_price', 'is_purchased', 'user_id', 'date_from', 'date_to')
+
+
+def search_filters() -> Dict[str, Any]:
+    # фильтры товаров из query string; кривое значение — ValueError
+    args = request.args
+    filters: Dict[str, Any] = {}
+    price = {bound: float(args[arg]) for bound, arg in (('gte', 'min_price'), ('lte', 'max_price')) if arg in args}
+    if price:
+        filters['price'] = price
+    timestamp = {bound: datetime.fromisoformat(args[arg])
+                 for bound, arg in (('gte', 'date_from'), ('lte', 'date_to')) if arg in args}
+    if timestamp:
+        filters['timestamp'] = timestamp
+    if 'is_purchased' in args:
+        if args['is_purchased'].lower() not in ('true', 'false', '1', '0'):
+            raise ValueError('is_purchased must be true or false')
+        filters['is_purchased'] = args['is_purchased'].lower() in ('true', '1')
+    if 'user_id' in args:
+        filters['user_id'] = int(args['user_id'])
+    return filters
+
 
 @bp.route('/search/', methods=['GET'])
 @jwt_required()
@@ -11,10 +36,20 @@ def search() -> Response:
     query = request.args.get('q', '')
     page = request.args.get('page', 1, type=int)
     per_page = min(request.args.get('per_page', 10, type=int), 100)
-    search_results, total = search_multiple_models(query, page, per_page)
+    try:
+        filters = search_filters()
+    except ValueError as e:
+        return bad_request(f'invalid filter: {e}')
+    filter_args = {arg: request.args[arg] for arg in FILTER_ARGS if arg in request.args}
+    if current_app.config['SEARCH_FROM_SOURCE']:
+        items, total, aggregations = search_from_source(query, page, per_page, filters=filters)
+    else:
+        search_results, total, aggregations = search_multiple_models(query, page, per_page, filters=filters)
+        items = serialize_hits(search_results)
 
     data = {
-        'items': [item.to_dict() for item in search_results],
+        'items': items,
+        'aggregations': aggregations,
         '_meta': {
             'page': page,
             'per_page': per_page,
@@ -22,12 +57,20 @@ def search() -> Response:
             'total_items': total
         },
         '_links': {
-            'self': url_for('resources.search', page=page, per_page=per_page, q=query),
+            'self': url_for('resources.search', page=page, per_page=per_page, q=query, **filter_args),
             'next': url_for('resources.search', page=page + 1,
-                            per_page=per_page, q=query) if total > page * per_page else None,
+                            per_page=per_page, q=query, **filter_args) if total > page * per_page else None,
             'prev': url_for('resources.search', page=page - 1, per_page=per_page,
-                            q=query) if page > 1 else None
+                            q=query, **filter_args) if page > 1 else None
         }
     }
 
     return jsonify(data)
+
+
+@bp.route('/search/suggest/', methods=['GET'])
+@jwt_required()
+def search_suggest() -> Response:
+    query = request.args.get('q', '')
+    size = min(request.args.get('size', 10, type=int), 20)
+    return jsonify({'items': suggest(query, size)})
@@ -1,80 +1,50 @@
 from app.api_v1.resources import bp
-import os
-from sqlalchemy.exc import SQLAlchemyError
-from flask import request, jsonify, Response, current_app
-from app.models.user import User
+from flask import request, jsonify, Response, url_for
 from app.models.product import Product
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models.picture import Picture, PictureFormat
-from app import db
+from app.models.image_job import ImageJob
+from flask_jwt_extended import jwt_required, current_user
 from app.main.errors import error_response
-from app.utils.image_helper import save_picture, check_file_size
+from app.utils.image_helper import check_file_size
+from app.utils.identity import current_user_model
+from app.utils.image_jobs import enqueue_picture
+
+
+def job_accepted(job: ImageJob) -> Response:
+    response = jsonify(job.to_dict())
+    response.status_code = 202
+    response.headers['Location'] = url_for('resources.get_upload_job', id=job.id)
+    return response
 
 
 @bp.route('/upload_files/users/', methods=['POST'])
 @jwt_required()
 def upload_pic_user() -> Response:
-    user_id = get_jwt_identity()
-    user = User.query.get_or_404(user_id)
+    # identity_cache локален для воркера и может пережить удаление аккаунта: владельца задачи сверяем с базой
+    user = current_user_model()
     file = request.files['file']
     file = check_file_size(file)
-    try:
-        last_picture = Picture.query.filter_by(user_id=user.id).order_by(Picture.id.desc()).first()
-        if last_picture:
-            last_formats = PictureFormat.query.filter_by(picture_id=last_picture.id).all()
-            files_to_remove = [os.path.join(current_app.root_path, 'static/profile_pics', pic_format.filename) for
-                               pic_format in last_formats]
-            for file_path in files_to_remove:
-                os.remove(file_path)
-            for pic_format in last_formats:
-                db.session.delete(pic_format)
-            db.session.delete(last_picture)
-        save_picture(file, record=user, category='profile',
-                         sizes=((50, 50), (450, 450)))
-        response = jsonify({'message': 'Image has been uploaded.'})
-        response.status_code = 200
-        return response
-    except SQLAlchemyError as e:
-        return error_response(400,
-                              f'A database error occurred while deleting product or picture:'
-                              f' {str(e)}')
-    except OSError as e:
-        return error_response(
-            400, f'An error occurred while deleting picture files: {str(e)}')
+    job = enqueue_picture(file, owner_id=user.id, category='profile')
+    return job_accepted(job)
 
 
 @bp.route('/upload_files/products/<int:id>/', methods=['POST'])
 @jwt_required()
 def upload_pic_product(id: int) -> Response:
-    user_id = get_jwt_identity()
-    user = User.query.get_or_404(user_id)
+    # строка товара с user_id вызывающего заодно доказывает, что его аккаунт ещё существует
     product = Product.query.get_or_404(id)
-    if product.user_id != user.id:
+    if product.user_id != current_user.id:
         return error_response(
             403, 'You can only delete products that you have created.')
     file = request.files['file']
     file = check_file_size(file)
-    try:
-        last_picture = Picture.query.filter_by(product_id=product.id).order_by(Picture.id.desc()).first()
-        if last_picture:
-            last_formats = PictureFormat.query.filter_by(picture_id=last_picture.id).all()
-            files_to_remove = [os.path.join(current_app.root_path, 'static/product_pics', pic_format.filename) for
-                               pic_format in last_formats]
-            for file_path in files_to_remove:
-                os.remove(file_path)
-            for pic_format in last_formats:
-                db.session.delete(pic_format)
-            db.session.delete(last_picture)
-        save_picture(file, record=product, category='product',
-                         sizes=((300, 300), (500, 500)))
-        response = jsonify({'message': 'Image has been uploaded.'})
-        response.status_code = 200
-        return response
-    except SQLAlchemyError as e:
-        return error_response(400,
-                              f'A database error occurred while deleting product or picture:'
-                              f' {str(e)}')
-    except OSError as e:
-        return error_response(
-            400, f'An error occurred while deleting picture files: {str(e)}')
+    job = enqueue_picture(file, owner_id=current_user.id, category='product', product=product)
+    return job_accepted(job)
+
 
+@bp.route('/upload_files/jobs/<int:id>/', methods=['GET'])
+@jwt_required()
+def get_upload_job(id: int) -> Response:
+    job = ImageJob.query.get_or_404(id)
+    if job.owner_id != current_user.id:
+        return error_response(403, 'You can only view your own uploads.')
+    return jsonify(job.to_dict())
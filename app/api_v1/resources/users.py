@@ -1,19 +1,35 @@
 from sqlalchemy.exc import SQLAlchemyError
 from app.api_v1.resources import bp
-from flask import jsonify, Response, request, url_for, current_app, make_response
-import os
-from app.models.picture import Picture, PictureFormat
-from app.models.product import Product
+from flask import jsonify, Response, request, url_for, make_response, abort
 from app.models.user import User
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required, current_user
 from app import db
+from app.cache import versioned_response
 from app.main.errors import bad_request, error_response
+from app.utils.accounts import delete_user_account
+from app.utils.identity import current_user_model
+
+
+def auth_response(user: User) -> Response:
+    if request.args.get('expand') == 'profile':
+        db.session.refresh(user)
+        response_dict = user.to_dict()
+    else:
+        response_dict = user.to_auth_dict()
+    response_dict['access_token'] = user.get_token()
+    response = jsonify(response_dict)
+    response.headers['Location'] = url_for('resources.get_user', id=user.id)
+    return response
 
 
 @bp.route('/users/<int:id>/', methods=['GET'])
 @jwt_required()
 def get_user(id: int) -> Response:
-    return jsonify(User.query.get_or_404(id).to_dict())
+    version = db.session.query(User.version).filter(User.id == id).scalar()
+    if version is None:
+        abort(404)
+    return versioned_response(
+        f'user:{id}', version, lambda: User.query.get_or_404(id).to_dict())
 
 
 @bp.route('/users/', methods=['GET'])
@@ -21,7 +37,9 @@ def get_user(id: int) -> Response:
 def get_users() -> Response:
     page = request.args.get('page', 1, type=int)
     per_page = min(request.args.get('per_page', 10, type=int), 100)
-    data = User.to_collection_dict(User.query, page, per_page, 'resources.get_users')
+    cursor = request.args.get('cursor')
+    data = User.to_collection_dict(User.query, page, per_page, 'resources.get_users',
+                                   cursor=cursor)
     return jsonify(data)
 
 
@@ -31,8 +49,9 @@ def get_followers(id: int) -> Response:
     user = User.query.get_or_404(id)
     page = request.args.get('page', 1, type=int)
     per_page = min(request.args.get('per_page', 10, type=int), 100)
+    cursor = request.args.get('cursor')
     data = User.to_collection_dict(user.followers, page, per_page,
-                                   'resources.get_followers', id=id)
+                                   'resources.get_followers', cursor=cursor, id=id)
     return jsonify(data)
 
 
@@ -42,20 +61,20 @@ def get_followed(id: int) -> Response:
     user = User.query.get_or_404(id)
     page = request.args.get('page', 1, type=int)
     per_page = min(request.args.get('per_page', 10, type=int), 100)
+    cursor = request.args.get('cursor')
     data = User.to_collection_dict(user.followed, page, per_page,
-                                   'resources.get_followed', id=id)
+                                   'resources.get_followed', cursor=cursor, id=id)
     return jsonify(data)
 
 
 @bp.route('/users/follow/<int:id>/', methods=['POST'])
 @jwt_required()
 def follow(id: int) -> Response:
-    user_id = get_jwt_identity()
-    if id == user_id:
+    if id == current_user.id:
         return bad_request('You cannot follow yourself!')
-    current_user = User.query.get_or_404(user_id)
+    follower = current_user_model()
     user = User.query.get_or_404(id)
-    current_user.follow(user)
+    follower.follow(user)
     db.session.commit()
     return jsonify(user.to_dict())
 
@@ -63,12 +82,11 @@ def follow(id: int) -> Response:
 @bp.route('/users/unfollow/<int:id>/', methods=['POST'])
 @jwt_required()
 def unfollow(id: int) -> Response:
-    user_id = get_jwt_identity()
-    if id == user_id:
+    if id == current_user.id:
         return bad_request('You cannot unfollow yourself!')
-    current_user = User.query.get_or_404(user_id)
+    follower = current_user_model()
     user = User.query.get_or_404(id)
-    current_user.unfollow(user)
+    follower.unfollow(user)
     db.session.commit()
     return jsonify(user.to_dict())
 
@@ -86,12 +104,8 @@ def create_user() -> Response:
     user.from_dict(data, new_user=True)
     db.session.add(user)
     db.session.commit()
-    token = user.get_token()
-    response_dict = user.to_dict()
-    response_dict['access_token'] = token
-    response = jsonify(response_dict)
+    response = auth_response(user)
     response.status_code = 201
-    response.headers['Location'] = url_for('resources.get_user', id=user.id)
     return response
 
 
@@ -102,12 +116,7 @@ def login_user() -> Response:
         return bad_request('must include email and password fields')
     user = User.authenticate(email=data['email'], password=data['password'])
     if user:
-        token = user.get_token()
-        response_dict = user.to_dict()
-        response_dict['access_token'] = token
-        response = jsonify(response_dict)
-        response.headers['Location'] = url_for('resources.get_user', id=user.id)
-        return response
+        return auth_response(user)
     else:
         return error_response(401)
 
@@ -115,8 +124,7 @@ def login_user() -> Response:
 @bp.route('/users/update/', methods=['PUT'])
 @jwt_required()
 def update_user() -> Response:
-    user_id = get_jwt_identity()
-    user = User.query.get_or_404(user_id)
+    user = current_user_model()
     data = request.get_json() or {}
     if 'username' in data and data['username'] != user.username and \
             User.query.filter_by(username=data['username']).first():
@@ -132,8 +140,7 @@ def update_user() -> Response:
 @bp.route('/users/edit_password/', methods=['PUT'])
 @jwt_required()
 def edit_password() -> Response:
-    user_id = get_jwt_identity()
-    user = User.query.get_or_404(user_id)
+    user = current_user_model()
     data = request.get_json() or {}
     if 'current_password' not in data or 'password' not in data:
         return bad_request('must include current_password and password fields')
@@ -147,42 +154,9 @@ def edit_password() -> Response:
 @bp.route('/users/delete/', methods=['DELETE'])
 @jwt_required()
 def delete_user() -> Response:
-    user_id = get_jwt_identity()
-    user = User.query.get_or_404(user_id)
-    products = Product.query.filter_by(user_id=user_id).all()
-    last_picture = Picture.query.filter_by(user_id=user.id).order_by(Picture.id.desc()).first()
-    if last_picture:
-        last_formats = PictureFormat.query.filter_by(picture_id=last_picture.id).all()
-        files_to_remove = [os.path.join(current_app.root_path,
-                                        'static/profile_pics', pic_format.filename) for
-                           pic_format in last_formats]
-        for file_path in files_to_remove:
-            os.remove(file_path)
-        for pic_format in last_formats:
-            db.session.delete(pic_format)
-        db.session.delete(last_picture)
-    for product in products:
-        try:
-            last_picture = Picture.query.filter_by(product_id=product.id).order_by(Picture.id.desc()).first()
-            if last_picture:
-                last_formats = PictureFormat.query.filter_by(picture_id=last_picture.id).all()
-                files_to_remove = [os.path.join(current_app.root_path, 'static/product_pics', pic_format.filename) for
-                                   pic_format in last_formats]
-                for file_path in files_to_remove:
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-                for pic_format in last_formats:
-                    db.session.delete(pic_format)
-                db.session.delete(last_picture)
-        except Exception as e:
-            return make_response(jsonify({'error': str(e)}), 500)
-        db.session.delete(product)
     try:
-        db.session.delete(user)
-        db.session.commit()
+        delete_user_account(current_user.id)
     except SQLAlchemyError as e:
+        db.session.rollback()
         return make_response(jsonify({'error': str(e)}), 500)
     return jsonify({'message': 'User has been deleted.'})
-
-
-
@@ -0,0 +1,130 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Any, Callable, Optional
+from flask import Flask, Response, current_app, jsonify, request
+
+
+class TTLCache(object):
+    def __init__(self, max_entries: int = 1024, ttl: float = 60) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._data[key] = (value, monotonic() + (self.ttl if ttl is None else ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key: str) -> int:
+        # счётчики поколений живут без TTL, иначе сброс в 0 вернул бы к жизни старые записи
+        with self._lock:
+            value, _ = self._data.get(key, (0, float('inf')))
+            self._data[key] = (value + 1, float('inf'))
+            self._data.move_to_end(key)
+            return value + 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class NullCache(object):
+    def get(self, key: str) -> Optional[Any]:
+        return None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        pass
+
+    def delete(self, key: str) -> None:
+        pass
+
+    def incr(self, key: str) -> int:
+        return 0
+
+    def clear(self) -> None:
+        pass
+
+
+class RedisCache(object):
+    def __init__(self, url: str, ttl: float = 60, prefix: str = 'luda:') -> None:
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.client.get(self.prefix + key)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self.client.set(self.prefix + key, value, ex=int(self.ttl if ttl is None else ttl))
+
+    def delete(self, key: str) -> None:
+        self.client.delete(self.prefix + key)
+
+    def incr(self, key: str) -> int:
+        return self.client.incr(self.prefix + key)
+
+    def clear(self) -> None:
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+
+def make_cache(app: Flask) -> TTLCache | NullCache | RedisCache:
+    backend = app.config['RESPONSE_CACHE']
+    if backend == 'redis':
+        return RedisCache(app.config['REDIS_URL'], ttl=app.config['RESPONSE_CACHE_TTL'])
+    if backend == 'simple':
+        return TTLCache(max_entries=app.config['RESPONSE_CACHE_MAX_ENTRIES'],
+                        ttl=app.config['RESPONSE_CACHE_TTL'])
+    return NullCache()
+
+
+def namespace_key(namespace: str, key: str) -> str:
+    # инвалидация пространства имён = инкремент его поколения, старые ключи просто истекают
+    generation = current_app.cache.get(f'generation:{namespace}') or 0
+    return f'{namespace}:{int(generation)}:{key}'
+
+
+def invalidate(*namespaces: str) -> None:
+    for namespace in namespaces:
+        current_app.cache.incr(f'generation:{namespace}')
+
+
+def cached_response(namespace: str, key: str, build: Callable[[], Any]) -> Response:
+    full_key = namespace_key(namespace, key)
+    body = current_app.cache.get(full_key)
+    if body is None:
+        body = jsonify(build()).get_data()
+        current_app.cache.set(full_key, body)
+    return current_app.response_class(body, mimetype=current_app.json.mimetype)
+
+
+def versioned_response(namespace: str, version: int, build: Callable[[], Any]) -> Response:
+    # ETag берётся из колонки version: на 304 не строим to_dict и не ходим в кэш тел
+    etag = f'{namespace}:{version}'
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = cached_response(namespace, str(version), build)
+    response.set_etag(etag)
+    return response
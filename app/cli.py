@@ -0,0 +1,99 @@
+import click
+from datetime import timedelta
+from flask import Blueprint, current_app
+from app.models.counters import recount
+from app.utils.image_gc import collect_orphans
+from app.utils.image_jobs import process_pending_jobs
+from app.utils.search import drain_outbox, reindex_model, searchable_models
+
+bp = Blueprint('cli', __name__, cli_group=None)
+
+
+@bp.cli.group()
+def counters() -> None:
+    """Denormalized counter maintenance commands."""
+    pass
+
+
+@counters.command()
+def repair() -> None:
+    """Recompute follower, product and cart counters from the source tables."""
+    for name, rows in recount().items():
+        click.echo(f'{name}: {rows} rows repaired')
+
+
+@bp.cli.group()
+def images() -> None:
+    """Image processing commands."""
+    pass
+
+
+@images.command()
+@click.option('--stale-minutes', default=10, help='Requeue jobs stuck in processing for this long.')
+def process(stale_minutes: int) -> None:
+    """Process queued and stale image jobs synchronously."""
+    processed = process_pending_jobs(timedelta(minutes=stale_minutes))
+    click.echo(f'{processed} image jobs processed')
+
+
+@images.command()
+@click.option('--grace-minutes', default=None, type=int,
+              help='Keep unreferenced files younger than this. Defaults to IMAGE_GC_GRACE.')
+@click.option('--batch-size', default=None, type=int, help='Directory entries checked per query.')
+@click.option('--dry-run', is_flag=True, help='Only count orphaned files.')
+def gc(grace_minutes: int, batch_size: int, dry_run: bool) -> None:
+    """Remove picture files that no picture format references."""
+    grace = timedelta(minutes=grace_minutes) if grace_minutes is not None else None
+    orphans = collect_orphans(batch_size=batch_size, grace=grace, dry_run=dry_run)
+    click.echo(f'{orphans} orphaned files {"found" if dry_run else "removed"}')
+
+
+@bp.cli.group()
+def search() -> None:
+    """Search index commands."""
+    pass
+
+
+def drain_all() -> int:
+    total = 0
+    while True:
+        processed = drain_outbox()
+        total += processed
+        if processed == 0:
+            return total
+
+
+@search.command()
+def init() -> None:
+    """Create search index templates and empty indices."""
+    if current_app.search_backend is None:
+        click.echo('Search is disabled')
+        return
+    for index, status in current_app.search_backend.init().items():
+        click.echo(f'{index}: {status}')
+
+
+@search.command()
+def drain() -> None:
+    """Send every pending search outbox entry to Elasticsearch."""
+    click.echo(f'{drain_all()} outbox entries processed')
+
+
+@search.command()
+@click.option('--index', 'indices', multiple=True, type=click.Choice(sorted(searchable_models())),
+              help='Index to rebuild, may be repeated. Defaults to every searchable model.')
+@click.option('--chunk-size', default=500, help='Documents per bulk request.')
+@click.option('--threads', default=1, help='Concurrent bulk requests.')
+@click.option('--swap/--in-place', default=True,
+              help='Build a fresh index and switch the alias to it, or write into the live index.')
+def reindex(indices: tuple, chunk_size: int, threads: int, swap: bool) -> None:
+    """Rebuild search indices from the database."""
+    models = searchable_models()
+    for name in indices or sorted(models):
+        def progress(done: int, total: int, elapsed: float) -> None:
+            click.echo(f'{name}: {done}/{total} documents, {done / max(elapsed, 1e-6):.0f} docs/s')
+
+        done = reindex_model(models[name], chunk_size=chunk_size, threads=threads, swap=swap,
+                             progress=progress)
+        click.echo(f'{name}: {done} documents indexed')
+    click.echo(f'{drain_all()} outbox entries processed')
@@ -2,7 +2,7 @@ from flask import Blueprint
 
 bp = Blueprint('models', __name__)
 
-from app.models import product, picture, user, searchable
+from app.models import product, picture, user, searchable, image_job, search_outbox
 
 
 
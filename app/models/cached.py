@@ -0,0 +1,49 @@
+from __future__ import annotations
+from typing import Any, List
+from flask_sqlalchemy.session import Session
+from sqlalchemy import inspect
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Mapper
+from app import db
+from app.cache import invalidate
+
+
+class CachedMixin(object):
+    def cache_namespaces(self) -> List[str]:
+        # по умолчанию сбрасываются только ответы про сам объект; модели, попадающие в списки, дополняют
+        return [f'{self.__tablename__}:{self.id}']
+
+    @classmethod
+    def after_flush(cls, session: Session, flush_context: Any) -> None:
+        # собираем на каждом flush: autoflush внутри запроса уносит изменения из session.dirty
+        # ещё до before_commit
+        namespaces = session.info.setdefault('cache_namespaces', set())
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            if isinstance(obj, CachedMixin):
+                namespaces.update(obj.cache_namespaces())
+
+    @classmethod
+    def after_commit(cls, session: Session) -> None:
+        namespaces = session.info.pop('cache_namespaces', None)
+        if namespaces:
+            invalidate(*namespaces)
+
+    @classmethod
+    def after_rollback(cls, session: Session) -> None:
+        session.info.pop('cache_namespaces', None)
+
+
+class VersionedMixin(object):
+    version = db.Column(db.Integer, default=1, server_default='1', nullable=False)
+
+    @classmethod
+    def before_update(cls, mapper: Mapper, connection: Connection, target: VersionedMixin) -> None:
+        # любое UPDATE строки (включая счётчики) двигает версию, если её не сдвинули явно
+        if not inspect(target).attrs.version.history.has_changes():
+            target.version = type(target).version + 1
+
+
+db.event.listen(VersionedMixin, 'before_update', VersionedMixin.before_update, propagate=True)
+db.event.listen(db.session, 'after_flush', CachedMixin.after_flush)
+db.event.listen(db.session, 'after_commit', CachedMixin.after_commit)
+db.event.listen(db.session, 'after_rollback', CachedMixin.after_rollback)
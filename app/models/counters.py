@@ -0,0 +1,75 @@
+from typing import Any, Dict
+from sqlalchemy import func, inspect, select
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import ClauseElement
+from app import db
+
+
+def increment(obj: Any, attr: str, delta: int = 1) -> None:
+    # для сохранённых строк счётчик меняется выражением col = col + delta прямо в UPDATE,
+    # чтобы параллельные транзакции не затирали друг друга
+    current = obj.__dict__.get(attr)
+    if isinstance(current, ClauseElement):
+        value = current + delta
+    elif inspect(obj).persistent:
+        value = getattr(type(obj), attr) + delta
+    else:
+        value = (current or 0) + delta
+    setattr(obj, attr, value)
+
+
+def before_flush(session: Session, flush_context: Any, instances: Any) -> None:
+    from app.models.product import Product
+    from app.models.user import User
+    deleted = set(session.deleted)
+    with session.no_autoflush:
+        for obj in session.new:
+            if isinstance(obj, Product):
+                author = obj.author or session.get(User, obj.user_id)
+                increment(author, 'product_count')
+        for obj in deleted:
+            if isinstance(obj, Product):
+                if obj.author not in deleted:
+                    increment(obj.author, 'product_count', -1)
+                for user in obj.liked:
+                    if user not in deleted:
+                        increment(user, 'product_liked_count', -1)
+            elif isinstance(obj, User):
+                for user in obj.followers:
+                    if user not in deleted:
+                        increment(user, 'followed_count', -1)
+                for user in obj.followed:
+                    if user not in deleted:
+                        increment(user, 'followers_count', -1)
+                for product in obj.added_products:
+                    if product not in deleted:
+                        increment(product, 'liked_count', -1)
+
+
+def recount() -> Dict[str, int]:
+    from app.models.product import Product, cart
+    from app.models.user import User, followers
+    counters = {
+        'user.product_count': (User.product_count, select(func.count(Product.id)).where(
+            Product.user_id == User.id)),
+        'user.followers_count': (User.followers_count, select(func.count()).select_from(
+            followers).where(followers.c.followed_id == User.id)),
+        'user.followed_count': (User.followed_count, select(func.count()).select_from(
+            followers).where(followers.c.follower_id == User.id)),
+        'user.product_liked_count': (User.product_liked_count, select(func.count()).select_from(
+            cart).where(cart.c.user_cart_id == User.id)),
+        'product.liked_count': (Product.liked_count, select(func.count()).select_from(
+            cart).where(cart.c.product_id == Product.id)),
+    }
+    repaired = {}
+    for name, (column, count_query) in counters.items():
+        actual = count_query.scalar_subquery()
+        result = db.session.execute(
+            db.update(column.class_).where(column != actual).values({column.key: actual}),
+            execution_options={'synchronize_session': False})
+        repaired[name] = result.rowcount
+    db.session.commit()
+    return repaired
+
+
+db.event.listen(db.session, 'before_flush', before_flush)
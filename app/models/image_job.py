@@ -0,0 +1,34 @@
+from datetime import datetime
+from typing import Any, Dict
+from flask import url_for
+from app import db
+
+
+class ImageJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), index=True, nullable=False, default='queued')  # queued, processing, done, failed
+    category = db.Column(db.String(20), nullable=False)  # 'profile' или 'product'
+    owner_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id', ondelete='CASCADE'), nullable=True)
+    source_path = db.Column(db.String(255), nullable=False)
+    picture_id = db.Column(db.Integer, nullable=True)
+    error = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def __repr__(self) -> str:
+        return f'<ImageJob {self.id} {self.status}>'
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'status': self.status,
+            'category': self.category,
+            'picture_id': self.picture_id,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() + 'Z',
+            'updated_at': self.updated_at.isoformat() + 'Z',
+            '_links': {
+                'self': url_for('resources.get_upload_job', id=self.id)
+            }
+        }
@@ -1,30 +1,166 @@
-from flask import url_for
+import base64
+import hashlib
+import json
+from datetime import datetime
+from flask import url_for, current_app
 from flask_sqlalchemy import BaseQuery
-from typing import Any, Dict
+from sqlalchemy import and_, or_, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import InstrumentedAttribute
+from sqlalchemy.sql import ColumnElement
+from typing import Any, Dict, List, Optional, Tuple
+from app import db
+from app.cache import TTLCache
+
+count_cache = TTLCache(max_entries=1024)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values: List[Any]) -> str:
+    payload = json.dumps([value.isoformat() if isinstance(value, datetime) else value
+                          for value in values])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def cursor_value(key: InstrumentedAttribute, value: Any) -> Any:
+    # курсор приходит от клиента: значение приводится к типу колонки, чтобы подделка не дошла до SQL
+    if value is None or isinstance(value, (bool, dict, list)):
+        raise ValueError(value)
+    python_type = key.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is int and not isinstance(value, int):
+        raise ValueError(value)
+    return python_type(value)
+
+
+def decode_cursor(cursor: str, keys: List[InstrumentedAttribute]) -> List[Any]:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError(cursor)
+        return [cursor_value(key, value) for key, value in zip(keys, values)]
+    except (ValueError, TypeError):
+        raise InvalidCursor('invalid cursor')
+
+
+def query_signature(query: BaseQuery) -> str:
+    compiled = query.order_by(None).statement.compile(dialect=db.engine.dialect)
+    params = sorted((key, repr(value)) for key, value in compiled.params.items())
+    return hashlib.sha1(f'{compiled}|{params}'.encode()).hexdigest()
+
+
+def planner_estimate(query: BaseQuery) -> Optional[int]:
+    # оценка планировщика Postgres (pg_class.reltuples + селективность фильтров) вместо COUNT(*).
+    # EXPLAIN идёт в savepoint: упавший запрос в Postgres иначе обрывает всю транзакцию запроса
+    if db.engine.dialect.name != 'postgresql':
+        return None
+    try:
+        compiled = query.order_by(None).statement.compile(
+            dialect=db.engine.dialect, compile_kwargs={'literal_binds': True})
+        with db.session.begin_nested():
+            plan = db.session.execute(text(f'EXPLAIN (FORMAT JSON) {compiled}')).scalar()
+    except (SQLAlchemyError, NotImplementedError):
+        return None
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def count_total(query: BaseQuery) -> Tuple[int, bool]:
+    strategy = current_app.config['PAGINATION_COUNT']
+    if strategy == 'cached':
+        key = query_signature(query)
+        total = count_cache.get(key)
+        if total is not None:
+            return total, False
+        total = query.order_by(None).count()
+        count_cache.set(key, total, ttl=current_app.config['PAGINATION_COUNT_TTL'])
+        return total, True
+    if strategy == 'estimate':
+        total = planner_estimate(query)
+        if total is not None and total >= current_app.config['PAGINATION_ESTIMATE_THRESHOLD']:
+            return total, False
+    return query.order_by(None).count(), True
 
 
 class PaginatedAPIMixin(object):
-    @staticmethod
-    def to_collection_dict(query: BaseQuery, page: int,
-                           per_page: int, endpoint: str, **kwargs: Any) -> Dict[str, Any]:
-        resources = query.paginate(page=page, per_page=per_page, error_out=False)
+    __cursor_keys__: Tuple[str, ...] = ('id',)
+    __cursor_descending__ = False
+
+    @classmethod
+    def to_collection_dict(cls, query: BaseQuery, page: int,
+                           per_page: int, endpoint: str, cursor: Optional[str] = None,
+                           **kwargs: Any) -> Dict[str, Any]:
+        if cursor is not None:
+            return cls.to_cursor_collection_dict(query, cursor, per_page, endpoint, **kwargs)
+        resources = query.paginate(page=page, per_page=per_page, error_out=False, count=False)
+        resources.total, total_exact = count_total(query)
+        has_next = resources.has_next or (
+            not total_exact and len(resources.items) == per_page)
         data = {
-            'items': [item.to_dict() for item in resources.items],
+            'items': cls.to_dict_batch(resources.items),
             '_meta': {
                 'page': page,
                 'per_page': per_page,
                 'total_pages': resources.pages,
-                'total_items': resources.total
+                'total_items': resources.total,
+                'total_exact': total_exact
             },
             '_links': {
                 'self': url_for(endpoint, page=page, per_page=per_page,
                                 **kwargs),
                 'next': url_for(endpoint, page=page + 1, per_page=per_page,
-                                **kwargs) if resources.has_next else None,
+                                **kwargs) if has_next else None,
                 'prev': url_for(endpoint, page=page - 1, per_page=per_page,
                                 **kwargs) if resources.has_prev else None
             }
         }
         return data
 
+    @classmethod
+    def to_cursor_collection_dict(cls, query: BaseQuery, cursor: str,
+                                  per_page: int, endpoint: str, **kwargs: Any) -> Dict[str, Any]:
+        # keyset-пагинация: без OFFSET и без COUNT(*), пустой cursor — первая страница
+        keys = [getattr(cls, key) for key in cls.__cursor_keys__]
+        query = query.order_by(None).order_by(
+            *[key.desc() if cls.__cursor_descending__ else key.asc() for key in keys])
+        if cursor:
+            query = query.filter(cls._after_cursor(keys, decode_cursor(cursor, keys)))
+        items = query.limit(per_page + 1).all()
+        has_next = len(items) > per_page
+        items = items[:per_page]
+        next_cursor = encode_cursor(
+            [getattr(items[-1], key) for key in cls.__cursor_keys__]) if has_next else None
+        data = {
+            'items': cls.to_dict_batch(items),
+            '_meta': {
+                'per_page': per_page,
+                'cursor': cursor,
+                'next_cursor': next_cursor
+            },
+            '_links': {
+                'self': url_for(endpoint, cursor=cursor, per_page=per_page,
+                                **kwargs),
+                'next': url_for(endpoint, cursor=next_cursor, per_page=per_page,
+                                **kwargs) if next_cursor else None,
+                'prev': None
+            }
+        }
+        return data
+
+    @classmethod
+    def _after_cursor(cls, keys: List[InstrumentedAttribute], values: List[Any]) -> ColumnElement:
+        # (k1, k2) > (v1, v2) в виде k1 > v1 OR (k1 = v1 AND k2 > v2), переносимо между СУБД
+        clauses = []
+        for i, (key, value) in enumerate(zip(keys, values)):
+            beyond = key < value if cls.__cursor_descending__ else key > value
+            clauses.append(and_(*[k == v for k, v in zip(keys[:i], values[:i])], beyond))
+        return or_(*clauses)
 
+    @classmethod
+    def to_dict_batch(cls, items: List[Any]) -> List[Dict[str, Any]]:
+        return [item.to_dict() for item in items]
@@ -1,23 +1,76 @@
+from typing import Any, Dict, Iterable, List
+from flask_sqlalchemy.session import Session
+from sqlalchemy import func
+from sqlalchemy.orm import InstrumentedAttribute
 from app import db
+from app.models.cached import CachedMixin
+from app.models.counters import increment
 
 
-class Picture(db.Model):
+class Picture(CachedMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
-    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id', ondelete='CASCADE'), nullable=True)
 
     formats = db.relationship('PictureFormat', backref='picture', lazy='dynamic')  # загрузка форматов по запросу
 
     def __repr__(self) -> str:
         return f'<Picture {self.id}>'
 
+    def cache_namespaces(self) -> List[str]:
+        if self.product_id is not None:
+            return [f'product:{self.product_id}', 'products']
+        return [f'user:{self.user_id}']
+
+    def owner(self, session: Session) -> Any:
+        from app.models.product import Product
+        from app.models.user import User
+        if self.user is not None or self.product is not None:
+            return self.user or self.product
+        if self.user_id is not None:
+            return session.get(User, self.user_id)
+        if self.product_id is not None:
+            return session.get(Product, self.product_id)
+        return None
+
+    @classmethod
+    def before_flush(cls, session: Session, flush_context: Any, instances: Any) -> None:
+        # аватар входит в to_dict владельца, поэтому смена картинки — новая версия владельца
+        with session.no_autoflush:
+            for obj in list(session.new) + list(session.deleted):
+                if isinstance(obj, Picture):
+                    owner = obj.owner(session)
+                    if owner is not None and owner not in session.deleted:
+                        increment(owner, 'version')
+
 
 class PictureFormat(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    filename = db.Column(db.String(120), nullable=False)
+    filename = db.Column(db.String(120), index=True, nullable=False)
     format = db.Column(db.String(20), nullable=False)  # '50x50', '200x200', '300x300', etc.
-    picture_id = db.Column(db.Integer, db.ForeignKey('picture.id'), nullable=False)
+    content_hash = db.Column(db.String(64), index=True, nullable=True)  # sha256 исходника и размера, у старых строк NULL
+    picture_id = db.Column(db.Integer, db.ForeignKey('picture.id', ondelete='CASCADE'), nullable=False)
 
     def __repr__(self) -> str:
         return f'<PictureFormat {self.format} for picture {self.picture_id}>'
 
+
+def formats_by_owner(owner_column: InstrumentedAttribute, owner_ids: List[int],
+                     formats: Iterable[str]) -> Dict[int, Dict[str, str]]:
+    # {owner_id: {'300x300': filename, ...}} для первой картинки каждого владельца, одним запросом
+    if not owner_ids:
+        return {}
+    first_picture = db.session.query(
+        owner_column.label('owner_id'), func.min(Picture.id).label('picture_id')).filter(
+        owner_column.in_(owner_ids)).group_by(owner_column).subquery()
+    rows = db.session.query(
+        first_picture.c.owner_id, PictureFormat.format, PictureFormat.filename).join(
+        PictureFormat, PictureFormat.picture_id == first_picture.c.picture_id).filter(
+        PictureFormat.format.in_(list(formats))).order_by(PictureFormat.id)
+    result: Dict[int, Dict[str, str]] = {}
+    for owner_id, pic_format, filename in rows:
+        result.setdefault(owner_id, {}).setdefault(pic_format, filename)
+    return result
+
+
+db.event.listen(db.session, 'before_flush', Picture.before_flush)
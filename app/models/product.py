@@ -1,22 +1,39 @@
+from __future__ import annotations
 from datetime import datetime
-from typing import Dict, Any
+from decimal import Decimal
+from typing import Dict, Any, List
 from flask import url_for
-from sqlalchemy import func
+from app.models.cached import CachedMixin, VersionedMixin
+from app.models.counters import increment
 from app.models.searchable import SearchableMixin
 from app import db
 from app.models.paginated import PaginatedAPIMixin
+from app.models.picture import Picture, formats_by_owner
 from app.models.user import User
 
 
 cart = db.Table(
     'cart',
-    db.Column('user_cart_id', db.Integer, db.ForeignKey('user.id')),
-    db.Column('product_id', db.Integer, db.ForeignKey('product.id'))
+    db.Column('user_cart_id', db.Integer, db.ForeignKey('user.id', ondelete='CASCADE')),
+    db.Column('product_id', db.Integer, db.ForeignKey('product.id', ondelete='CASCADE'))
 )
 
 
-class Product(PaginatedAPIMixin, SearchableMixin, db.Model):
+class Product(PaginatedAPIMixin, SearchableMixin, CachedMixin, VersionedMixin, db.Model):
     __searchable__ = ['name']
+    __search_boosts__ = {'name': 2.0}
+    __search_fields__ = {
+        'price': {'type': 'scaled_float', 'scaling_factor': 100},
+        'timestamp': {'type': 'date'},
+        'is_purchased': {'type': 'boolean'},
+        'user_id': {'type': 'integer'}
+    }
+    __search_facets__ = {
+        'price': {'type': 'histogram', 'interval': 100},
+        'is_purchased': {'type': 'terms'}
+    }
+    __cursor_keys__ = ('timestamp', 'id')
+    __cursor_descending__ = True
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
     description = db.Column(db.String(140), nullable=True)
@@ -25,6 +42,7 @@ class Product(PaginatedAPIMixin, SearchableMixin, db.Model):
     timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     is_purchased = db.Column(db.Boolean, default=False)
+    liked_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
     liked = db.relationship(
         'User', secondary=cart,
         primaryjoin=(cart.c.product_id == id),
@@ -34,6 +52,9 @@ class Product(PaginatedAPIMixin, SearchableMixin, db.Model):
     def __repr__(self) -> str:
         return f"<Product {self.name}>"
 
+    def cache_namespaces(self) -> List[str]:
+        return [f'product:{self.id}', 'products', f'user:{self.user_id}']
+
     def is_added(self, user: User) -> bool:
         return self.liked.filter(
             cart.c.user_cart_id == user.id).count() > 0
@@ -41,10 +62,14 @@ class Product(PaginatedAPIMixin, SearchableMixin, db.Model):
     def add_to_cart(self, user: User) -> None:
         if not self.is_added(user):
             self.liked.append(user)
+            increment(self, 'liked_count')
+            increment(user, 'product_liked_count')
 
     def remove_from_cart(self, user: User) -> None:
         if self.is_added(user):
             self.liked.remove(user)
+            increment(self, 'liked_count', -1)
+            increment(user, 'product_liked_count', -1)
 
     def purchase(self) -> bool:
         if not self.is_purchased:
@@ -61,37 +86,60 @@ class Product(PaginatedAPIMixin, SearchableMixin, db.Model):
             cart.c.product_id == self.id)
 
     def to_dict(self) -> Dict[str, Any]:
-        picture = self.pictures.first()
-        if picture:
-            mini_pic_format = picture.formats.filter_by(format='300x300').first()
-            pic_format = picture.formats.filter_by(format='500x500').first()
-            mini_pic_url = mini_pic_format.filename if mini_pic_format else \
-                url_for('static', filename='product_pics/default_pic_product_300x300.png')
-            product_pic_url = pic_format.filename if pic_format else \
-                url_for('static', filename='product_pics/default_pic_product_500x500.png')
-        else:
-            mini_pic_url = url_for(
-                'static', filename='product_pics/default_pic_product_300x300.png')
-            product_pic_url = url_for(
-                'static', filename='product_pics/default_pic_product_500x500.png')
-        data = {
-            'id': self.id,
-            'name': self.name,
-            'price': self.price,
-            'timestamp': self.timestamp,
-            'description': self.description,
-            'is_purchased': self.is_purchased,
-            'liked_count': db.session.query(func.count(
-                cart.c.user_cart_id)).filter(cart.c.product_id == self.id).scalar(),
-            '_links': {
-                'self': url_for('resources.get_product', id=self.id),
-                'liked_users': url_for('resources.liked_users', id=self.id),
-                'avatar_300x300': mini_pic_url,
-                'avatar_500x500': product_pic_url,
-                'author': url_for('resources.get_user', id=self.user_id)
-            }
-        }
-        return data
+        return Product.to_dict_batch([self])[0]
+
+    @classmethod
+    def to_dict_batch(cls, products: List[Product]) -> List[Dict[str, Any]]:
+        return cls.render_batch(cls.projection_batch(products))
+
+    @classmethod
+    def projection_batch(cls, products: List[Product]) -> List[Dict[str, Any]]:
+        # всё, из чего собирается to_dict, без url_for: то же самое хранится в _source поискового индекса
+        ids = [product.id for product in products]
+        pictures = formats_by_owner(Picture.product_id, ids, ('300x300', '500x500'))
+        return [{
+            'id': product.id,
+            'name': product.name,
+            'price': product.price,
+            'timestamp': product.timestamp,
+            'description': product.description,
+            'is_purchased': product.is_purchased,
+            'liked_count': product.liked_count,
+            'user_id': product.user_id,
+            'avatars': pictures.get(product.id, {})
+        } for product in products]
+
+    @classmethod
+    def from_search_source(cls, source: Dict[str, Any]) -> Dict[str, Any]:
+        return dict(source, price=Decimal(str(source['price'])).quantize(Decimal('0.01')),
+                    timestamp=datetime.fromisoformat(source['timestamp']))
+
+    @classmethod
+    def render_batch(cls, projections: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        default_mini_pic_url = url_for(
+            'static', filename='product_pics/default_pic_product_300x300.png')
+        default_pic_url = url_for(
+            'static', filename='product_pics/default_pic_product_500x500.png')
+        items = []
+        for product in projections:
+            pic_formats = product['avatars']
+            items.append({
+                'id': product['id'],
+                'name': product['name'],
+                'price': product['price'],
+                'timestamp': product['timestamp'],
+                'description': product['description'],
+                'is_purchased': product['is_purchased'],
+                'liked_count': product['liked_count'],
+                '_links': {
+                    'self': url_for('resources.get_product', id=product['id']),
+                    'liked_users': url_for('resources.liked_users', id=product['id']),
+                    'avatar_300x300': pic_formats.get('300x300', default_mini_pic_url),
+                    'avatar_500x500': pic_formats.get('500x500', default_pic_url),
+                    'author': url_for('resources.get_user', id=product['user_id'])
+                }
+            })
+        return items
 
     def from_dict(self, data: dict) -> None:
         for field in ['name', 'description', 'price']:
@@ -0,0 +1,18 @@
+from datetime import datetime
+from app import db
+
+
+class SearchOutbox(db.Model):
+    # изменения индексируемых моделей пишутся сюда в той же транзакции, что и сами данные,
+    # а фоновый индексатор пачками отправляет их в Elasticsearch
+    __tablename__ = 'search_outbox'
+    id = db.Column(db.Integer, primary_key=True)
+    index = db.Column(db.String(64), nullable=False)
+    doc_id = db.Column(db.Integer, nullable=False)
+    operation = db.Column(db.String(10), nullable=False)  # 'index' или 'delete'
+    attempts = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    available_at = db.Column(db.DateTime, index=True, default=datetime.utcnow, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self) -> str:
+        return f'<SearchOutbox {self.operation} {self.index}/{self.doc_id}>'
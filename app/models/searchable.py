@@ -1,61 +1,74 @@
 from __future__ import annotations
+from datetime import datetime
+from typing import Any, Dict, List
 from flask import current_app
 from flask_sqlalchemy.session import Session
+from sqlalchemy import inspect
 from app import db
+from app.models.search_outbox import SearchOutbox
 
 
 class SearchableMixin(object):
+    __search_boosts__: Dict[str, float] = {}  # вес текстовых полей из __searchable__ в ранжировании
+    __search_fields__: Dict[str, Dict[str, Any]] = {}  # нетекстовые поля документа для фильтров, с маппингом ES
+    __search_facets__: Dict[str, Dict[str, Any]] = {}  # агрегации по полям из __search_fields__ в выдаче поиска
+
     @classmethod
-    def before_commit(cls, session: Session) -> None:
-        try:
-            if not current_app.elasticsearch.ping():  # Проверка доступности Elasticsearch
-                print("Cannot connect to Elasticsearch server")
-                return
-        except Exception as e:
-            print(f"An error occurred: {str(e)}")
+    def search_schema(cls) -> Dict[str, Any]:
+        return {'searchable': list(cls.__searchable__), 'boosts': dict(cls.__search_boosts__),
+                'fields': dict(cls.__search_fields__), 'facets': dict(cls.__search_facets__)}
+
+    def searchable_changed(self) -> bool:
+        # счётчики и версия меняются почти в каждом коммите, но в индекс они не входят
+        state = inspect(self)
+        return any(state.attrs[field].history.has_changes()
+                   for field in self.__searchable__ + list(self.__search_fields__))
+
+    @classmethod
+    def search_documents(cls, objs: List[SearchableMixin]) -> List[Dict[str, Any]]:
+        if current_app.config['SEARCH_FROM_SOURCE']:
+            return cls.projection_batch(objs)
+        fields = cls.__searchable__ + list(cls.__search_fields__)
+        return [{field: getattr(obj, field) for field in fields} for obj in objs]
+
+    @classmethod
+    def after_flush(cls, session: Session, flush_context: Any) -> None:
+        # after_flush, а не before_commit: здесь у новых объектов уже есть id, а история атрибутов
+        # ещё не сброшена, и ловятся в том числе автофлаши посреди транзакции.
+        # Строки outbox уходят в ту же транзакцию, поэтому откат данных откатывает и их
+        if current_app.search_backend is None:
             return
-        session._changes = {
-            'add': list(session.new),
-            'update': list(session.dirty),
-            'delete': list(session.deleted)
-        }
+        # в режиме SEARCH_FROM_SOURCE в _source лежит весь to_dict, поэтому переиндексируется любой
+        # изменённый объект: история счётчиков, присвоенных SQL-выражением, к этому моменту уже сброшена
+        now = datetime.utcnow()
+        from_source = current_app.config['SEARCH_FROM_SOURCE']
+        rows = [{'index': obj.__tablename__, 'doc_id': obj.id, 'operation': 'index', 'attempts': 0,
+                 'available_at': now, 'created_at': now}
+                for obj in list(session.new) + list(session.dirty)
+                if isinstance(obj, SearchableMixin) and (
+                    obj in session.new or from_source or obj.searchable_changed())]
+        rows += [{'index': obj.__tablename__, 'doc_id': obj.id, 'operation': 'delete', 'attempts': 0,
+                  'available_at': now, 'created_at': now}
+                 for obj in session.deleted if isinstance(obj, SearchableMixin)]
+        if rows:
+            session.connection().execute(SearchOutbox.__table__.insert(), rows)
+            session.info['search_outbox'] = True
 
     @classmethod
     def after_commit(cls, session: Session) -> None:
-        try:
-            if not current_app.elasticsearch.ping():  # Проверка доступности Elasticsearch
-                print("Cannot connect to Elasticsearch server")
-                return
-        except Exception as e:
-            print(f"An error occurred: {str(e)}")
-            return
-        from app.utils.search import add_to_index, remove_from_index
-        for obj in session._changes['add']:
-            if isinstance(obj, SearchableMixin):
-                try:
-                    add_to_index(obj.__tablename__, obj)
-                except ConnectionError:
-                    print("There was an error adding an object to the Elasticsearch index")
-        for obj in session._changes['update']:
-            if isinstance(obj, SearchableMixin):
-                try:
-                    add_to_index(obj.__tablename__, obj)
-                except ConnectionError:
-                    print("There was an error adding an object to the Elasticsearch index")
-        for obj in session._changes['delete']:
-            if isinstance(obj, SearchableMixin):
-                try:
-                    remove_from_index(obj.__tablename__, obj)
-                except ConnectionError:
-                    print("There was an error removing an object from the Elasticsearch index")
-        session._changes = None
+        if session.info.pop('search_outbox', False):
+            current_app.search_indexer.notify()
+
+    @classmethod
+    def after_rollback(cls, session: Session) -> None:
+        session.info.pop('search_outbox', None)
 
     @classmethod
-    def reindex(cls) -> None:
-        from app.utils.search import add_to_index
-        for obj in cls.query.all():
-            add_to_index(cls.__tablename__, obj)
+    def reindex(cls, **kwargs: Any) -> int:
+        from app.utils.search import reindex_model
+        return reindex_model(cls, **kwargs)
 
 
-db.event.listen(db.session, 'before_commit', SearchableMixin.before_commit)
+db.event.listen(db.session, 'after_flush', SearchableMixin.after_flush)
 db.event.listen(db.session, 'after_commit', SearchableMixin.after_commit)
+db.event.listen(db.session, 'after_rollback', SearchableMixin.after_rollback)
@@ -3,23 +3,26 @@ from datetime import datetime, timedelta
 from time import time
 import jwt
 from flask import url_for, current_app
-from typing import Dict, Any, Union
+from typing import Dict, Any, List, Union
 from flask_jwt_extended import create_access_token
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.orm import load_only
+from app.models.cached import CachedMixin, VersionedMixin
+from app.models.counters import increment
 from app.models.searchable import SearchableMixin
 from app.models.paginated import PaginatedAPIMixin
-from sqlalchemy import func
+from app.passwords import password_hasher
+from app.models.picture import Picture, formats_by_owner
 from app import db
 
 
 followers = db.Table(
     'followers',
-    db.Column('follower_id', db.Integer, db.ForeignKey('user.id')),
-    db.Column('followed_id', db.Integer, db.ForeignKey('user.id'))
+    db.Column('follower_id', db.Integer, db.ForeignKey('user.id', ondelete='CASCADE')),
+    db.Column('followed_id', db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'))
 )
 
 
-class User(SearchableMixin, PaginatedAPIMixin, db.Model):
+class User(SearchableMixin, PaginatedAPIMixin, CachedMixin, VersionedMixin, db.Model):
     __searchable__ = ['username']
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), index=True, unique=True)
@@ -29,6 +32,10 @@ class User(SearchableMixin, PaginatedAPIMixin, db.Model):
     products = db.relationship('Product', backref='author', lazy='dynamic')
     about_me = db.Column(db.String(140), nullable=True)
     last_seen = db.Column(db.DateTime, default=datetime.utcnow, nullable=True)
+    product_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    followers_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    followed_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    product_liked_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
     followed = db.relationship(
         'User', secondary=followers,
         primaryjoin=(followers.c.follower_id == id),
@@ -38,56 +45,89 @@ class User(SearchableMixin, PaginatedAPIMixin, db.Model):
     def __repr__(self) -> str:
         return f"<User {self.email}>"
 
+    def cache_namespaces(self) -> List[str]:
+        return [f'user:{self.id}']
+
     def set_password(self, password: str) -> None | str:
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher().hash(password)
         return self.password_hash
 
     def check_password_hash(self, password: str) -> bool:
         if self.password_hash is None:
             return False
-        return check_password_hash(self.password_hash, password)
+        return password_hasher().verify(self.password_hash, password)
 
     def to_dict(self, include_email: bool = False) -> Dict[str, Any]:
-        from app.models.product import Product, cart
-        picture = self.pictures.first()
-        if picture:
-            mini_pic_format = picture.formats.filter_by(format='50x50').first()
-            avatar_pic_format = picture.formats.filter_by(format='450x450').first()
-            mini_avatar_url = mini_pic_format.filename if mini_pic_format else \
-                url_for('static', filename='profile_pics/default_pic_user_50x50.png')
-            avatar_url = avatar_pic_format.filename if avatar_pic_format else \
-                url_for('static', filename='profile_pics/default_pic_user_450x450.png')
-        else:
-            mini_avatar_url = url_for(
-                'static', filename='profile_pics/default_pic_user_50x50.png')
-            avatar_url = url_for(
-                'static', filename='profile_pics/default_pic_user_450x450.png')
-        data = {
+        return User.to_dict_batch([self], include_email=include_email)[0]
+
+    @classmethod
+    def to_dict_batch(cls, users: List[User], include_email: bool = False) -> List[Dict[str, Any]]:
+        return cls.render_batch(cls.projection_batch(users), include_email=include_email)
+
+    @classmethod
+    def projection_batch(cls, users: List[User]) -> List[Dict[str, Any]]:
+        # всё, из чего собирается to_dict, без url_for: то же самое хранится в _source поискового индекса
+        ids = [user.id for user in users]
+        pictures = formats_by_owner(Picture.user_id, ids, ('50x50', '450x450'))
+        return [{
+            'id': user.id,
+            'username': user.username,
+            'email': user.email,
+            'last_seen': user.last_seen,
+            'about_me': user.about_me,
+            'product_count': user.product_count,
+            'followers_count': user.followers_count,
+            'followed_count': user.followed_count,
+            'product_liked_count': user.product_liked_count,
+            'avatars': pictures.get(user.id, {})
+        } for user in users]
+
+    @classmethod
+    def from_search_source(cls, source: Dict[str, Any]) -> Dict[str, Any]:
+        return dict(source, last_seen=datetime.fromisoformat(source['last_seen']))
+
+    @classmethod
+    def render_batch(cls, projections: List[Dict[str, Any]],
+                     include_email: bool = False) -> List[Dict[str, Any]]:
+        default_mini_avatar_url = url_for(
+            'static', filename='profile_pics/default_pic_user_50x50.png')
+        default_avatar_url = url_for(
+            'static', filename='profile_pics/default_pic_user_450x450.png')
+        items = []
+        for user in projections:
+            pic_formats = user['avatars']
+            data = {
+                'id': user['id'],
+                'username': user['username'],
+                'email': user['email'],
+                'last_seen': user['last_seen'].isoformat() + 'Z',
+                'about_me': user['about_me'],
+                'product_count': user['product_count'],
+                'followers_count': user['followers_count'],
+                'followed_count': user['followed_count'],
+                'product_liked_count': user['product_liked_count'],
+                '_links': {
+                    'self': url_for('resources.get_user', id=user['id']),
+                    'followers': url_for('resources.get_followers', id=user['id']),
+                    'followed': url_for('resources.get_followed', id=user['id']),
+                    'products': url_for('resources.get_users_products', id=user['id']),
+                    'avatar_50x50': pic_formats.get('50x50', default_mini_avatar_url),
+                    'avatar_450x450': pic_formats.get('450x450', default_avatar_url)
+                }
+            }
+            if include_email:
+                data['email'] = user['email']
+            items.append(data)
+        return items
+
+    def to_auth_dict(self) -> Dict[str, Any]:
+        # ответ входа и регистрации: без счётчиков и картинок, полный профиль — по ?expand=profile
+        return {
             'id': self.id,
             'username': self.username,
             'email': self.email,
-            'last_seen': self.last_seen.isoformat() + 'Z',
-            'about_me': self.about_me,
-            'product_count': db.session.query(
-                func.count(Product.id)).filter(Product.user_id == self.id).scalar(),
-            'followers_count': db.session.query(func.count(
-                followers.c.follower_id)).filter(followers.c.followed_id == self.id).scalar(),
-            'followed_count': db.session.query(func.count(
-                followers.c.followed_id)).filter(followers.c.follower_id == self.id).scalar(),
-            'product_liked_count': db.session.query(func.count(
-                cart.c.product_id)).filter(cart.c.user_cart_id == self.id).scalar(),
-            '_links': {
-                'self': url_for('resources.get_user', id=self.id),
-                'followers': url_for('resources.get_followers', id=self.id),
-                'followed': url_for('resources.get_followed', id=self.id),
-                'products': url_for('resources.get_users_products', id=self.id),
-                'avatar_50x50': mini_avatar_url,
-                'avatar_450x450': avatar_url
-            }
+            '_links': {'self': url_for('resources.get_user', id=self.id)}
         }
-        if include_email:
-            data['email'] = self.email
-        return data
 
     def from_dict(self, data: dict, new_user: bool = False) -> None:
         for field in ['username', 'email', 'about_me']:
@@ -103,17 +143,27 @@ class User(SearchableMixin, PaginatedAPIMixin, db.Model):
 
     @classmethod
     def authenticate(cls, email: str, password: str) -> User:
-        user = cls.query.filter_by(email=email).first()
-        if user and check_password_hash(user.password_hash, password):
+        # только то, что нужно для проверки пароля, токена и to_auth_dict
+        user = cls.query.options(load_only(cls.id, cls.username, cls.email, cls.password_hash)).filter_by(
+            email=email).first()
+        if user and user.check_password_hash(password):
+            # пароль известен только сейчас: хеш со старыми параметрами пересчитывается при входе
+            if password_hasher().needs_rehash(user.password_hash):
+                user.set_password(password)
+                db.session.commit()
             return user
 
     def follow(self, user: User) -> None:
         if not self.is_following(user):
             self.followed.append(user)
+            increment(self, 'followed_count')
+            increment(user, 'followers_count')
 
     def unfollow(self, user: User) -> None:
         if self.is_following(user):
             self.followed.remove(user)
+            increment(self, 'followed_count', -1)
+            increment(user, 'followers_count', -1)
 
     def is_following(self, user: User) -> bool:
         return self.followed.filter(
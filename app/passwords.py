@@ -0,0 +1,75 @@
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from threading import BoundedSemaphore, Lock
+from typing import Any, Callable, Optional
+from flask import Flask, current_app, has_app_context
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HashingOverloaded(Exception):
+    pass
+
+
+class PasswordHasher(object):
+    def __init__(self, app: Optional[Flask] = None) -> None:
+        self.method = 'pbkdf2:sha256:600000'
+        self.prefix = self.method
+        self.workers = 0
+        self.timeout: Optional[float] = None
+        self.slots: Optional[BoundedSemaphore] = None
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self._lock = Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        # PASSWORD_HASH_WORKERS = 0 — хеширование прямо в запросе (тесты, отладка);
+        # сверх воркеров в очереди ждут не больше PASSWORD_HASH_QUEUE хешей, остальные сразу получают 429
+        self.method = app.config['PASSWORD_HASH_METHOD']
+        # werkzeug дописывает умолчания ('pbkdf2' -> pbkdf2:sha256:600000), поэтому префикс берём из живого хеша
+        self.prefix = generate_password_hash('', self.method).split('$', 1)[0]
+        self.workers = app.config['PASSWORD_HASH_WORKERS']
+        self.timeout = app.config['PASSWORD_HASH_TIMEOUT']
+        self.slots = BoundedSemaphore(self.workers + app.config['PASSWORD_HASH_QUEUE'])
+
+    def _pool(self) -> ProcessPoolExecutor:
+        # пул поднимается при первом хеше, то есть уже в форкнутом воркере gunicorn
+        with self._lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self.executor
+
+    def _call(self, func: Callable[..., Any], *args: Any) -> Any:
+        if self.workers == 0:
+            return func(*args)
+        if not self.slots.acquire(blocking=False):
+            raise HashingOverloaded('too many password hashes in flight')
+        try:
+            future = self._pool().submit(func, *args)
+        except Exception:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            # поток запроса отпускаем; слот освободится, когда процесс всё же досчитает хеш
+            future.cancel()
+            raise HashingOverloaded('password hash timed out')
+
+    def hash(self, password: str) -> str:
+        return self._call(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash: str, password: str) -> bool:
+        return self._call(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash: str) -> bool:
+        # параметры лежат в самом хеше до первого '$': pbkdf2:sha256:600000$соль$хеш
+        return pwhash.split('$', 1)[0] != self.prefix
+
+
+inline_hasher = PasswordHasher()
+
+
+def password_hasher() -> PasswordHasher:
+    # вне контекста приложения (скрипты, тесты моделей) хешируем прямо в потоке
+    return current_app.password_hasher if has_app_context() else inline_hasher
@@ -0,0 +1,466 @@
+import json
+import re
+import sqlite3
+from datetime import date, datetime
+from decimal import Decimal
+from threading import Lock
+from time import monotonic
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from elasticsearch import Elasticsearch, ApiError, TransportError, helpers
+from flask import Flask
+
+Action = Dict[str, Any]  # {'_op_type': 'index' | 'delete', '_index': ..., '_id': ..., '_source': {...}}
+Hit = Dict[str, Any]  # {'_index': ..., '_id': ..., '_source': {...}}
+Schema = Dict[str, Dict[str, Any]]  # {index: SearchableMixin.search_schema()}
+Filters = Dict[str, Any]  # {'price': {'gte': 10, 'lte': 20}, 'is_purchased': False}: диапазон или точное значение
+Aggregations = Dict[str, List[Dict[str, Any]]]  # {'type': [{'key': 'product', 'count': 3}], 'price': [...]}
+FACET_SIZE = 10  # бакетов terms-фасета, если в схеме не задан size; одинаково для всех движков
+
+
+def facet_key(schema: Dict[str, Any], field: str, key: Any) -> Any:
+    # ES отдаёт булевы ключи числами, SQLite хранит их так же — приводим к типу из маппинга
+    field_type = schema['fields'][field]['type']
+    if field_type == 'boolean':
+        return bool(key)
+    if schema['facets'][field]['type'] == 'histogram':
+        return float(key)
+    return key
+
+
+TEXT_ANALYSIS = {
+    'analyzer': {
+        'luda_text': {'type': 'custom', 'tokenizer': 'standard', 'filter': ['lowercase', 'asciifolding']}
+    },
+    'normalizer': {
+        'luda_keyword': {'type': 'custom', 'filter': ['lowercase', 'asciifolding']}
+    }
+}
+
+
+class SearchError(Exception):
+    pass
+
+
+def alias_of(index_name: str) -> str:
+    # после reindex документы живут в индексах вида product_20261018120000 за алиасом product
+    return index_name.rsplit('_', 1)[0] if re.fullmatch(r'.+_\d{14}', index_name) else index_name
+
+
+class ElasticsearchHealth(object):
+    # кэшированный статус кластера + circuit breaker: ping не чаще refresh_interval,
+    # после failure_threshold ошибок подряд запросы в ES не идут reset_timeout секунд
+    def __init__(self, client: Optional[Elasticsearch], refresh_interval: float = 30,
+                 failure_threshold: int = 3, reset_timeout: float = 60) -> None:
+        self.client = client
+        self.refresh_interval = refresh_interval
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._healthy = False
+        self._checked_at: Optional[float] = None
+        self._failures = 0
+        self._open_until = 0.0
+        self._lock = Lock()
+
+    def available(self) -> bool:
+        if self.client is None:
+            return False
+        now = monotonic()
+        with self._lock:
+            if self._open_until > now:
+                return False
+            if self._checked_at is not None and now - self._checked_at < self.refresh_interval:
+                return self._healthy
+            self._checked_at = now
+        try:
+            healthy = bool(self.client.ping())
+        except Exception:
+            healthy = False
+        if healthy:
+            self.record_success()
+        else:
+            self.record_failure()
+        return healthy
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._healthy = True
+            self._failures = 0
+            self._open_until = 0.0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._healthy = False
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._open_until = monotonic() + self.reset_timeout
+                self._failures = 0
+
+
+class ElasticsearchBackend(object):
+    def __init__(self, client: Elasticsearch, health: ElasticsearchHealth, schema: Optional[Schema] = None) -> None:
+        self.client = client
+        self.health = health
+        self.schema = schema or {}
+
+    def mappings(self, alias: str) -> Dict[str, Any]:
+        # явный маппинг вместо динамического: текстовые поля с анализатором, keyword-подполем для точных
+        # совпадений и search_as_you_type для подсказок; остальное в _source не индексируется (dynamic: false)
+        schema = self.schema[alias]
+        properties = {field: {'type': 'text', 'analyzer': 'luda_text', 'fields': {
+            'keyword': {'type': 'keyword', 'normalizer': 'luda_keyword', 'ignore_above': 256},
+            'suggest': {'type': 'search_as_you_type', 'analyzer': 'luda_text'}}}
+            for field in schema['searchable']}
+        properties.update(schema['fields'])
+        return {'dynamic': False, 'properties': properties}
+
+    def put_template(self, alias: str) -> None:
+        # шаблон применяется к каждому индексу {alias}_{время}, который создаёт reindex
+        self.client.indices.put_index_template(
+            name=f'luda_{alias}', index_patterns=[f'{alias}_*'],
+            template={'settings': {'analysis': TEXT_ANALYSIS}, 'mappings': self.mappings(alias)})
+
+    def init(self) -> Dict[str, str]:
+        # шаблоны + пустые индексы за алиасами; индекс, созданный ещё динамическим маппингом, остаётся
+        # как есть до flask search reindex
+        status = {}
+        for alias in self.schema:
+            self.put_template(alias)
+            if self.client.indices.exists_alias(name=alias):
+                status[alias] = 'exists'
+            elif self.client.indices.exists(index=alias):
+                status[alias] = 'legacy index, run flask search reindex'
+            else:
+                self.client.indices.create(index=f"{alias}_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}",
+                                           aliases={alias: {}})
+                status[alias] = 'created'
+        return status
+
+    def query_fields(self, indices: List[str], fields: List[str]) -> List[str]:
+        boosts = {}
+        for index in indices:
+            boosts.update(self.schema.get(index, {}).get('boosts', {}))
+        return [f'{field}^{boosts[field]}' if field in boosts else field for field in fields]
+
+    def available(self) -> bool:
+        return self.health.available()
+
+    def bulk(self, actions: Iterable[Action]) -> Set[Tuple[str, int]]:
+        # возвращает документы, которые ES отверг; недоступность кластера — SearchError
+        try:
+            _, errors = helpers.bulk(self.client, actions, raise_on_error=False, ignore_status=(404,),
+                                     max_retries=3, initial_backoff=1, max_backoff=10)
+        except (ApiError, TransportError) as e:
+            self.health.record_failure()
+            raise SearchError(str(e)) from e
+        self.health.record_success()
+        failed = set()
+        for error in errors:
+            item = next(iter(error.values()))
+            failed.add((alias_of(item['_index']), int(item['_id'])))
+        return failed
+
+    def search(self, indices: List[str], query: str, fields: List[str], page: int, per_page: int,
+               source: bool = False, filters: Optional[Filters] = None) -> Tuple[List[Hit], int, Aggregations]:
+        # точное совпадение всей строки по keyword-подполю поднимает результат наверх;
+        # фильтры идут в filter-контекст: не влияют на score и кэшируются на шардах
+        filter_clauses = [{'range': {field: value}} if isinstance(value, dict) else {'term': {field: value}}
+                          for field, value in (filters or {}).items()]
+        search = self.client.search(
+            index=",".join(indices),
+            body={'query': {'bool': {
+                'must': [{'multi_match': {'query': query, 'fields': self.query_fields(indices, fields)}}],
+                'should': [{'term': {f'{field}.keyword': {'value': query, 'boost': 2.0}}} for field in fields],
+                'filter': filter_clauses}},
+                'aggs': self.aggregations_body(indices),
+                'from': (page - 1) * per_page, 'size': per_page, '_source': source})
+        return (search['hits']['hits'], search['hits']['total']['value'],
+                self.parse_aggregations(indices, search.get('aggregations', {})))
+
+    def aggregations_body(self, indices: List[str]) -> Dict[str, Any]:
+        aggs: Dict[str, Any] = {'type': {'terms': {'field': '_index'}}}
+        for index in indices:
+            for field, facet in self.schema.get(index, {}).get('facets', {}).items():
+                if facet['type'] == 'histogram':
+                    aggs[field] = {'histogram': {'field': field, 'interval': facet['interval'], 'min_doc_count': 1}}
+                else:
+                    aggs[field] = {'terms': {'field': field, 'size': facet.get('size', FACET_SIZE)}}
+        return aggs
+
+    def parse_aggregations(self, indices: List[str], aggs: Dict[str, Any]) -> Aggregations:
+        types: Dict[str, int] = {}
+        for bucket in aggs.get('type', {}).get('buckets', []):
+            alias = alias_of(bucket['key'])
+            types[alias] = types.get(alias, 0) + bucket['doc_count']
+        result = {'type': [{'key': key, 'count': count} for key, count in
+                           sorted(types.items(), key=lambda item: -item[1])]}
+        for index in indices:
+            schema = self.schema.get(index, {})
+            for field in schema.get('facets', {}):
+                result[field] = [{'key': facet_key(schema, field, bucket['key']), 'count': bucket['doc_count']}
+                                 for bucket in aggs.get(field, {}).get('buckets', [])]
+        return result
+
+    def suggest(self, indices: List[str], prefix: str, size: int) -> List[Hit]:
+        # bool_prefix по n-граммным подполям: последнее слово — префикс, остальные — целые слова
+        display = {index: self.schema[index]['searchable'][0] for index in indices if index in self.schema}
+        fields = [f'{field}.suggest{suffix}' for field in display.values() for suffix in ('', '._2gram', '._3gram')]
+        search = self.client.search(
+            index=",".join(indices),
+            body={'query': {'multi_match': {'query': prefix, 'type': 'bool_prefix', 'fields': fields}},
+                  'size': size, '_source': list(display.values())})
+        return [{'_index': alias_of(hit['_index']), '_id': hit['_id'],
+                 'text': hit['_source'].get(display[alias_of(hit['_index'])])}
+                for hit in search['hits']['hits']]
+
+    def rebuild(self, alias: str, chunks: Iterable[List[Tuple[int, Dict[str, Any]]]], chunk_size: int = 500,
+                threads: int = 1, swap: bool = True) -> Iterator[int]:
+        # swap=True: документы заливаются в новый индекс {alias}_{время}, затем алиас атомарно
+        # переключается на него, а старый индекс удаляется — поиск не простаивает ни секунды
+        target = f"{alias}_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}" if swap else alias
+        try:
+            if swap:
+                # маппинг приходит из шаблона; на время заливки реплики и refresh отключены
+                self.put_template(alias)
+                self.client.indices.create(index=target,
+                                           settings={'number_of_replicas': 0, 'refresh_interval': '-1'})
+            for chunk in chunks:
+                actions = [{'_op_type': 'index', '_index': target, '_id': doc_id, '_source': document}
+                           for doc_id, document in chunk]
+                if threads > 1:
+                    results = helpers.parallel_bulk(self.client, actions, thread_count=threads,
+                                                    chunk_size=chunk_size)
+                else:
+                    results = helpers.streaming_bulk(self.client, actions, chunk_size=chunk_size,
+                                                     max_retries=3, initial_backoff=1)
+                yield sum(ok for ok, _ in results)
+            if swap:
+                self.client.indices.put_settings(index=target, settings={
+                    'index': {'number_of_replicas': None, 'refresh_interval': None}})
+                self.client.indices.refresh(index=target)
+                self.swap_alias(alias, target)
+        except Exception:
+            if swap:
+                self.client.indices.delete(index=target, ignore_unavailable=True)
+            raise
+
+    def swap_alias(self, alias: str, target: str) -> None:
+        actions: List[Dict[str, Any]] = [{'add': {'index': target, 'alias': alias}}]
+        old_indices = []
+        if self.client.indices.exists_alias(name=alias):
+            old_indices = list(self.client.indices.get_alias(name=alias).keys())
+            actions = [{'remove': {'index': index, 'alias': alias}} for index in old_indices] + actions
+        elif self.client.indices.exists(index=alias):
+            # до первого reindex индекс создавался неявно под именем алиаса: remove_index
+            # удаляет его в том же атомарном запросе, в котором появляется алиас
+            actions.insert(0, {'remove_index': {'index': alias}})
+        self.client.indices.update_aliases(actions=actions)
+        for index in old_indices:
+            self.client.indices.delete(index=index, ignore_unavailable=True)
+
+
+def json_default(value: Any) -> Any:
+    # как сериализатор клиента ES: даты в ISO 8601, Decimal и прочее строкой
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+SQL_OPERATORS = {'eq': '=', 'gte': '>=', 'gt': '>', 'lte': '<=', 'lt': '<'}
+
+
+def column_value(value: Any) -> Any:
+    # значения фильтруемых колонок FTS5: даты ISO-строкой сравниваются лексикографически, цены — числом
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+class SqliteSearchBackend(object):
+    # встроенный движок на SQLite FTS5 для окружений без Elasticsearch (staging, тесты).
+    # Отдельная база со своим соединением: индекс не участвует в транзакциях основной БД
+    def __init__(self, path: str, schema: Schema) -> None:
+        self.schema = schema
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = Lock()
+        self.init()
+
+    def _fields(self, index: str) -> List[str]:
+        # сначала текстовые колонки (их веса передаются в bm25 по порядку), потом фильтруемые
+        return self.schema[index]['searchable'] + list(self.schema[index]['fields'])
+
+    def _columns(self, index: str) -> str:
+        return ', '.join(f'"{field}"' for field in self._fields(index))
+
+    def _create_table(self, table: str, index: str) -> None:
+        columns = ', '.join([f'"{field}"' for field in self.schema[index]['searchable']] +
+                            [f'"{field}" UNINDEXED' for field in self.schema[index]['fields']])
+        self._connection.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS "{table}" USING fts5({columns}, '
+            "source UNINDEXED, tokenize = 'unicode61 remove_diacritics 2')")
+
+    def init(self) -> Dict[str, str]:
+        # таблица со старым набором колонок пересоздаётся пустой, её заполнит flask search reindex
+        status = {}
+        with self._lock:
+            for index in self.schema:
+                columns = [row[1] for row in self._connection.execute(f'PRAGMA table_info("{index}")')]
+                if columns == self._fields(index) + ['source']:
+                    status[index] = 'exists'
+                    continue
+                self._connection.execute(f'DROP TABLE IF EXISTS "{index}"')
+                self._create_table(index, index)
+                status[index] = 'created'
+        return status
+
+    def _write(self, table: str, index: str, doc_id: int, document: Optional[Dict[str, Any]]) -> None:
+        # rowid таблицы FTS5 — id документа, повторная индексация заменяет строку
+        self._connection.execute(f'DELETE FROM "{table}" WHERE rowid = ?', (doc_id,))
+        if document is not None:
+            fields = self._fields(index)
+            placeholders = ', '.join('?' for _ in fields)
+            self._connection.execute(
+                f'INSERT INTO "{table}" (rowid, {self._columns(index)}, source) VALUES (?, {placeholders}, ?)',
+                [doc_id] + [column_value(document.get(field)) for field in fields] +
+                [json.dumps(document, default=json_default)])
+
+    def _rank(self, index: str) -> str:
+        # bm25 с весами __search_boosts__ по текстовым колонкам; меньше — лучше
+        boosts = self.schema[index]['boosts']
+        weights = ''.join(f', {float(boosts.get(field, 1.0))}' for field in self.schema[index]['searchable'])
+        return f'bm25("{index}"{weights})'
+
+    def _transaction(self, statements: Iterable[Any]) -> None:
+        # statements — ленивый генератор записей, исполняется внутри BEGIN ... COMMIT под блокировкой
+        with self._lock:
+            self._connection.execute('BEGIN')
+            try:
+                for _ in statements:
+                    pass
+            except Exception:
+                self._connection.execute('ROLLBACK')
+                raise
+            self._connection.execute('COMMIT')
+
+    def available(self) -> bool:
+        return True
+
+    def bulk(self, actions: Iterable[Action]) -> Set[Tuple[str, int]]:
+        # действия собираются заранее: их генератор сам ходит в основную БД
+        writes = [(alias_of(action['_index']), int(action['_id']),
+                   action['_source'] if action['_op_type'] == 'index' else None) for action in actions]
+        try:
+            self._transaction(self._write(index, index, doc_id, document) for index, doc_id, document in writes)
+        except sqlite3.Error as e:
+            raise SearchError(str(e)) from e
+        return set()
+
+    @staticmethod
+    def match_expression(query: str) -> Optional[str]:
+        # пользовательский ввод не должен разбираться как синтаксис FTS5: каждое слово в кавычках,
+        # слова через OR, как у multi_match по умолчанию
+        terms = re.findall(r'\w+', query)
+        return ' OR '.join(f'"{term}"' for term in terms) if terms else None
+
+    @staticmethod
+    def filter_clause(filters: Filters, params: Dict[str, Any]) -> str:
+        conditions = []
+        for field, value in filters.items():
+            bounds = value.items() if isinstance(value, dict) else [('eq', value)]
+            for operator, bound in bounds:
+                params[f'{field}_{operator}'] = column_value(bound)
+                conditions.append(f'"{field}" {SQL_OPERATORS[operator]} :{field}_{operator}')
+        return ''.join(f' AND {condition}' for condition in conditions)
+
+    def search(self, indices: List[str], query: str, fields: List[str], page: int, per_page: int,
+               source: bool = False, filters: Optional[Filters] = None) -> Tuple[List[Hit], int, Aggregations]:
+        expression = self.match_expression(query)
+        indices = [index for index in indices if index in self.schema]
+        if expression is None or not indices:
+            return [], 0, {'type': []}
+        # поиск только по запрошенным колонкам каждой таблицы: {username} : ("foo" OR "bar")
+        params: Dict[str, Any] = {'limit': per_page, 'offset': (page - 1) * per_page}
+        for index in indices:
+            columns = ' '.join(field for field in fields if field in self.schema[index]['searchable'])
+            params[f'match_{index}'] = f'{{{columns}}} : ({expression})' if columns else expression
+        conditions = self.filter_clause(filters or {}, params)
+        where = {index: f'WHERE "{index}" MATCH :match_{index}{conditions}' for index in indices}
+        selects = ' UNION ALL '.join(
+            f'SELECT \'{index}\' AS idx, rowid, {self._rank(index)} AS score, source FROM "{index}" {where[index]}'
+            for index in indices)
+        with self._lock:
+            rows = self._connection.execute(
+                f'{selects} ORDER BY score, idx, rowid LIMIT :limit OFFSET :offset', params).fetchall()
+            counts = {index: self._connection.execute(
+                f'SELECT count(*) FROM "{index}" {where[index]}', params).fetchone()[0] for index in indices}
+            aggregations = {'type': [{'key': index, 'count': count} for index, count in
+                                     sorted(counts.items(), key=lambda item: -item[1]) if count]}
+            for index in indices:
+                aggregations.update(self._facets(index, where[index], params))
+        hits = []
+        for index, doc_id, _, document in rows:
+            hit = {'_index': index, '_id': str(doc_id)}
+            if source:
+                hit['_source'] = json.loads(document)
+            hits.append(hit)
+        return hits, sum(counts.values()), aggregations
+
+    def _facets(self, index: str, where: str, params: Dict[str, Any]) -> Aggregations:
+        schema = self.schema[index]
+        result = {}
+        for field, facet in schema.get('facets', {}).items():
+            # как и в ES: histogram отдаёт все непустые бакеты, terms — первые size по числу документов
+            if facet['type'] == 'histogram':
+                key = f'CAST("{field}" / {facet["interval"]} AS INTEGER) * {facet["interval"]}'
+                order = 'key'
+            else:
+                key = f'"{field}"'
+                order = f'count DESC, key LIMIT {int(facet.get("size", FACET_SIZE))}'
+            rows = self._connection.execute(
+                f'SELECT {key} AS key, count(*) AS count FROM "{index}" {where} AND "{field}" IS NOT NULL '
+                f'GROUP BY key ORDER BY {order}', params).fetchall()
+            result[field] = [{'key': facet_key(schema, field, key), 'count': count} for key, count in rows]
+        return result
+
+    def suggest(self, indices: List[str], prefix: str, size: int) -> List[Hit]:
+        # все слова обязательны, последнее — префиксный запрос FTS5 ("red" "fo"*) по отображаемому полю
+        terms = re.findall(r'\w+', prefix)
+        indices = [index for index in indices if index in self.schema]
+        if not terms or not indices:
+            return []
+        expression = ' '.join(f'"{term}"' for term in terms) + '*'
+        display = {index: self.schema[index]['searchable'][0] for index in indices}
+        params: Dict[str, Any] = {f'match_{index}': f'{{{display[index]}}} : ({expression})' for index in indices}
+        params['limit'] = size
+        selects = ' UNION ALL '.join(
+            f'SELECT \'{index}\' AS idx, rowid, {self._rank(index)} AS score, "{display[index]}" AS text '
+            f'FROM "{index}" WHERE "{index}" MATCH :match_{index}' for index in indices)
+        with self._lock:
+            rows = self._connection.execute(f'{selects} ORDER BY score, idx, rowid LIMIT :limit', params).fetchall()
+        return [{'_index': index, '_id': str(doc_id), 'text': text} for index, doc_id, _, text in rows]
+
+    def rebuild(self, alias: str, chunks: Iterable[List[Tuple[int, Dict[str, Any]]]], chunk_size: int = 500,
+                threads: int = 1, swap: bool = True) -> Iterator[int]:
+        # swap=True: заливка во временную таблицу и подмена переименованием в одной транзакции
+        target = f'{alias}__rebuild' if swap else alias
+        if swap:
+            with self._lock:
+                self._connection.execute(f'DROP TABLE IF EXISTS "{target}"')
+                self._create_table(target, alias)
+        for chunk in chunks:
+            self._transaction(self._write(target, alias, doc_id, document) for doc_id, document in chunk)
+            yield len(chunk)
+        if swap:
+            self._transaction(self._connection.execute(statement) for statement in (
+                f'DROP TABLE IF EXISTS "{alias}"', f'ALTER TABLE "{target}" RENAME TO "{alias}"'))
+
+
+def make_search_backend(app: Flask, schema: Schema) -> Any:
+    # SEARCH_BACKEND не задан — Elasticsearch, если указан ELASTICSEARCH_URL, иначе встроенный SQLite FTS5
+    backend = app.config['SEARCH_BACKEND'] or ('elasticsearch' if app.elasticsearch is not None else 'sqlite')
+    if backend == 'elasticsearch':
+        return ElasticsearchBackend(app.elasticsearch, app.elasticsearch_health, schema)
+    if backend == 'sqlite':
+        return SqliteSearchBackend(app.config['SEARCH_SQLITE_PATH'], schema)
+    return None
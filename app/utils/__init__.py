@@ -2,4 +2,4 @@ from flask import Blueprint
 
 bp = Blueprint('utils', __name__)
 
-from app.utils import search, image_helper
+from app.utils import search, image_helper, identity
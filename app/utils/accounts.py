@@ -0,0 +1,77 @@
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import CompoundSelect, Select, delete, func, insert, literal, or_, select, update
+from app import db
+from app.cache import invalidate
+from app.models.image_job import ImageJob
+from app.models.picture import Picture, PictureFormat
+from app.models.product import Product, cart
+from app.models.search_outbox import SearchOutbox
+from app.models.user import User, followers
+from app.utils.identity import identity_cache, identity_key
+from app.utils.image_helper import picture_path
+
+
+def outbox_rows(index: str, ids: Select | CompoundSelect, operation: str, now: datetime) -> Select:
+    ids = ids.subquery()
+    return select(literal(index), ids.c[0], literal(operation), literal(0), literal(now), literal(now))
+
+
+def delete_user_account(user_id: int) -> None:
+    # число запросов не зависит от числа товаров: счётчики уцелевших строк правятся одним UPDATE
+    # на счётчик, дочерние строки удаляются set-based DELETE от листьев к корню. В Postgres то же самое
+    # сделали бы ON DELETE CASCADE, но SQLite без PRAGMA foreign_keys их не исполняет
+    products = select(Product.id).where(Product.user_id == user_id)
+    owned_pictures = or_(Picture.user_id == user_id, Picture.product_id.in_(products))
+    files = [picture_path('profile' if owner_id is not None else 'product', filename)
+             for filename, owner_id in db.session.execute(
+                 select(PictureFormat.filename, Picture.user_id).join(
+                     Picture, PictureFormat.picture_id == Picture.id).where(owned_pictures))]
+    owned_jobs = or_(ImageJob.owner_id == user_id, ImageJob.product_id.in_(products))
+    files += db.session.scalars(select(ImageJob.source_path).where(owned_jobs, ImageJob.status != 'done')).all()
+
+    followed_by = select(followers.c.follower_id).where(followers.c.followed_id == user_id)
+    following = select(followers.c.followed_id).where(followers.c.follower_id == user_id)
+    in_cart = select(cart.c.product_id).where(cart.c.user_cart_id == user_id)
+    liked_by = select(cart.c.user_cart_id).where(cart.c.product_id.in_(products), cart.c.user_cart_id != user_id)
+    liked_count = select(func.count()).select_from(cart).where(
+        cart.c.user_cart_id == User.id, cart.c.product_id.in_(products)).scalar_subquery()
+    statements = [
+        update(User).where(User.id.in_(followed_by)).values(
+            followed_count=User.followed_count - 1, version=User.version + 1),
+        update(User).where(User.id.in_(following)).values(
+            followers_count=User.followers_count - 1, version=User.version + 1),
+        update(Product).where(Product.id.in_(in_cart), Product.user_id != user_id).values(
+            liked_count=Product.liked_count - 1, version=Product.version + 1),
+        update(User).where(User.id.in_(liked_by)).values(
+            product_liked_count=User.product_liked_count - liked_count, version=User.version + 1),
+    ]
+    if current_app.search_backend is not None:
+        now = datetime.utcnow()
+        columns = ['index', 'doc_id', 'operation', 'attempts', 'available_at', 'created_at']
+        changes = [('product', products, 'delete'), ('user', select(literal(user_id)), 'delete')]
+        if current_app.config['SEARCH_FROM_SOURCE']:
+            # в _source лежат счётчики, поэтому уцелевшие строки тоже переиндексируются
+            changes += [('user', followed_by.union(following, liked_by), 'index'),
+                        ('product', in_cart.where(cart.c.product_id.not_in(products)), 'index')]
+        statements += [insert(SearchOutbox).from_select(columns, outbox_rows(index, ids, operation, now))
+                       for index, ids, operation in changes]
+    statements += [
+        delete(PictureFormat).where(PictureFormat.picture_id.in_(select(Picture.id).where(owned_pictures))),
+        delete(Picture).where(owned_pictures),
+        delete(cart).where(or_(cart.c.user_cart_id == user_id, cart.c.product_id.in_(products))),
+        delete(followers).where(or_(followers.c.follower_id == user_id, followers.c.followed_id == user_id)),
+        delete(ImageJob).where(owned_jobs),
+        delete(Product).where(Product.user_id == user_id),
+        delete(User).where(User.id == user_id),
+    ]
+    for statement in statements:
+        db.session.execute(statement, execution_options={'synchronize_session': False})
+    db.session.commit()
+
+    # session-хуки видят только ORM-удаления, поэтому кэши и индексатор дёргаются вручную
+    identity_cache.delete(identity_key(user_id))
+    invalidate('products', f'user:{user_id}')
+    if current_app.search_backend is not None:
+        current_app.search_indexer.notify()
+    current_app.image_jobs.sweep(files)
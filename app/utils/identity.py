@@ -0,0 +1,74 @@
+from typing import Any, Dict, NamedTuple, Optional
+from flask import Response, current_app
+from flask_jwt_extended import current_user
+from flask_sqlalchemy.session import Session
+from sqlalchemy import inspect
+from app import db, jwt
+from app.cache import TTLCache
+from app.main.errors import error_response
+from app.models.user import User
+
+IDENTITY_FIELDS = ('username', 'email', 'password_hash')
+
+
+class CurrentUser(NamedTuple):
+    id: int
+    username: str
+    email: str
+
+
+# локальный для процесса: инвалидация после коммита чистит только свой процесс,
+# остальные воркеры увидят изменения не позже чем через IDENTITY_CACHE_TTL
+identity_cache = TTLCache(max_entries=4096)
+
+
+def identity_key(user_id: int) -> str:
+    return f'identity:{user_id}'
+
+
+@jwt.user_lookup_loader
+def load_current_user(jwt_header: Dict[str, Any], jwt_data: Dict[str, Any]) -> Optional[CurrentUser]:
+    # flask_jwt_extended зовёт загрузчик один раз на запрос и держит результат в g,
+    # а между запросами запись живёт в identity_cache
+    user_id = jwt_data[current_app.config['JWT_IDENTITY_CLAIM']]
+    record = identity_cache.get(identity_key(user_id))
+    if record is None:
+        row = db.session.query(User.id, User.username, User.email).filter(User.id == user_id).first()
+        if row is None:
+            return None
+        record = CurrentUser(*row)
+        identity_cache.set(identity_key(user_id), record, ttl=current_app.config['IDENTITY_CACHE_TTL'])
+    return record
+
+
+@jwt.user_lookup_error_loader
+def current_user_missing(jwt_header: Dict[str, Any], jwt_data: Dict[str, Any]) -> Response:
+    return error_response(401, 'user no longer exists')
+
+
+def current_user_model() -> User:
+    # ORM-объект нужен только там, где пишут через связи или счётчики пользователя
+    return db.get_or_404(User, current_user.id)
+
+
+def after_flush(session: Session, flush_context: Any) -> None:
+    user_ids = session.info.setdefault('identity_ids', set())
+    for obj in session.dirty:
+        if isinstance(obj, User) and any(
+                inspect(obj).attrs[field].history.has_changes() for field in IDENTITY_FIELDS):
+            user_ids.add(obj.id)
+    user_ids.update(obj.id for obj in session.deleted if isinstance(obj, User))
+
+
+def after_commit(session: Session) -> None:
+    for user_id in session.info.pop('identity_ids', ()):
+        identity_cache.delete(identity_key(user_id))
+
+
+def after_rollback(session: Session) -> None:
+    session.info.pop('identity_ids', None)
+
+
+db.event.listen(db.session, 'after_flush', after_flush)
+db.event.listen(db.session, 'after_commit', after_commit)
+db.event.listen(db.session, 'after_rollback', after_rollback)
@@ -0,0 +1,80 @@
+import os
+from datetime import timedelta
+from threading import Event, Lock, Thread
+from typing import Iterator, List, Optional
+from flask import Flask, current_app
+from app import db
+from app.utils.image_helper import remove_files, unreferenced_files
+
+PICTURE_FOLDERS = ('profile_pics', 'product_pics')
+
+
+class ImageGarbageCollector(object):
+    # фоновый поток, раз в IMAGE_GC_INTERVAL секунд удаляющий файлы картинок без строки в picture_format
+    def __init__(self, app: Optional[Flask] = None) -> None:
+        self.app = None
+        self.thread = None
+        self._stop = Event()
+        self._lock = Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        # IMAGE_GC_INTERVAL = 0 — только командой flask images gc; поток стартует на первом запросе,
+        # то есть уже в воркере, а не в мастере gunicorn до форка
+        self.app = app
+        if app.config['IMAGE_GC_INTERVAL'] > 0:
+            app.before_request(self.start)
+
+    def start(self) -> None:
+        if self.thread is not None:
+            return
+        with self._lock:
+            if self.thread is None:
+                self.thread = Thread(target=self._run, name='image-gc', daemon=True)
+                self.thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.app.config['IMAGE_GC_INTERVAL']):
+            with self.app.app_context():
+                try:
+                    collect_orphans()
+                except Exception:
+                    self.app.logger.exception('Image garbage collector crashed')
+                finally:
+                    db.session.remove()
+
+
+def scan_batches(folder: str, batch_size: int) -> Iterator[List[os.DirEntry]]:
+    batch = []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            # default_* — заглушки из репозитория, на них нет строк в picture_format
+            if entry.is_file() and not entry.name.startswith('default_'):
+                batch.append(entry)
+                if len(batch) == batch_size:
+                    yield batch
+                    batch = []
+    if batch:
+        yield batch
+
+
+def collect_orphans(batch_size: Optional[int] = None, grace: Optional[timedelta] = None,
+                    dry_run: bool = False) -> int:
+    # каталог читается os.scandir пачками, и каждая пачка сверяется с picture_format одним IN-запросом
+    # по индексу filename: в памяти только пачка, а не весь листинг или вся таблица.
+    # Свежие файлы unreferenced_files не отдаёт: загрузка пишет файл раньше, чем коммитит его строку
+    batch_size = batch_size or current_app.config['IMAGE_GC_BATCH_SIZE']
+    orphans = 0
+    for folder in PICTURE_FOLDERS:
+        path = os.path.join(current_app.root_path, 'static', folder)
+        if not os.path.isdir(path):
+            continue
+        for batch in scan_batches(path, batch_size):
+            batch_orphans = unreferenced_files([entry.path for entry in batch], grace)
+            if not dry_run:
+                remove_files(batch_orphans)
+            orphans += len(batch_orphans)
+    if orphans and not dry_run:
+        current_app.logger.info(f'Image GC removed {orphans} orphaned files')
+    return orphans
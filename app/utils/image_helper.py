@@ -1,48 +1,161 @@
+import hashlib
 import os
-from typing import Tuple
+from datetime import timedelta
+from time import time
+from typing import IO, Dict, List, Optional, Tuple
+from sqlalchemy import select
 from app import db
 from werkzeug.datastructures import FileStorage
 from PIL import Image
 from flask import current_app, abort
-import secrets
 from app.models.user import User
 from app.models.product import Product
 from app.models.picture import Picture, PictureFormat
 
+PICTURE_SIZES = {
+    'profile': ((50, 50), (450, 450)),
+    'product': ((300, 300), (500, 500))
+}
+REDUCING_GAP = 2.0
+HASH_CHUNK_SIZE = 64 * 1024
+REFERENCE_BATCH_SIZE = 500
+
+
+def make_thumbnails(stream: IO[bytes],
+                    sizes: Tuple[Tuple[int, int], ...]) -> List[Tuple[Tuple[int, int], Image.Image]]:
+    # исходник декодируется один раз; для JPEG draft() сразу просит у декодера уменьшенный масштаб
+    # (DCT scaling) с запасом REDUCING_GAP, дальше каждый размер строится из предыдущего, от большего к меньшему
+    stream.seek(0)
+    image = Image.open(stream)
+    largest = max(sizes, key=lambda size: size[0] * size[1])
+    image.draft(None, (int(largest[0] * REDUCING_GAP), int(largest[1] * REDUCING_GAP)))
+    image.load()
+    thumbnails = []
+    for size in sorted(sizes, key=lambda size: size[0] * size[1], reverse=True):
+        if thumbnails:
+            image = image.copy()
+        image.thumbnail(size, reducing_gap=REDUCING_GAP)
+        thumbnails.append((size, image))
+    return thumbnails
+
+
+def picture_path(category: str, filename: str) -> str:
+    return os.path.join(current_app.root_path, 'static', category + '_pics', filename)
+
+
+def content_hashes(stream: IO[bytes], sizes: Tuple[Tuple[int, int], ...]) -> Dict[Tuple[int, int], str]:
+    # ключ формата — sha256 от хеша исходных байтов и размера: та же картинка в том же размере
+    # всегда даёт то же имя файла
+    stream.seek(0)
+    source = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b''):
+        source.update(chunk)
+    stream.seek(0)
+    return {size: hashlib.sha256(source.digest() + f'{size[0]}x{size[1]}'.encode()).hexdigest() for size in sizes}
+
+
+def is_stale(path: str, cutoff: float) -> bool:
+    try:
+        return os.stat(path).st_mtime < cutoff
+    except FileNotFoundError:
+        return False
+
+
+def unreferenced_files(paths: List[str], grace: Optional[timedelta] = None) -> List[str]:
+    # единственный путь к удалению файлов картинок. Один файл делят все PictureFormat с тем же content_hash,
+    # а закоммиченные строки видны не все: загрузка, решившая переиспользовать файл, сначала обновляет
+    # его mtime и только потом коммитит строку. Поэтому удаляются лишь файлы без строк и старше IMAGE_GC_GRACE;
+    # mtime проверяется после запроса, чтобы загрузка между ними тоже была замечена
+    grace = grace if grace is not None else timedelta(seconds=current_app.config['IMAGE_GC_GRACE'])
+    referenced = set()
+    for start in range(0, len(paths), REFERENCE_BATCH_SIZE):
+        filenames = [os.path.basename(path) for path in paths[start:start + REFERENCE_BATCH_SIZE]]
+        referenced.update(db.session.scalars(
+            select(PictureFormat.filename).where(PictureFormat.filename.in_(filenames))))
+    cutoff = time() - grace.total_seconds()
+    return [path for path in paths if os.path.basename(path) not in referenced and is_stale(path, cutoff)]
+
+
+def reuse_file(path: str) -> bool:
+    # свежий mtime защищает переиспользуемый файл от чистки, пока строка этой загрузки не закоммичена
+    try:
+        os.utime(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def remove_files(paths: List[str]) -> None:
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError as e:
+            current_app.logger.warning(f'Could not remove {path}: {e}')
+
 
 def save_picture(file_picture: FileStorage, record: User | Product, category: str = 'product',
                  sizes: Tuple[Tuple[int, int], ...] = ((300, 300), (500, 500))) -> Picture:
-
-    random_hex = secrets.token_hex(8)
+    # ничего не коммитит: картинка и форматы уходят одним коммитом вызывающего кода.
+    # Уже сохранённые варианты той же картинки переиспользуются, и если есть все размеры,
+    # файл даже не декодируется
     _, file_extension = os.path.splitext(file_picture.filename)
+    file_extension = file_extension.lower()
+    hashes = content_hashes(file_picture.stream, sizes)
+    filenames = {size: f"{hashes[size][:32]}_{size[0]}x{size[1]}{file_extension}" for size in sizes}
+    existing = set(db.session.scalars(select(PictureFormat.filename).where(
+        PictureFormat.content_hash.in_(list(hashes.values())))))
+    missing = [size for size in sizes
+               if filenames[size] not in existing or not reuse_file(picture_path(category, filenames[size]))]
 
     picture = Picture(user=record if isinstance(record, User) else None,
                       product=record if isinstance(record, Product) else None)
     try:
         db.session.add(picture)
-        db.session.commit()
+        db.session.flush()
     except:
         raise Exception("Error saving picture record to database")
 
-    for size in sizes:
-        picture_filename = f"{random_hex}_{size[0]}x{size[1]}{file_extension}"
-        picture_path = os.path.join(current_app.root_path, 'static', category + '_pics', picture_filename)
+    # при ошибке записанные файлы не удаляются: их могла подхватить параллельная загрузка той же картинки,
+    # а сироты уберёт сборщик после IMAGE_GC_GRACE
+    try:
+        if missing:
+            for size, thumbnail in make_thumbnails(file_picture.stream, tuple(missing)):
+                thumbnail.save(picture_path(category, filenames[size]))
+        for size in sizes:
+            db.session.add(PictureFormat(filename=filenames[size], format=f"{size[0]}x{size[1]}",
+                                         content_hash=hashes[size], picture_id=picture.id))
+    except:
+        raise Exception("Error processing and saving the image file")
+
+    return picture
+
+
+def delete_pictures(record: User | Product, category: str) -> List[str]:
+    # помечает старую картинку на удаление и возвращает её файлы, удалять их можно только после коммита
+    owner_filter = {'user_id': record.id} if isinstance(record, User) else {'product_id': record.id}
+    last_picture = Picture.query.filter_by(**owner_filter).order_by(Picture.id.desc()).first()
+    if not last_picture:
+        return []
+    last_formats = PictureFormat.query.filter_by(picture_id=last_picture.id).all()
+    files_to_remove = [picture_path(category, pic_format.filename) for pic_format in last_formats]
+    for pic_format in last_formats:
+        db.session.delete(pic_format)
+    db.session.delete(last_picture)
+    return files_to_remove
 
-        try:
-            i = Image.open(file_picture.stream)
-            i.thumbnail(size)
-            i.save(picture_path)
-        except:
-            raise Exception("Error processing and saving the image file")
-
-        picture_format = PictureFormat(filename=picture_filename, format=f"{size[0]}x{size[1]}",
-                                       picture_id=picture.id)
-        try:
-            db.session.add(picture_format)
-            db.session.commit()
-        except:
-            raise Exception("Error adding new picture format to the database")
 
+def replace_picture(file_picture: FileStorage, record: User | Product, category: str) -> Picture:
+    old_files = delete_pictures(record, category)
+    picture = save_picture(file_picture, record=record, category=category,
+                           sizes=PICTURE_SIZES[category])
+    new_files = [picture_path(category, pic_format.filename) for pic_format in picture.formats]
+    try:
+        db.session.commit()
+    except:
+        db.session.rollback()
+        remove_files(unreferenced_files(new_files))
+        raise
+    remove_files(unreferenced_files(old_files))
     return picture
 
 
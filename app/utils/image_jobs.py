@@ -0,0 +1,146 @@
+import os
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, List, Optional
+from flask import Flask, current_app
+from werkzeug.datastructures import FileStorage
+from app import db
+from app.models.image_job import ImageJob
+from app.models.picture import Picture, PictureFormat
+from app.models.product import Product
+from app.models.user import User
+from app.utils.image_helper import picture_path, remove_files, replace_picture, unreferenced_files
+
+
+class ImageJobQueue(object):
+    def __init__(self, app: Optional[Flask] = None) -> None:
+        self.app = None
+        self.executor = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        # IMAGE_WORKERS = 0 — обработка прямо в запросе (тесты, отладка)
+        self.app = app
+        if app.config['IMAGE_WORKERS'] > 0:
+            self.executor = ThreadPoolExecutor(max_workers=app.config['IMAGE_WORKERS'],
+                                               thread_name_prefix='image-job')
+
+    def submit(self, job_id: int) -> None:
+        if self.executor is None:
+            process_image_job(job_id)
+        else:
+            self.executor.submit(self._run, job_id)
+
+    def sweep(self, paths: List[str]) -> None:
+        # файлы уже удалённых записей убираются вне запроса
+        if self.executor is None:
+            remove_files(removable_files(paths))
+        else:
+            self.executor.submit(self._sweep, paths)
+
+    def _sweep(self, paths: List[str]) -> None:
+        with self.app.app_context():
+            try:
+                remove_files(removable_files(paths))
+            finally:
+                db.session.remove()
+
+
+def removable_files(paths: List[str]) -> List[str]:
+    # исходник в UPLOAD_STAGING_FOLDER принадлежит ровно одной задаче и сборщиком не сканируется: удаляется сразу.
+    # Картинки в static/*_pics общие, их пропускает только unreferenced_files с окном IMAGE_GC_GRACE
+    staging_folder = os.path.join(os.path.abspath(current_app.config['UPLOAD_STAGING_FOLDER']), '')
+    sources = [path for path in paths if os.path.abspath(path).startswith(staging_folder)]
+    pictures = [path for path in paths if not os.path.abspath(path).startswith(staging_folder)]
+    return sources + unreferenced_files(pictures)
+
+    def _run(self, job_id: int) -> None:
+        with self.app.app_context():
+            try:
+                process_image_job(job_id)
+            except Exception:
+                self.app.logger.exception(f'Image job {job_id} crashed')
+            finally:
+                db.session.remove()
+
+
+def enqueue_picture(file: FileStorage, owner_id: int, category: str,
+                    product: Optional[Product] = None) -> ImageJob:
+    staging_folder = current_app.config['UPLOAD_STAGING_FOLDER']
+    os.makedirs(staging_folder, exist_ok=True)
+    _, file_extension = os.path.splitext(file.filename)
+    source_path = os.path.join(staging_folder, secrets.token_hex(16) + file_extension)
+    file.save(source_path)
+    job = ImageJob(category=category, owner_id=owner_id,
+                   product_id=product.id if product else None, source_path=source_path)
+    db.session.add(job)
+    db.session.commit()
+    current_app.image_jobs.submit(job.id)
+    return job
+
+
+def claim_job(job_id: int) -> bool:
+    # атомарный захват: задачу обработает только тот воркер, чей UPDATE затронул строку
+    claimed = ImageJob.query.filter_by(id=job_id, status='queued').update(
+        {'status': 'processing', 'updated_at': datetime.utcnow()}, synchronize_session=False)
+    db.session.commit()
+    return claimed == 1
+
+
+def finish_job(job_id: int, **values: Any) -> bool:
+    # задача могла исчезнуть вместе с аккаунтом владельца, пока шла обработка: UPDATE без ORM-объекта
+    # вместо StaleDataError просто не затронет ни одной строки
+    finished = ImageJob.query.filter_by(id=job_id).update(
+        dict(values, updated_at=datetime.utcnow()), synchronize_session=False)
+    db.session.commit()
+    return finished == 1
+
+
+def discard_picture(picture_id: int, category: str) -> None:
+    files = [picture_path(category, filename) for filename, in db.session.query(
+        PictureFormat.filename).filter_by(picture_id=picture_id)]
+    PictureFormat.query.filter_by(picture_id=picture_id).delete(synchronize_session=False)
+    Picture.query.filter_by(id=picture_id).delete(synchronize_session=False)
+    db.session.commit()
+    current_app.image_jobs.sweep(files)
+
+
+def process_image_job(job_id: int) -> None:
+    if not claim_job(job_id):
+        return
+    job = db.session.get(ImageJob, job_id)
+    if job is None:
+        return
+    category, owner_id, product_id, source_path = job.category, job.owner_id, job.product_id, job.source_path
+    try:
+        record = db.session.get(Product, product_id) if category == 'product' else db.session.get(User, owner_id)
+        if record is None:
+            raise LookupError('picture owner no longer exists')
+        with open(source_path, 'rb') as source:
+            file = FileStorage(stream=source, filename=os.path.basename(source_path))
+            picture_id = replace_picture(file, record=record, category=category).id
+    except Exception as e:
+        # повторов у failed-задач нет, так что исходник в UPLOAD_STAGING_FOLDER больше не нужен
+        db.session.rollback()
+        finish_job(job_id, status='failed', error=str(e)[:255])
+    else:
+        if not finish_job(job_id, status='done', picture_id=picture_id):
+            # аккаунт удалили, пока картинка сохранялась: её строки остались бы без владельца
+            discard_picture(picture_id, category)
+    remove_files([source_path])
+
+
+def process_pending_jobs(stale_after: timedelta = timedelta(minutes=10)) -> int:
+    # задачи, брошенные упавшим воркером, возвращаются в очередь и дорабатываются синхронно
+    ImageJob.query.filter(
+        ImageJob.status == 'processing',
+        ImageJob.updated_at < datetime.utcnow() - stale_after).update(
+        {'status': 'queued'}, synchronize_session=False)
+    db.session.commit()
+    job_ids = [job_id for job_id, in db.session.query(
+        ImageJob.id).filter_by(status='queued').order_by(ImageJob.id)]
+    for job_id in job_ids:
+        process_image_job(job_id)
+    return len(job_ids)
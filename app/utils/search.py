@@ -1,51 +1,262 @@
-from typing import List, Tuple
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
+from time import monotonic
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 from app import db
-from flask import current_app
+from app.cache import TTLCache
+from flask import Flask, current_app
+from app.search_backends import Aggregations, ElasticsearchHealth, Filters, SearchError, alias_of
 from app.models.user import User
 from app.models.product import Product
 from app.models.searchable import SearchableMixin
+from app.models.search_outbox import SearchOutbox
+
+suggest_cache = TTLCache(max_entries=2048)
+
+
+class SearchIndexer(object):
+    # фоновый поток, разгребающий search_outbox; будится после коммитов с изменениями
+    # и раз в SEARCH_INDEXER_INTERVAL секунд, чтобы подобрать отложенные повторы
+    def __init__(self, app: Optional[Flask] = None) -> None:
+        self.app = None
+        self.thread = None
+        self._wakeup = Event()
+        self._lock = Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        # SEARCH_INDEXER_THREAD = False — outbox разгребается только командой flask search drain (тесты)
+        self.app = app
+
+    def notify(self) -> None:
+        if not self.app.config['SEARCH_INDEXER_THREAD']:
+            return
+        with self._lock:
+            if self.thread is None:
+                self.thread = Thread(target=self._run, name='search-indexer', daemon=True)
+                self.thread.start()
+        self._wakeup.set()
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(self.app.config['SEARCH_INDEXER_INTERVAL'])
+            self._wakeup.clear()
+            with self.app.app_context():
+                try:
+                    while drain_outbox() == current_app.config['SEARCH_INDEXER_BATCH_SIZE']:
+                        pass
+                except Exception:
+                    self.app.logger.exception('Search indexer crashed')
+                finally:
+                    db.session.remove()
+
+
+def searchable_models() -> Dict[str, type]:
+    return {model.__tablename__: model for model in SearchableMixin.__subclasses__()}
+
+
+def outbox_actions(operations: Dict[Tuple[str, int], str]) -> Iterator[Dict[str, Any]]:
+    # документы для индексации читаются одним IN-запросом на индекс; пропавшая строка
+    # означает, что объект удалён позже, чем попал в outbox
+    models = searchable_models()
+    to_index: Dict[str, List[int]] = {}
+    for (index, doc_id), operation in operations.items():
+        if operation == 'index':
+            to_index.setdefault(index, []).append(doc_id)
+        else:
+            yield {'_op_type': 'delete', '_index': index, '_id': doc_id}
+    for index, ids in to_index.items():
+        model = models[index]
+        objs = model.query.filter(model.id.in_(ids)).all()
+        for obj, document in zip(objs, model.search_documents(objs)):
+            yield {'_op_type': 'index', '_index': index, '_id': obj.id, '_source': document}
+        for doc_id in set(ids) - {obj.id for obj in objs}:
+            yield {'_op_type': 'delete', '_index': index, '_id': doc_id}
+
+
+def retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(2 ** attempts, current_app.config['SEARCH_INDEXER_MAX_BACKOFF']))
+
+
+def drain_outbox(batch_size: Optional[int] = None) -> int:
+    # одна пачка outbox -> один bulk-запрос в поисковый движок. Повторы одного документа схлопываются
+    # в последнюю операцию, неудачные записи остаются в outbox с экспоненциальной задержкой,
+    # так что ни одно изменение не теряется
+    batch_size = batch_size or current_app.config['SEARCH_INDEXER_BATCH_SIZE']
+    backend = current_app.search_backend
+    if backend is None or not backend.available():
+        return 0
+    now = datetime.utcnow()
+    # пока идёт reindex, записи его индекса копятся в outbox и уходят уже в новый индекс после смены алиаса;
+    # просроченная аренда означает, что reindex умер, и индекс снова разгребается
+    paused = [index for index, in db.session.query(SearchOutbox.index).filter(
+        SearchOutbox.operation == 'reindex', SearchOutbox.available_at > now)]
+    entries = SearchOutbox.query.filter(
+        SearchOutbox.available_at <= now, SearchOutbox.operation != 'reindex',
+        SearchOutbox.index.notin_(paused)).order_by(
+        SearchOutbox.id).limit(batch_size).with_for_update(skip_locked=True).all()
+    if not entries:
+        db.session.commit()
+        return 0
+    operations = {}
+    for entry in entries:
+        operations[(entry.index, entry.doc_id)] = entry.operation
+
+    try:
+        failed = backend.bulk(outbox_actions(operations))
+    except SearchError as e:
+        current_app.logger.warning(f'Search bulk indexing failed: {e}')
+        failed = set(operations)
+    else:
+        if failed:
+            current_app.logger.warning(f'Search engine rejected {len(failed)} documents: {sorted(failed)[:3]}')
+
+    for entry in entries:
+        if (entry.index, entry.doc_id) in failed:
+            entry.attempts += 1
+            entry.available_at = now + retry_delay(entry.attempts)
+        else:
+            db.session.delete(entry)
+    db.session.commit()
+    return len(entries)
+
+
+def iter_chunks(model: type, chunk_size: int) -> Iterator[List[SearchableMixin]]:
+    # keyset по id вместо OFFSET: каждый кусок — индексный range scan, а прочитанные объекты
+    # не держатся в памяти (identity map хранит слабые ссылки)
+    last_id = 0
+    while True:
+        chunk = model.query.filter(model.id > last_id).order_by(model.id).limit(chunk_size).all()
+        if not chunk:
+            return
+        last_id = chunk[-1].id
+        yield chunk
+
+
+def reindex_model(model: type, chunk_size: int = 500, threads: int = 1, swap: bool = True,
+                  progress: Optional[Callable[[int, int, float], None]] = None) -> int:
+    # swap=True: движок строит индекс заново рядом с рабочим и подменяет его целиком
+    # на время заливки индекс ставится на паузу строкой-арендой в outbox: она продлевается после каждого
+    # куска, а если процесс упадёт, истечёт через SEARCH_REINDEX_LEASE секунд и пауза снимется сама
+    backend = current_app.search_backend
+    alias = model.__tablename__
+    lease = timedelta(seconds=current_app.config['SEARCH_REINDEX_LEASE'])
+    total = model.query.count()
+    SearchOutbox.query.filter(SearchOutbox.index == alias, SearchOutbox.operation == 'reindex',
+                              SearchOutbox.available_at <= datetime.utcnow()).delete()
+    sentinel = SearchOutbox(index=alias, doc_id=0, operation='reindex', available_at=datetime.utcnow() + lease)
+    db.session.add(sentinel)
+    db.session.commit()
+    chunks = ([(obj.id, document) for obj, document in zip(chunk, model.search_documents(chunk))]
+              for chunk in iter_chunks(model, chunk_size * threads))
+    started = monotonic()
+    done = 0
+    try:
+        for written in backend.rebuild(alias, chunks, chunk_size=chunk_size, threads=threads, swap=swap):
+            done += written
+            sentinel.available_at = datetime.utcnow() + lease
+            db.session.commit()
+            if progress:
+                progress(done, total, monotonic() - started)
+    finally:
+        db.session.delete(sentinel)
+        db.session.commit()
+    return done
 
 
 def add_to_index(index: str, model: SearchableMixin) -> None:
-    if not current_app.elasticsearch:
+    if current_app.search_backend is None:
         return
-    payload = {}
-    for field in model.__searchable__:
-        payload[field] = getattr(model, field)
-    current_app.elasticsearch.index(index=index, id=model.id, body=payload)
+    current_app.search_backend.bulk([{'_op_type': 'index', '_index': index, '_id': model.id,
+                                      '_source': type(model).search_documents([model])[0]}])
 
 
 def remove_from_index(index: str, model: SearchableMixin) -> None:
-    if not current_app.elasticsearch:
+    if current_app.search_backend is None:
         return
-    current_app.elasticsearch.delete(index=index, id=model.id)
+    current_app.search_backend.bulk([{'_op_type': 'delete', '_index': index, '_id': model.id}])
+
+
+def run_search(index: List[str], query: str, page: int, per_page: int, source: bool = False,
+               filters: Optional[Filters] = None) -> Tuple[List[Dict[str, Any]], int, Aggregations]:
+    # фильтр по полю сужает поиск до индексов, где это поле есть (price — только у товаров)
+    filters = filters or {}
+    models = searchable_models()
+    index = [name for name in index if all(field in models[name].__search_fields__ for field in filters)]
+    if current_app.search_backend is None or not index:
+        return [], 0, {'type': []}
+    # только индексируемые поля: в _source могут лежать email, числа и даты, которые text-запрос не должен задевать
+    fields = sorted({field for model in models.values() for field in model.__searchable__})
+    return current_app.search_backend.search(index, query, fields, page, per_page, source=source, filters=filters)
 
 
 def query_index(
-    index: List[str], query: str, page: int, per_page: int
-) -> Tuple[List[int], int] | Tuple[List, int]:
-    if not current_app.elasticsearch:
-        return [], 0
-    multiple_index = ",".join(index)
-    search = current_app.elasticsearch.search(
-        index=multiple_index,
-        body={'query': {'multi_match': {'query': query, 'fields': ['*']}},
-              'from': (page - 1) * per_page, 'size': per_page})
-    ids = [int(hit['_id']) for hit in search['hits']['hits']]
-    return ids, search['hits']['total']['value']
-
-
-def search_multiple_models(query: str, page: int, per_page: int) -> Tuple[dict, int]:
+    index: List[str], query: str, page: int, per_page: int, filters: Optional[Filters] = None
+) -> Tuple[List[Tuple[str, int]], int, Aggregations]:
+    # хиты возвращаются парами (индекс, id): id пользователя и товара из разных индексов могут совпадать
+    hits, total, aggregations = run_search(index, query, page, per_page, filters=filters)
+    return [(alias_of(hit['_index']), int(hit['_id'])) for hit in hits], total, aggregations
+
+
+def search_from_source(query: str, page: int, per_page: int, filters: Optional[Filters] = None
+                       ) -> Tuple[List[Dict[str, Any]], int, Aggregations]:
+    # режим SEARCH_FROM_SOURCE: ответ собирается из _source хитов без единого запроса в базу,
+    # ссылки достраиваются через url_for на лету
+    models = searchable_models()
+    hits, total, aggregations = run_search(sorted(models), query, page, per_page, source=True, filters=filters)
+    by_model: Dict[type, List[Tuple[int, Dict[str, Any]]]] = {}
+    for position, hit in enumerate(hits):
+        model = models[alias_of(hit['_index'])]
+        by_model.setdefault(model, []).append((position, model.from_search_source(hit['_source'])))
+    items: List[Dict[str, Any]] = [{} for _ in hits]
+    for model, entries in by_model.items():
+        for (position, _), data in zip(entries, model.render_batch([projection for _, projection in entries])):
+            items[position] = data
+    return items, total, aggregations
+
+
+def search_multiple_models(query: str, page: int, per_page: int, filters: Optional[Filters] = None
+                           ) -> Tuple[List[SearchableMixin], int, Aggregations]:
     index_names = [User.__tablename__, Product.__tablename__]
-    ids, total = query_index(index_names, query, page, per_page)
-
-    results = {}
-    if total > 0:
-        for index_name in index_names:
-            model_class = globals()[index_name.capitalize()]
-            when = {}
-            for i in range(len(ids)):
-                when[ids[i]] = i
-            results[index_name] = model_class.query.filter(model_class.id.in_(ids)).order_by(
-                db.case(when, value=model_class.id))
-    return results, total
+    hits, total, aggregations = query_index(index_names, query, page, per_page, filters=filters)
+
+    # один IN-запрос на модель, порядок релевантности ES восстанавливается в питоне;
+    # строки, удалённые после индексации, просто выпадают из выдачи
+    models = searchable_models()
+    ids_by_index: Dict[str, List[int]] = {}
+    for index_name, doc_id in hits:
+        ids_by_index.setdefault(index_name, []).append(doc_id)
+    found = {}
+    for index_name, ids in ids_by_index.items():
+        model_class = models[index_name]
+        for obj in model_class.query.filter(model_class.id.in_(ids)):
+            found[(index_name, obj.id)] = obj
+    return [found[hit] for hit in hits if hit in found], total, aggregations
+
+
+def serialize_hits(results: List[SearchableMixin]) -> List[Dict[str, Any]]:
+    # to_dict_batch вызывается один раз на модель, а не на каждый хит
+    by_model: Dict[type, List[SearchableMixin]] = {}
+    for obj in results:
+        by_model.setdefault(type(obj), []).append(obj)
+    serialized = {}
+    for model_class, objs in by_model.items():
+        for obj, data in zip(objs, model_class.to_dict_batch(objs)):
+            serialized[(model_class, obj.id)] = data
+    return [serialized[(type(obj), obj.id)] for obj in results]
+
+
+def suggest(prefix: str, size: int) -> List[Dict[str, Any]]:
+    # подсказки запрашиваются на каждое нажатие клавиши, а горячие префиксы одинаковы у всех
+    # пользователей: ответ движка живёт в LRU SEARCH_SUGGEST_TTL секунд
+    normalized = ' '.join(prefix.lower().split())
+    if not normalized or current_app.search_backend is None:
+        return []
+    key = f'{size}:{normalized}'
+    items = suggest_cache.get(key)
+    if items is None:
+        hits = current_app.search_backend.suggest(sorted(searchable_models()), normalized, size)
+        items = [{'type': hit['_index'], 'id': int(hit['_id']), 'text': hit['text']} for hit in hits]
+        suggest_cache.set(key, items, ttl=current_app.config['SEARCH_SUGGEST_TTL'])
+    return items
@@ -0,0 +1,85 @@
+"""Account deletion: legacy per-product ORM loop vs set-based delete_user_account.
+
+Run from the repository root:  python -m benchmarks.delete_user [products per user ...]
+"""
+import sys
+import time
+from datetime import datetime
+from typing import Callable, List, Tuple
+from sqlalchemy import event, insert
+from app import create_app, db
+from app.models.picture import Picture, PictureFormat
+from app.models.product import Product, cart
+from app.models.user import User
+from app.utils.accounts import delete_user_account
+from config import TestConfig
+
+SIZES = [100, 1000, 10000]
+FANS = 50
+
+
+class BenchmarkConfig(TestConfig):
+    SEARCH_BACKEND = 'null'
+    RESPONSE_CACHE = 'null'
+
+
+def seed(products: int) -> int:
+    # сразу Core-вставками: через ORM наполнение заняло бы дольше самого удаления
+    db.session.execute(insert(User), [{'id': user_id, 'username': f'user{user_id}',
+                                       'email': f'{user_id}@mail.ru'} for user_id in range(1, FANS + 2)])
+    db.session.execute(insert(Product), [{'id': product_id, 'name': f'product {product_id}', 'price': 1,
+                                          'user_id': 1, 'timestamp': datetime.utcnow()}
+                                         for product_id in range(1, products + 1)])
+    db.session.execute(insert(Picture), [{'id': product_id, 'product_id': product_id}
+                                         for product_id in range(1, products + 1)])
+    db.session.execute(insert(PictureFormat), [{'filename': f'{product_id}_{size}.png', 'format': size,
+                                                'picture_id': product_id}
+                                               for product_id in range(1, products + 1)
+                                               for size in ('300x300', '500x500')])
+    db.session.execute(insert(cart), [{'user_cart_id': fan_id, 'product_id': product_id}
+                                      for fan_id in range(2, FANS + 2)
+                                      for product_id in range(1, min(products, 20) + 1)])
+    db.session.commit()
+    return 1
+
+
+def legacy(user_id: int) -> None:
+    user = db.session.get(User, user_id)
+    for product in Product.query.filter_by(user_id=user_id).all():
+        last_picture = Picture.query.filter_by(product_id=product.id).order_by(Picture.id.desc()).first()
+        if last_picture:
+            for pic_format in PictureFormat.query.filter_by(picture_id=last_picture.id).all():
+                db.session.delete(pic_format)
+            db.session.delete(last_picture)
+        db.session.delete(product)
+    db.session.delete(user)
+    db.session.commit()
+
+
+def measure(func: Callable[[int], None], products: int) -> Tuple[float, int]:
+    db.create_all()
+    user_id = seed(products)
+    statements: List[str] = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    start = time.perf_counter()
+    try:
+        func(user_id)
+    finally:
+        elapsed = time.perf_counter() - start
+        event.remove(db.engine, 'before_cursor_execute', listener)
+        db.session.remove()
+        db.drop_all()
+    return elapsed * 1000, len(statements)
+
+
+if __name__ == '__main__':
+    sizes = [int(arg) for arg in sys.argv[1:]] or SIZES
+    app = create_app(BenchmarkConfig)
+    app.image_jobs.sweep = lambda paths: None  # файлов в бенчмарке нет
+    with app.app_context():
+        print(f'{"products":>9} {"legacy ms":>10} {"queries":>8} {"bulk ms":>8} {"queries":>8} {"speedup":>8}')
+        for size in sizes:
+            old, old_queries = measure(legacy, size)
+            new, new_queries = measure(delete_user_account, size)
+            print(f'{size:>9} {old:>10.1f} {old_queries:>8} {new:>8.1f} {new_queries:>8} {old / new:>7.1f}x')
@@ -0,0 +1,52 @@
+"""CPU time per upload: legacy per-size decode vs make_thumbnails.
+
+Run from the repository root:  python -m benchmarks.image_pipeline
+"""
+import io
+import time
+from typing import Callable, Tuple
+from PIL import Image, ImageFilter
+from app.utils.image_helper import PICTURE_SIZES, make_thumbnails
+
+SOURCES = {'1600x1200': (1600, 1200), '4000x3000': (4000, 3000)}
+ROUNDS = 10
+
+
+def make_source(size: Tuple[int, int]) -> bytes:
+    image = Image.effect_noise(size, 64).convert('RGB').filter(ImageFilter.GaussianBlur(2))
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def legacy(data: bytes, sizes: Tuple[Tuple[int, int], ...]) -> None:
+    stream = io.BytesIO(data)
+    for size in sizes:
+        stream.seek(0)
+        image = Image.open(stream)
+        image.thumbnail(size)
+        image.save(io.BytesIO(), format='JPEG')
+
+
+def pipeline(data: bytes, sizes: Tuple[Tuple[int, int], ...]) -> None:
+    for size, image in make_thumbnails(io.BytesIO(data), sizes):
+        image.save(io.BytesIO(), format='JPEG')
+
+
+def measure(func: Callable, data: bytes, sizes: Tuple[Tuple[int, int], ...]) -> float:
+    func(data, sizes)
+    start = time.process_time()
+    for _ in range(ROUNDS):
+        func(data, sizes)
+    return (time.process_time() - start) / ROUNDS * 1000
+
+
+if __name__ == '__main__':
+    print(f'{"source":>10} {"sizes":>20} {"legacy ms":>10} {"pipeline ms":>12} {"speedup":>8}')
+    for source_name, source_size in SOURCES.items():
+        data = make_source(source_size)
+        for category, sizes in PICTURE_SIZES.items():
+            old = measure(legacy, data, sizes)
+            new = measure(pipeline, data, sizes)
+            label = ','.join(f'{w}x{h}' for w, h in sizes)
+            print(f'{source_name:>10} {label:>20} {old:>10.1f} {new:>12.1f} {old / new:>7.1f}x')
@@ -0,0 +1,58 @@
+"""Indexing throughput and query latency: SQLite FTS5 fallback vs Elasticsearch.
+
+Run from the repository root:  python -m benchmarks.search_backends [catalog size]
+Elasticsearch is measured only when ELASTICSEARCH_URL is set.
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Any, Dict, Iterator, List, Tuple
+from elasticsearch import Elasticsearch
+from app.search_backends import ElasticsearchBackend, ElasticsearchHealth, SqliteSearchBackend
+
+WORDS = ['chair', 'table', 'lamp', 'sofa', 'desk', 'shelf', 'vintage', 'oak', 'red', 'leather',
+         'modern', 'small', 'large', 'folding', 'kids', 'office', 'garden', 'metal', 'glass', 'soft']
+QUERIES = ['chair', 'oak table', 'vintage leather sofa', 'kids', 'glass shelf metal']
+SCHEMA = {'bench_product': {'searchable': ['name'], 'boosts': {}, 'fields': {}}}
+CHUNK_SIZE = 1000
+ROUNDS = 50
+
+
+def catalog(size: int) -> Iterator[List[Tuple[int, Dict[str, Any]]]]:
+    rng = random.Random(42)
+    for start in range(1, size + 1, CHUNK_SIZE):
+        yield [(doc_id, {'name': ' '.join(rng.sample(WORDS, 3)) + f' #{doc_id}'})
+               for doc_id in range(start, min(start + CHUNK_SIZE, size + 1))]
+
+
+def measure(name: str, backend: Any, size: int) -> None:
+    start = time.perf_counter()
+    indexed = sum(backend.rebuild('bench_product', catalog(size), chunk_size=CHUNK_SIZE, swap=False))
+    elapsed = time.perf_counter() - start
+    if isinstance(backend, ElasticsearchBackend):
+        backend.client.indices.refresh(index='bench_product')
+    latencies = []
+    for _ in range(ROUNDS):
+        for query in QUERIES:
+            started = time.perf_counter()
+            backend.search(['bench_product'], query, ['name'], 1, 10)
+            latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    print(f'{name:>14} {indexed / elapsed:>12.0f} {latencies[len(latencies) // 2]:>8.2f} '
+          f'{latencies[int(len(latencies) * 0.95)]:>8.2f}')
+
+
+if __name__ == '__main__':
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    print(f'catalog: {size} products')
+    print(f'{"backend":>14} {"docs/s":>12} {"p50 ms":>8} {"p95 ms":>8}')
+    with tempfile.TemporaryDirectory() as folder:
+        measure('sqlite fts5', SqliteSearchBackend(os.path.join(folder, 'search.db'), SCHEMA), size)
+    if os.getenv('ELASTICSEARCH_URL'):
+        client = Elasticsearch([os.getenv('ELASTICSEARCH_URL')])
+        try:
+            measure('elasticsearch', ElasticsearchBackend(client, ElasticsearchHealth(client), SCHEMA), size)
+        finally:
+            client.indices.delete(index='bench_product', ignore_unavailable=True)
@@ -9,4 +9,5 @@ while true; do
     echo Deploy command failed, retrying in 5 secs...
     sleep 5
 done
-exec gunicorn -b :5000 --access-logfile - --error-logfile - LUDA:app
\ No newline at end of file
+# gthread: пока поток ждёт хеш пароля или картинку, остальные потоки воркера обслуживают запросы
+exec gunicorn -b :5000 --worker-class gthread --threads ${GUNICORN_THREADS:-16} --access-logfile - --error-logfile - LUDA:app
\ No newline at end of file
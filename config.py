@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 basedir = os.path.abspath(os.path.dirname(__file__))
@@ -17,8 +18,43 @@ class Config(object):
     MAIL_PASSWORD = os.getenv('MAIL_PASSWORD')
     ADMINS = ['kozhaniichelovek322@gmail.com']
     ELASTICSEARCH_URL = os.environ.get('ELASTICSEARCH_URL')
+    ELASTICSEARCH_HEALTH_INTERVAL = int(os.getenv('ELASTICSEARCH_HEALTH_INTERVAL') or 30)
+    ELASTICSEARCH_FAILURE_THRESHOLD = int(os.getenv('ELASTICSEARCH_FAILURE_THRESHOLD') or 3)
+    ELASTICSEARCH_RESET_TIMEOUT = int(os.getenv('ELASTICSEARCH_RESET_TIMEOUT') or 60)
+    SEARCH_BACKEND = os.getenv('SEARCH_BACKEND')  # 'elasticsearch', 'sqlite', 'null'; по умолчанию по ELASTICSEARCH_URL
+    SEARCH_SQLITE_PATH = os.getenv('SEARCH_SQLITE_PATH') or os.path.join(basedir, 'search.db')
+    SEARCH_INIT_ON_STARTUP = os.getenv('SEARCH_INIT_ON_STARTUP') is not None  # иначе flask search init
+    SEARCH_SUGGEST_TTL = int(os.getenv('SEARCH_SUGGEST_TTL') or 30)
+    SEARCH_FROM_SOURCE = os.getenv('SEARCH_FROM_SOURCE') is not None  # после переключения нужен flask search reindex
+    SEARCH_INDEXER_THREAD = os.getenv('SEARCH_INDEXER_THREAD', '1') != '0'
+    SEARCH_INDEXER_INTERVAL = int(os.getenv('SEARCH_INDEXER_INTERVAL') or 5)
+    SEARCH_INDEXER_BATCH_SIZE = int(os.getenv('SEARCH_INDEXER_BATCH_SIZE') or 500)
+    SEARCH_INDEXER_MAX_BACKOFF = int(os.getenv('SEARCH_INDEXER_MAX_BACKOFF') or 600)
+    SEARCH_REINDEX_LEASE = int(os.getenv('SEARCH_REINDEX_LEASE') or 300)
     POSTS_PER_PAGE = 10
+    PAGINATION_COUNT = os.getenv('PAGINATION_COUNT') or 'exact'  # 'exact', 'cached', 'estimate'
+    PAGINATION_COUNT_TTL = int(os.getenv('PAGINATION_COUNT_TTL') or 60)
+    PAGINATION_ESTIMATE_THRESHOLD = int(os.getenv('PAGINATION_ESTIMATE_THRESHOLD') or 10000)
     MAX_SIZE_FILE = 1
+    IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS') or 2)
+    UPLOAD_STAGING_FOLDER = os.getenv('UPLOAD_STAGING_FOLDER') or os.path.join(basedir, 'uploads')
+    IMAGE_GC_INTERVAL = int(os.getenv('IMAGE_GC_INTERVAL') or 0)  # 0 — только flask images gc
+    IMAGE_GC_GRACE = int(os.getenv('IMAGE_GC_GRACE') or 3600)
+    IMAGE_GC_BATCH_SIZE = int(os.getenv('IMAGE_GC_BATCH_SIZE') or 500)
+    # 'simple', 'redis', 'null'. simple живёт в памяти процесса: инвалидация после коммита доходит только
+    # до своего воркера, остальные отдают старые ответы до RESPONSE_CACHE_TTL, поэтому по умолчанию
+    # кэш включается только вместе с REDIS_URL
+    RESPONSE_CACHE = os.getenv('RESPONSE_CACHE') or ('redis' if os.getenv('REDIS_URL') else 'null')
+    RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL') or 30)
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES') or 2048)
+    REDIS_URL = os.getenv('REDIS_URL') or 'redis://localhost:6379/0'
+    IDENTITY_CACHE_TTL = int(os.getenv('IDENTITY_CACHE_TTL') or 60)
+    # scrypt длиннее 128 символов и не влезет в user.password_hash
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD') or 'pbkdf2:sha256:600000'
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS') or 2)
+    # воркеры + очередь должны быть меньше GUNICORN_THREADS, иначе 429 не сработает раньше, чем кончатся потоки
+    PASSWORD_HASH_QUEUE = int(os.getenv('PASSWORD_HASH_QUEUE') or 6)
+    PASSWORD_HASH_TIMEOUT = int(os.getenv('PASSWORD_HASH_TIMEOUT') or 10)
 
 
 class TestConfig(Config):
@@ -27,3 +63,9 @@ class TestConfig(Config):
     ELASTICSEARCH_URL = os.environ.get('ELASTICSEARCH_URL')
     ENV = 'testing'
     SERVER_NAME = 'localhost:5000'
+    IMAGE_WORKERS = 0
+    PASSWORD_HASH_WORKERS = 0
+    RESPONSE_CACHE = 'simple'
+    SEARCH_INDEXER_THREAD = False
+    SEARCH_SQLITE_PATH = ':memory:'
+    UPLOAD_STAGING_FOLDER = os.path.join(tempfile.gettempdir(), 'luda_uploads')
@@ -0,0 +1,26 @@
+"""index picture_format filename
+
+Revision ID: 2c6e0f93b1d4
+Revises: e5b19d4c7a20
+Create Date: 2026-10-18 20:03:17.552871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2c6e0f93b1d4'
+down_revision = 'e5b19d4c7a20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('picture_format', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_picture_format_filename'), ['filename'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('picture_format', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_picture_format_filename'))
@@ -0,0 +1,46 @@
+"""counter columns
+
+Revision ID: 3c9e5a1f7d2b
+Revises: 1756054fa8c0
+Create Date: 2026-10-18 15:52:10.412307
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9e5a1f7d2b'
+down_revision = '1756054fa8c0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('product_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('followers_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('followed_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('product_liked_count', sa.Integer(), server_default='0', nullable=False))
+
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('liked_count', sa.Integer(), server_default='0', nullable=False))
+
+    op.execute('UPDATE "user" SET '
+               'product_count = (SELECT count(*) FROM product WHERE product.user_id = "user".id), '
+               'followers_count = (SELECT count(*) FROM followers WHERE followers.followed_id = "user".id), '
+               'followed_count = (SELECT count(*) FROM followers WHERE followers.follower_id = "user".id), '
+               'product_liked_count = (SELECT count(*) FROM cart WHERE cart.user_cart_id = "user".id)')
+    op.execute('UPDATE product SET '
+               'liked_count = (SELECT count(*) FROM cart WHERE cart.product_id = product.id)')
+
+
+def downgrade():
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.drop_column('liked_count')
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('product_liked_count')
+        batch_op.drop_column('followed_count')
+        batch_op.drop_column('followers_count')
+        batch_op.drop_column('product_count')
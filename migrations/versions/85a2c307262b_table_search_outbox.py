@@ -0,0 +1,38 @@
+"""table search_outbox
+
+Revision ID: 85a2c307262b
+Revises: c47a1e0b5d83
+Create Date: 2026-10-18 16:02:50.605999
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '85a2c307262b'
+down_revision = 'c47a1e0b5d83'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('search_outbox',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('index', sa.String(length=64), nullable=False),
+    sa.Column('doc_id', sa.Integer(), nullable=False),
+    sa.Column('operation', sa.String(length=10), nullable=False),
+    sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('available_at', sa.DateTime(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('search_outbox', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_search_outbox_available_at'), ['available_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('search_outbox', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_search_outbox_available_at'))
+
+    op.drop_table('search_outbox')
@@ -0,0 +1,32 @@
+"""version columns
+
+Revision ID: 8f2d4b6a9c31
+Revises: 3c9e5a1f7d2b
+Create Date: 2026-10-18 16:21:43.907115
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f2d4b6a9c31'
+down_revision = '3c9e5a1f7d2b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.drop_column('version')
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('version')
@@ -0,0 +1,28 @@
+"""picture_format content_hash
+
+Revision ID: 9b3f5e2a6d18
+Revises: 2c6e0f93b1d4
+Create Date: 2026-10-18 20:41:05.204617
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b3f5e2a6d18'
+down_revision = '2c6e0f93b1d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('picture_format', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_hash', sa.String(length=64), nullable=True))
+        batch_op.create_index(batch_op.f('ix_picture_format_content_hash'), ['content_hash'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('picture_format', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_picture_format_content_hash'))
+        batch_op.drop_column('content_hash')
@@ -0,0 +1,43 @@
+"""table image_job
+
+Revision ID: c47a1e0b5d83
+Revises: 8f2d4b6a9c31
+Create Date: 2026-10-18 16:48:02.518774
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c47a1e0b5d83'
+down_revision = '8f2d4b6a9c31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('image_job',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('category', sa.String(length=20), nullable=False),
+    sa.Column('owner_id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=True),
+    sa.Column('source_path', sa.String(length=255), nullable=False),
+    sa.Column('picture_id', sa.Integer(), nullable=True),
+    sa.Column('error', sa.String(length=255), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['owner_id'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['product_id'], ['product.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('image_job', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_image_job_status'), ['status'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('image_job', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_image_job_status'))
+
+    op.drop_table('image_job')
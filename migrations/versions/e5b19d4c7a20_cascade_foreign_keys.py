@@ -0,0 +1,45 @@
+"""cascade foreign keys
+
+Revision ID: e5b19d4c7a20
+Revises: 85a2c307262b
+Create Date: 2026-10-18 19:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b19d4c7a20'
+down_revision = '85a2c307262b'
+branch_labels = None
+depends_on = None
+
+NAMING_CONVENTION = {'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}
+FOREIGN_KEYS = {
+    'picture_format': [('picture_id', 'picture')],
+    'picture': [('user_id', 'user'), ('product_id', 'product')],
+    'cart': [('user_cart_id', 'user'), ('product_id', 'product')],
+    'followers': [('follower_id', 'user'), ('followed_id', 'user')],
+    'image_job': [('owner_id', 'user'), ('product_id', 'product')],
+}
+
+
+def replace_foreign_keys(ondelete):
+    inspector = sa.inspect(op.get_bind())
+    for table, keys in FOREIGN_KEYS.items():
+        # старые FK безымянные: в SQLite имя им даёт naming_convention батча, в остальных базах берём отражённое
+        names = {fk['constrained_columns'][0]: fk['name'] for fk in inspector.get_foreign_keys(table)}
+        with op.batch_alter_table(table, schema=None, naming_convention=NAMING_CONVENTION) as batch_op:
+            for column, referred in keys:
+                name = f'fk_{table}_{column}_{referred}'
+                batch_op.drop_constraint(names.get(column) or name, type_='foreignkey')
+                batch_op.create_foreign_key(name, referred, [column], ['id'], ondelete=ondelete)
+
+
+def upgrade():
+    replace_foreign_keys('CASCADE')
+
+
+def downgrade():
+    replace_foreign_keys(None)
@@ -1,7 +1,10 @@
+import os
 from decimal import Decimal
 
+from flask import Flask
 from flask.testing import FlaskClient
 from sqlalchemy.orm import Session
+from app.models.picture import Picture, PictureFormat
 from app.models.product import Product
 from tests.conftest import test_client, create_product, test_app, new_db, session
 from tests.api_v1.resources.conftest import get_token_and_user, create_products
@@ -241,17 +244,66 @@ def test_purchase(
     assert f'You cannot buy your own product.' in response.get_json()['message']
 
 
+def test_get_product_cache_invalidation(
+        test_client: FlaskClient, get_token_and_user: tuple, session: Session):
+    token, user = get_token_and_user
+    headers = {
+        'Authorization': f'Bearer {token}'
+    }
+    response = test_client.post(
+        url_for('resources.create_product'), json={'name': 'cached', 'price': 1}, headers=headers)
+    product_id = response.get_json()['id']
 
+    response = test_client.get(url_for('resources.get_product', id=product_id), headers=headers)
+    assert response.get_json()['name'] == 'cached'
 
+    response = test_client.put(
+        url_for('resources.update_product', id=product_id), json={'name': 'updated'}, headers=headers)
+    assert response.status_code == 200
 
+    response = test_client.get(url_for('resources.get_product', id=product_id), headers=headers)
+    assert response.get_json()['name'] == 'updated'
 
+    response = test_client.get(url_for('resources.get_products'), headers=headers)
+    assert response.get_json()['items'][0]['name'] == 'updated'
 
 
+def test_get_products_cursor(test_client: FlaskClient, create_products: list, get_token_and_user: tuple):
+    headers = {
+        'Authorization': f'Bearer {get_token_and_user[0]}'
+    }
+
+    response = test_client.get(
+        url_for('resources.get_products', cursor='', per_page=3), headers=headers)
+
+    assert response.status_code == 200
+    data = response.get_json()
+    assert len(data['items']) == 3
+    assert data['_links']['next']
 
+    response = test_client.get(data['_links']['next'], headers=headers)
 
+    assert response.status_code == 200
+    assert len(response.get_json()['items']) == len(create_products) - 3
+    assert response.get_json()['_links']['next'] is None
 
+    response = test_client.get(
+        url_for('resources.get_products', cursor='not-a-cursor'), headers=headers)
 
+    assert response.status_code == 400
 
 
+def test_delete_product_sweeps_files_after_commit(
+        test_app: Flask, test_client: FlaskClient, get_token_and_user: tuple, session: Session, mocker):
+    token, user = get_token_and_user
+    product = Product(name='doomed', price=1, author=user)
+    session.add(Picture(product=product, formats=[PictureFormat(filename='missing_300x300.jpg', format='300x300')]))
+    session.commit()
+    sweep = mocker.patch.object(test_app.image_jobs, 'sweep')
 
+    response = test_client.delete(url_for('resources.delete_product', id=product.id),
+                                  headers={'Authorization': f'Bearer {token}'})
 
+    assert response.status_code == 200
+    assert Picture.query.count() == PictureFormat.query.count() == 0
+    assert [os.path.basename(path) for path in sweep.call_args.args[0]] == ['missing_300x300.jpg']
@@ -0,0 +1,112 @@
+import json
+from typing import Tuple
+from unittest.mock import MagicMock
+from elastic_transport import JsonSerializer
+from flask import Flask, url_for
+from flask.testing import FlaskClient
+from sqlalchemy.orm import Session
+from app.search_backends import ElasticsearchBackend
+from app.utils.search import drain_outbox
+from app.models.product import Product
+from app.models.user import User
+from tests.conftest import test_client, test_app, new_db, session, create_user, capture_statements
+from tests.api_v1.resources.conftest import get_token_and_user, create_products
+
+
+def test_search(test_client: FlaskClient, get_token_and_user: Tuple[str, User], create_products: list, mocker) -> None:
+    token, user = get_token_and_user
+    product = create_products[0]
+    hits = [('product', product.id), ('user', user.id)]
+    mocker.patch('app.utils.search.query_index', return_value=(hits, 2, {'type': []}))
+
+    response = test_client.get(url_for('resources.search', q='anything'),
+                               headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == 200
+    items = response.json['items']
+    assert [item.get('name', item.get('username')) for item in items] == [product.name, user.username]
+    assert response.json['_meta']['total_items'] == 2
+
+
+def test_search_from_source(test_app: Flask, test_client: FlaskClient, get_token_and_user: Tuple[str, User],
+                            create_products: list, capture_statements, mocker) -> None:
+    token, user = get_token_and_user
+    product = create_products[0]
+    mocker.patch.dict(test_app.config, {'SEARCH_FROM_SOURCE': True})
+    serializer = JsonSerializer()
+    hits = [{'_index': 'product_20261018000000', '_id': str(product.id),
+             '_source': json.loads(serializer.dumps(Product.search_documents([product])[0]))},
+            {'_index': 'user', '_id': str(user.id),
+             '_source': json.loads(serializer.dumps(User.search_documents([user])[0]))}]
+    client = MagicMock()
+    client.search.return_value = {'hits': {'hits': hits, 'total': {'value': 2}}}
+    mocker.patch.object(test_app, 'search_backend', ElasticsearchBackend(
+        client, test_app.elasticsearch_health, test_app.search_backend.schema))
+    expected = test_client.get(url_for('resources.get_product', id=product.id),
+                               headers={'Authorization': f'Bearer {token}'}).json
+    with capture_statements() as statements:
+        response = test_client.get(url_for('resources.search', q='anything'),
+                                   headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == 200
+    assert statements == []
+    assert response.json['items'][0] == expected
+    assert response.json['items'][1]['username'] == user.username
+    query = client.search.call_args.kwargs['body']['query']['bool']
+    assert query['must'][0]['multi_match']['fields'] == ['name^2.0', 'username']
+    assert query['should'][0] == {'term': {'name.keyword': {'value': 'anything', 'boost': 2.0}}}
+
+
+def test_search_with_sqlite_fallback(test_client: FlaskClient, get_token_and_user: Tuple[str, User],
+                                     session: Session) -> None:
+    token, user = get_token_and_user
+    product = Product(name='Fallback armchair', price=1, author=user)
+    session.add(product)
+    session.commit()
+    drain_outbox()
+
+    response = test_client.get(url_for('resources.search', q='armchair'),
+                               headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == 200
+    assert [item['id'] for item in response.json['items']] == [product.id]
+
+
+def test_search_filters_and_facets(test_client: FlaskClient, get_token_and_user: Tuple[str, User],
+                                   session: Session) -> None:
+    token, user = get_token_and_user
+    cheap = Product(name='Filtered stool', price=50, author=user)
+    pricey = Product(name='Filtered stool deluxe', price=250, author=user)
+    session.add_all([cheap, pricey])
+    session.commit()
+    drain_outbox()
+
+    response = test_client.get(url_for('resources.search', q='stool', min_price=100, is_purchased='false'),
+                               headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == 200
+    assert [item['id'] for item in response.json['items']] == [pricey.id]
+    assert response.json['aggregations']['price'] == [{'key': 200, 'count': 1}]
+    assert 'min_price=100' in response.json['_links']['self']
+
+    response = test_client.get(url_for('resources.search', q='stool', min_price='cheap'),
+                               headers={'Authorization': f'Bearer {token}', 'Accept': 'application/json'})
+    assert response.status_code == 400
+
+
+def test_search_suggest(test_app: Flask, test_client: FlaskClient, get_token_and_user: Tuple[str, User],
+                        session: Session, mocker) -> None:
+    token, user = get_token_and_user
+    product = Product(name='Suggested ottoman', price=1, author=user)
+    session.add(product)
+    session.commit()
+    drain_outbox()
+    suggest = mocker.spy(test_app.search_backend, 'suggest')
+
+    for query in ('sugg', ' SUGG '):
+        response = test_client.get(url_for('resources.search_suggest', q=query),
+                                   headers={'Authorization': f'Bearer {token}'})
+        assert response.status_code == 200
+        assert response.json['items'] == [{'type': 'product', 'id': product.id, 'text': 'Suggested ottoman'}]
+
+    assert suggest.call_count == 1
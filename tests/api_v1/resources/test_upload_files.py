@@ -0,0 +1,100 @@
+import io
+import os
+from flask import url_for, current_app
+from flask.testing import FlaskClient
+from PIL import Image
+from sqlalchemy.orm import Session
+from app.models.picture import Picture, PictureFormat
+from app.models.image_job import ImageJob
+from app.models.product import Product
+from app.models.user import User
+from tests.conftest import test_client, create_product, test_app, new_db, session
+from tests.api_v1.resources.conftest import get_token_and_user
+
+
+def make_image(size: tuple = (600, 400)) -> io.BytesIO:
+    image = io.BytesIO()
+    Image.new('RGB', size=size, color=(73, 109, 137)).save(image, format='JPEG')
+    image.seek(0)
+    return image
+
+
+def remove_picture_files(picture: Picture, category: str) -> None:
+    for pic_format in picture.formats:
+        os.remove(os.path.join(current_app.root_path, 'static', category + '_pics', pic_format.filename))
+
+
+def test_upload_pic_user(test_client: FlaskClient, get_token_and_user: tuple, session: Session):
+    token, user = get_token_and_user
+    headers = {
+        'Authorization': f'Bearer {token}'
+    }
+
+    response = test_client.post(
+        url_for('resources.upload_pic_user'), headers=headers,
+        data={'file': (make_image(), 'avatar.jpg')}, content_type='multipart/form-data')
+
+    assert response.status_code == 202
+    job = response.get_json()
+    assert job['status'] == 'done'
+
+    response = test_client.get(response.headers['Location'], headers=headers)
+
+    assert response.status_code == 200
+    assert response.get_json()['picture_id'] == job['picture_id']
+
+    picture = session.get(Picture, job['picture_id'])
+    try:
+        assert picture.user_id == user.id
+        assert sorted(f.format for f in picture.formats) == ['450x450', '50x50']
+        response = test_client.get(url_for('resources.get_user', id=user.id), headers=headers)
+        assert response.get_json()['_links']['avatar_50x50'] == \
+            picture.formats.filter_by(format='50x50').first().filename
+    finally:
+        remove_picture_files(picture, 'profile')
+
+
+def test_upload_pic_product(test_client: FlaskClient, get_token_and_user: tuple,
+                            create_product: Product, session: Session):
+    token, user = get_token_and_user
+    headers = {
+        'Authorization': f'Bearer {token}'
+    }
+
+    response = test_client.post(
+        url_for('resources.upload_pic_product', id=create_product.id), headers=headers,
+        data={'file': (make_image(), 'product.jpg')}, content_type='multipart/form-data')
+
+    assert response.status_code == 403
+
+    product = Product(name='own_product', price=1, author=user)
+    session.add(product)
+    session.commit()
+
+    response = test_client.post(
+        url_for('resources.upload_pic_product', id=product.id), headers=headers,
+        data={'file': (make_image(), 'product.jpg')}, content_type='multipart/form-data')
+
+    assert response.status_code == 202
+    picture = session.get(Picture, response.get_json()['picture_id'])
+    try:
+        assert picture.product_id == product.id
+        assert PictureFormat.query.filter_by(picture_id=picture.id).count() == 2
+    finally:
+        remove_picture_files(picture, 'product')
+
+
+def test_upload_pic_user_for_deleted_account(test_client: FlaskClient, get_token_and_user: tuple, session: Session):
+    token, user = get_token_and_user
+    headers = {'Authorization': f'Bearer {token}', 'Accept': 'application/json'}
+    test_client.get(url_for('resources.products_in_cart'), headers=headers)
+    # аккаунт удалён другим воркером: в identity_cache этого процесса запись ещё жива
+    User.query.filter_by(id=user.id).delete()
+    session.commit()
+
+    response = test_client.post(
+        url_for('resources.upload_pic_user'), headers=headers,
+        data={'file': (make_image(), 'avatar.jpg')}, content_type='multipart/form-data')
+
+    assert response.status_code == 404
+    assert ImageJob.query.count() == 0
@@ -1,9 +1,11 @@
 import pytest
 
 from app.models.user import User
-from tests.conftest import create_user, test_app, test_client, new_db, session
+from app.passwords import HashingOverloaded
+from app.utils.identity import identity_cache, identity_key
+from tests.conftest import create_user, test_app, test_client, new_db, session, capture_statements
 from tests.api_v1.resources.conftest import get_token_and_user, create_users
-from flask import url_for
+from flask import Flask, url_for
 from flask.testing import FlaskClient
 from sqlalchemy.orm import Session
 
@@ -22,6 +24,45 @@ def test_get_user(test_client: FlaskClient, create_user: User, get_token_and_use
     assert response.get_json()['email'] == create_user.email
 
 
+def test_get_user_etag(test_client: FlaskClient, create_user: User, get_token_and_user: tuple,
+                       session: Session):
+    token, user = get_token_and_user
+    headers = {
+        'Authorization': f'Bearer {token}'
+    }
+    response = test_client.get(
+        url_for('resources.get_user', id=create_user.id), headers=headers)
+
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+
+    response = test_client.get(
+        url_for('resources.get_user', id=create_user.id),
+        headers={**headers, 'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+
+    other = User(email='other@mail.ru', username='other')
+    session.add(other)
+    other.follow(create_user)
+    session.commit()
+
+    response = test_client.get(
+        url_for('resources.get_user', id=create_user.id),
+        headers={**headers, 'If-None-Match': etag})
+
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.get_json()['followers_count'] == 1
+
+    response = test_client.get(
+        url_for('resources.get_user', id=create_user.id + 100),
+        headers={**headers, 'Accept': 'application/json'})
+
+    assert response.status_code == 404
+
+
 def test_get_users(test_client: FlaskClient, create_users: list, get_token_and_user: tuple):
     token = get_token_and_user[0]
 
@@ -251,9 +292,63 @@ def test_edit_password(test_client: FlaskClient, get_token_and_user: tuple, sess
     assert response.status_code == 200
 
 
+def test_current_user_identity_cache(test_client: FlaskClient, get_token_and_user: tuple, session: Session,
+                                     capture_statements):
+    token, user = get_token_and_user
+    headers = {'Authorization': f'Bearer {token}', 'Accept': 'application/json'}
+    test_client.get(url_for('resources.products_in_cart'), headers=headers)
+
+    with capture_statements() as statements:
+        response = test_client.get(url_for('resources.products_in_cart'), headers=headers)
+
+    assert response.status_code == 200
+    assert not any('FROM user' in statement for statement in statements)
+
+    response = test_client.put(url_for('resources.update_user'), json={'username': 'identity_renamed'},
+                               headers=headers)
 
+    assert response.status_code == 200
+    assert identity_cache.get(identity_key(user.id)) is None
+
+    test_client.get(url_for('resources.products_in_cart'), headers=headers)
+
+    assert identity_cache.get(identity_key(user.id)).username == 'identity_renamed'
+
+    response = test_client.delete(url_for('resources.delete_user'), headers=headers)
+
+    assert response.status_code == 200
 
+    response = test_client.get(url_for('resources.products_in_cart'), headers=headers)
 
+    assert response.status_code == 401
 
 
+def test_login_sheds_load_with_429(test_app: Flask, test_client: FlaskClient, create_user: User, mocker):
+    mocker.patch.object(test_app.password_hasher, 'verify', side_effect=HashingOverloaded('busy'))
+    create_user.password_hash = 'pbkdf2:sha256:1000$salt$hash'
 
+    response = test_client.post(url_for('resources.login_user'),
+                                json={'email': create_user.email, 'password': 'password'})
+
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '1'
+
+
+def test_login_slim_response(test_client: FlaskClient, create_user: User, session: Session, capture_statements):
+    create_user.set_password('password')
+    session.commit()
+    credentials = {'email': create_user.email, 'password': 'password'}
+
+    with capture_statements() as statements:
+        response = test_client.post(url_for('resources.login_user'), json=credentials)
+
+    assert response.status_code == 200
+    assert set(response.get_json()) == {'id', 'username', 'email', 'access_token', '_links'}
+    assert len(statements) == 1
+    assert 'about_me' not in statements[0]
+
+    response = test_client.post(url_for('resources.login_user', expand='profile'), json=credentials)
+
+    assert response.status_code == 200
+    assert response.get_json()['followers_count'] == 0
+    assert 'access_token' in response.get_json()
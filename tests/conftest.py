@@ -1,5 +1,6 @@
+from contextlib import contextmanager
 from decimal import Decimal
-from typing import Iterator
+from typing import Callable, ContextManager, Iterator, List
 import random
 import string
 import pytest
@@ -7,6 +8,7 @@ from flask import Flask
 from flask.testing import FlaskClient
 from flask_sqlalchemy import SQLAlchemy
 from flask_sqlalchemy.session import Session
+from sqlalchemy import event
 from app import create_app, db
 from app.models.product import Product
 from app.models.user import User
@@ -60,4 +62,16 @@ def create_product(session: Session) -> Product:
     return product
 
 
-
+@pytest.fixture(scope='function')
+def capture_statements(new_db: SQLAlchemy) -> Callable[[], ContextManager[List[str]]]:
+    # with capture_statements() as statements: — SQL, ушедший в базу внутри блока
+    @contextmanager
+    def capture() -> Iterator[List[str]]:
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+    return capture
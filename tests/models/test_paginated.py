@@ -1,6 +1,10 @@
+import pytest
 from app.models.user import User
 from sqlalchemy.orm import Session
 from app.models.product import Product
+from app import db
+from app.models.paginated import InvalidCursor, count_cache, decode_cursor, encode_cursor, \
+    planner_estimate
 from tests.conftest import session, create_user, create_product, new_db, test_app
 from flask_sqlalchemy import SQLAlchemy
 from flask.testing import FlaskClient
@@ -41,3 +45,84 @@ def test_to_collection_dict(session: Session, create_user: User,
     assert data['_links']['next'] is None
     assert data['_links']['prev'] is None
 
+
+
+def test_to_cursor_collection_dict(session: Session, create_user: User,
+                                   new_db: SQLAlchemy, test_app: FlaskClient) -> None:
+    user = create_user
+    products = [Product(name=f'product_{i}', price=i, author=user) for i in range(5)]
+    session.add_all(products)
+    session.commit()
+    expected = sorted(products, key=lambda p: (p.timestamp, p.id), reverse=True)
+
+    with test_app.test_request_context():
+        seen = []
+        cursor = ''
+        while cursor is not None:
+            data = Product.to_collection_dict(
+                Product.query, 1, 2, 'resources.get_products', cursor=cursor)
+            assert 'total_items' not in data['_meta']
+            assert data['_links']['prev'] is None
+            seen.extend(item['id'] for item in data['items'])
+            cursor = data['_meta']['next_cursor']
+            assert (data['_links']['next'] is None) == (cursor is None)
+
+    assert seen == [p.id for p in expected]
+
+    with test_app.test_request_context():
+        with pytest.raises(InvalidCursor):
+            Product.to_collection_dict(
+                Product.query, 1, 2, 'resources.get_products', cursor='garbage')
+
+
+@pytest.mark.parametrize('values', [[None], [{'a': 1}], [[1, 2]], ['x'], [True], [1, 2]])
+def test_decode_cursor_rejects_tampered_values(values: list) -> None:
+    with pytest.raises(InvalidCursor):
+        decode_cursor(encode_cursor(values), [User.id])
+
+
+@pytest.mark.parametrize('values', [[None, 1], ['not a date', 1], ['2023-01-01T00:00:00', '1']])
+def test_decode_cursor_rejects_tampered_keyset(values: list) -> None:
+    with pytest.raises(InvalidCursor):
+        decode_cursor(encode_cursor(values), [Product.timestamp, Product.id])
+
+
+def test_to_collection_dict_cached_count(session: Session, create_user: User,
+                                         new_db: SQLAlchemy, test_app: FlaskClient) -> None:
+    test_app.config['PAGINATION_COUNT'] = 'cached'
+    count_cache.clear()
+    try:
+        with test_app.test_request_context():
+            data = User.to_collection_dict(User.query, 1, 10, 'resources.get_users')
+            assert data['_meta']['total_items'] == 1
+            assert data['_meta']['total_exact'] is True
+
+            session.add(User(username='second', email='second@example.com'))
+            session.commit()
+
+            data = User.to_collection_dict(User.query, 1, 10, 'resources.get_users')
+            assert data['_meta']['total_items'] == 1
+            assert data['_meta']['total_exact'] is False
+            assert len(data['items']) == 2
+
+            data = User.to_collection_dict(
+                User.query.filter(User.username == 'second'), 1, 10, 'resources.get_users')
+            assert data['_meta']['total_items'] == 1
+            assert data['_meta']['total_exact'] is True
+    finally:
+        test_app.config['PAGINATION_COUNT'] = 'exact'
+        count_cache.clear()
+
+
+def test_planner_estimate_failure_keeps_transaction(session: Session, create_user: User,
+                                                    new_db: SQLAlchemy, test_app: FlaskClient, mocker) -> None:
+    # SQLite не знает EXPLAIN (FORMAT JSON): запрос падает так же, как упал бы в Postgres
+    mocker.patch.object(db.engine.dialect, 'name', 'postgresql')
+    product = Product(name='pending', price=1, author=create_user)
+    session.add(product)
+    session.flush()
+    savepoint = mocker.spy(db.session, 'begin_nested')
+
+    assert planner_estimate(Product.query) is None
+    assert savepoint.call_count == 1
+    assert Product.query.filter_by(name='pending').one() == product
@@ -1,7 +1,9 @@
+from decimal import Decimal
 from sqlalchemy.orm import Session
+from app.models.picture import Picture, PictureFormat
 from app.models.user import User
 from app.models.product import Product
-from tests.conftest import session, new_db, test_app, create_user, create_product
+from tests.conftest import session, new_db, test_app, create_user, create_product, capture_statements
 from flask.testing import FlaskClient
 from flask_sqlalchemy import SQLAlchemy
 
@@ -114,3 +116,61 @@ def test_from_dict(session: Session,
         assert product.price == 100
         assert product.description == 'Just an updated test product'
 
+
+
+def test_to_dict_batch(session: Session, test_app: FlaskClient, create_user: User,
+                       capture_statements) -> None:
+    user = create_user
+    products = [Product(name=f'product_{i}', price=i, author=user) for i in range(5)]
+    session.add_all(products)
+    session.commit()
+    picture = Picture(product_id=products[0].id)
+    session.add(picture)
+    session.commit()
+    session.add(PictureFormat(filename='a_300x300.jpg', format='300x300', picture_id=picture.id))
+    session.add(PictureFormat(filename='a_500x500.jpg', format='500x500', picture_id=picture.id))
+    products[1].add_to_cart(user)
+    session.commit()
+
+    for product in products:
+        session.refresh(product)
+    with test_app.test_request_context():
+        with capture_statements() as statements:
+            batch = Product.to_dict_batch(products)
+
+    # to_dict сам идёт через to_dict_batch, поэтому сверяемся с тем, что отдавал построчный to_dict
+    expected = [{
+        'id': product.id,
+        'name': f'product_{i}',
+        'price': Decimal(i),
+        'timestamp': product.timestamp,
+        'description': None,
+        'is_purchased': False,
+        'liked_count': 1 if i == 1 else 0,
+        '_links': {
+            'self': f'/api_v1/products/{product.id}/',
+            'liked_users': f'/api_v1/products/liked_users/{product.id}/',
+            'avatar_300x300': 'a_300x300.jpg' if i == 0 else '/static/product_pics/default_pic_product_300x300.png',
+            'avatar_500x500': 'a_500x500.jpg' if i == 0 else '/static/product_pics/default_pic_product_500x500.png',
+            'author': f'/api_v1/users/{user.id}/'
+        }
+    } for i, product in enumerate(products)]
+    assert batch == expected
+    assert len(statements) == 1
+
+
+def test_version(session: Session, create_user: User, create_product: Product) -> None:
+    product = create_product
+    assert product.version == 1
+
+    product.name = 'renamed'
+    session.commit()
+    assert product.version == 2
+
+    product.add_to_cart(create_user)
+    session.commit()
+    assert product.version == 3
+
+    session.add(Picture(product_id=product.id))
+    session.commit()
+    assert product.version == 4
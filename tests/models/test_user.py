@@ -1,10 +1,13 @@
 from time import sleep
 import pytest
-from flask import current_app
+from flask import Flask, current_app
 from flask_jwt_extended import decode_token
 import jwt
+from app.models.picture import Picture, PictureFormat
+from app.models.product import Product
+from app.models.search_outbox import SearchOutbox
 from app.models.user import User
-from tests.conftest import session, new_db, test_app, create_user, create_product
+from tests.conftest import session, new_db, test_app, create_user, create_product, capture_statements
 from sqlalchemy.orm import Session
 from flask.testing import FlaskClient
 from flask_sqlalchemy import SQLAlchemy
@@ -56,6 +59,58 @@ def test_to_dict(
         assert user_dict['email'] == user.email
 
 
+def test_to_dict_batch(session: Session, test_app: FlaskClient, create_user: User,
+                       capture_statements) -> None:
+    user = create_user
+    others = [User(username=f'user_{i}', email=f'user_{i}@example.com') for i in range(4)]
+    session.add_all(others)
+    session.commit()
+    for other in others[:2]:
+        other.follow(user)
+    user.follow(others[3])
+    product = Product(name='batch_product', price=1, author=others[0])
+    session.add(product)
+    session.commit()
+    product.add_to_cart(user)
+    picture = Picture(user_id=user.id)
+    session.add(picture)
+    session.commit()
+    session.add(PictureFormat(filename='u_50x50.jpg', format='50x50', picture_id=picture.id))
+    session.commit()
+
+    users = [user] + others
+    for u in users:
+        session.refresh(u)
+    with test_app.test_request_context():
+        with capture_statements() as statements:
+            batch = User.to_dict_batch(users)
+
+    # to_dict сам идёт через to_dict_batch, поэтому сверяемся с тем, что отдавал построчный to_dict
+    counts = {user.id: (0, 2, 1, 1), others[0].id: (1, 0, 1, 0), others[1].id: (0, 0, 1, 0),
+              others[2].id: (0, 0, 0, 0), others[3].id: (0, 1, 0, 0)}
+    expected = [{
+        'id': u.id,
+        'username': u.username,
+        'email': u.email,
+        'last_seen': u.last_seen.isoformat() + 'Z',
+        'about_me': None,
+        'product_count': counts[u.id][0],
+        'followers_count': counts[u.id][1],
+        'followed_count': counts[u.id][2],
+        'product_liked_count': counts[u.id][3],
+        '_links': {
+            'self': f'/api_v1/users/{u.id}/',
+            'followers': f'/api_v1/users/{u.id}/followers/',
+            'followed': f'/api_v1/users/{u.id}/followed/',
+            'products': f'/api_v1/products/user/{u.id}/',
+            'avatar_50x50': 'u_50x50.jpg' if u is user else '/static/profile_pics/default_pic_user_50x50.png',
+            'avatar_450x450': '/static/profile_pics/default_pic_user_450x450.png'
+        }
+    } for u in users]
+    assert batch == expected
+    assert len(statements) == 1
+
+
 def test_from_dict(
         session: Session, new_db: SQLAlchemy, test_app: FlaskClient, create_user: User) -> None:
     with test_app.app_context():
@@ -109,6 +164,20 @@ def test_authenticate(session: Session, create_user: User) -> None:
     assert non_existing_user is None
 
 
+def test_authenticate_rehashes_outdated_hash(session: Session, test_app: Flask, create_user: User, mocker) -> None:
+    user = create_user
+    user.set_password('password')
+    session.commit()
+    mocker.patch.object(test_app.password_hasher, 'method', 'pbkdf2:sha256:1000')
+    mocker.patch.object(test_app.password_hasher, 'prefix', 'pbkdf2:sha256:1000')
+    rehash = mocker.spy(test_app.password_hasher, 'hash')
+
+    assert User.authenticate(user.email, 'password') == user
+    assert user.password_hash.startswith('pbkdf2:sha256:1000$')
+    assert User.authenticate(user.email, 'password') == user
+    assert rehash.call_count == 1
+
+
 def test_follow(session: Session, create_user: User) -> None:
     user1 = create_user
     user2 = User(email='test@mail.ru', username='testuser')
@@ -185,3 +254,90 @@ def test_verify_reset_password_token(session: Session, create_user: User) -> Non
 
 
 
+
+
+def test_counters(session: Session, create_user: User) -> None:
+    user1 = create_user
+    user2 = User(email='test@mail.ru', username='testuser')
+    user1.follow(user2)
+    product = Product(name='counted', price=1, author=user2)
+    session.add(product)
+    session.commit()
+    product.add_to_cart(user1)
+    session.commit()
+
+    assert (user1.followed_count, user1.followers_count) == (1, 0)
+    assert (user2.followed_count, user2.followers_count) == (0, 1)
+    assert user2.product_count == 1
+    assert user1.product_liked_count == 1
+    assert product.liked_count == 1
+
+    user1.unfollow(user2)
+    product.remove_from_cart(user1)
+    session.commit()
+
+    assert user1.followed_count == 0
+    assert user2.followers_count == 0
+    assert user1.product_liked_count == 0
+    assert product.liked_count == 0
+
+    product.add_to_cart(user1)
+    session.commit()
+    session.delete(product)
+    session.commit()
+
+    assert user2.product_count == 0
+    assert user1.product_liked_count == 0
+
+
+def test_recount(session: Session, create_user: User) -> None:
+    from app.models.counters import recount
+    user1 = create_user
+    user2 = User(email='test@mail.ru', username='testuser')
+    user1.follow(user2)
+    session.commit()
+    user1.followed_count = 5
+    user2.followers_count = 0
+    session.commit()
+
+    repaired = recount()
+
+    assert repaired['user.followed_count'] == 1
+    assert repaired['user.followers_count'] == 1
+    assert repaired['product.liked_count'] == 0
+    assert user1.followed_count == 1
+    assert user2.followers_count == 1
+
+
+def test_commit_without_searchable_changes_skips_outbox(
+        session: Session, test_app: FlaskClient, create_user: User) -> None:
+    SearchOutbox.query.delete()
+    user1 = create_user
+    user2 = User(email='test@mail.ru', username='testuser')
+    session.add(user2)
+    session.commit()
+    assert SearchOutbox.query.filter_by(index='user').count() == 1
+
+    user1.follow(user2)
+    user1.set_password('password')
+    session.commit()
+    assert SearchOutbox.query.count() == 1
+
+    user1.username = 'renamed'
+    session.commit()
+    assert [(entry.doc_id, entry.operation) for entry in SearchOutbox.query.order_by(SearchOutbox.id)] == \
+        [(user2.id, 'index'), (user1.id, 'index')]
+
+
+def test_source_mode_reindexes_on_counter_changes(
+        session: Session, test_app: FlaskClient, create_user: User, mocker) -> None:
+    mocker.patch.dict(test_app.config, {'SEARCH_FROM_SOURCE': True})
+    user1 = create_user
+    user2 = User(email='test@mail.ru', username='testuser')
+    session.add(user2)
+    session.commit()
+    SearchOutbox.query.delete()
+
+    user1.follow(user2)
+    session.commit()
+    assert sorted(entry.doc_id for entry in SearchOutbox.query) == sorted([user1.id, user2.id])
@@ -0,0 +1,68 @@
+from time import sleep
+from flask import Flask
+from app.cache import TTLCache, NullCache, cached_response, invalidate
+from app.models.cached import CachedMixin
+from tests.conftest import test_app
+
+
+def test_ttl_cache_expiry() -> None:
+    cache = TTLCache(max_entries=10, ttl=0.05)
+    cache.set('key', 'value')
+
+    assert cache.get('key') == 'value'
+
+    sleep(0.1)
+
+    assert cache.get('key') is None
+
+
+def test_ttl_cache_lru_eviction() -> None:
+    cache = TTLCache(max_entries=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+
+
+def test_ttl_cache_incr() -> None:
+    cache = TTLCache(max_entries=10, ttl=0.01)
+
+    assert cache.incr('generation') == 1
+    sleep(0.02)
+    assert cache.incr('generation') == 2
+
+
+def test_null_cache() -> None:
+    cache = NullCache()
+    cache.set('key', 'value')
+
+    assert cache.get('key') is None
+
+
+def test_cached_response_invalidation(test_app: Flask) -> None:
+    calls = []
+
+    def build() -> dict:
+        calls.append(1)
+        return {'calls': len(calls)}
+
+    with test_app.test_request_context():
+        test_app.cache.clear()
+        assert cached_response('test', 'key', build).get_json() == {'calls': 1}
+        assert cached_response('test', 'key', build).get_json() == {'calls': 1}
+
+        invalidate('test')
+
+        assert cached_response('test', 'key', build).get_json() == {'calls': 2}
+
+
+
+def test_cache_namespaces_default() -> None:
+    obj = CachedMixin()
+    obj.__tablename__, obj.id = 'thumbnail', 7
+
+    assert obj.cache_namespaces() == ['thumbnail:7']
@@ -0,0 +1,61 @@
+import time
+import pytest
+from flask import Flask
+from app.passwords import HashingOverloaded, PasswordHasher
+
+
+def make_hasher(workers: int, queue: int = 0, method: str = 'pbkdf2:sha256:1000',
+                timeout: float = 10) -> PasswordHasher:
+    app = Flask(__name__)
+    app.config.update(PASSWORD_HASH_METHOD=method, PASSWORD_HASH_WORKERS=workers,
+                      PASSWORD_HASH_QUEUE=queue, PASSWORD_HASH_TIMEOUT=timeout)
+    return PasswordHasher(app)
+
+
+def test_hasher_runs_in_process_pool() -> None:
+    hasher = make_hasher(workers=1)
+    try:
+        pwhash = hasher.hash('secret')
+
+        assert pwhash.startswith('pbkdf2:sha256:1000$')
+        assert hasher.verify(pwhash, 'secret')
+        assert not hasher.verify(pwhash, 'wrong')
+        assert hasher.executor is not None
+    finally:
+        hasher.executor.shutdown()
+
+
+def test_hasher_sheds_when_queue_is_full() -> None:
+    hasher = make_hasher(workers=1)
+    hasher.slots.acquire()
+
+    with pytest.raises(HashingOverloaded):
+        hasher.hash('secret')
+
+    assert hasher.executor is None
+
+
+def test_hasher_gives_up_after_timeout() -> None:
+    hasher = make_hasher(workers=1, timeout=0.05)
+    try:
+        with pytest.raises(HashingOverloaded):
+            hasher._call(time.sleep, 1)
+    finally:
+        hasher.executor.shutdown()
+
+    assert hasher.slots.acquire(blocking=False)
+
+
+def test_hasher_needs_rehash() -> None:
+    hasher = make_hasher(workers=0)
+
+    assert not hasher.needs_rehash(hasher.hash('secret'))
+    assert make_hasher(workers=0, method='pbkdf2:sha256:2000').needs_rehash(hasher.hash('secret'))
+
+
+def test_hasher_needs_rehash_with_werkzeug_defaults() -> None:
+    hasher = make_hasher(workers=0, method='pbkdf2:sha256')
+
+    assert hasher.prefix == 'pbkdf2:sha256:600000'
+    assert not hasher.needs_rehash(hasher.hash('secret'))
+    assert hasher.needs_rehash(make_hasher(workers=0).hash('secret'))
@@ -0,0 +1,173 @@
+from datetime import datetime
+from decimal import Decimal
+from unittest.mock import MagicMock
+from app.search_backends import FACET_SIZE, ElasticsearchBackend, ElasticsearchHealth, SqliteSearchBackend, alias_of
+
+SCHEMA = {'user': {'searchable': ['username'], 'boosts': {}, 'fields': {}},
+          'product': {'searchable': ['name'], 'boosts': {'name': 2.0},
+                      'fields': {'price': {'type': 'scaled_float', 'scaling_factor': 100}}}}
+
+
+def make_backend() -> SqliteSearchBackend:
+    backend = SqliteSearchBackend(':memory:', SCHEMA)
+    backend.bulk([
+        {'_op_type': 'index', '_index': 'user', '_id': 1, '_source': {'username': 'red fox'}},
+        {'_op_type': 'index', '_index': 'product', '_id': 1, '_source': {
+            'name': 'Red chair', 'price': Decimal('10.50'), 'timestamp': datetime(2026, 1, 2, 3, 4, 5)}},
+        {'_op_type': 'index', '_index': 'product', '_id': 2, '_source': {'name': 'blue table'}},
+    ])
+    return backend
+
+
+def test_alias_of() -> None:
+    assert alias_of('product') == 'product'
+    assert alias_of('product_20261018120000') == 'product'
+    assert alias_of('user') == 'user'
+
+
+def test_sqlite_search_across_indices() -> None:
+    backend = make_backend()
+
+    hits, total, aggregations = backend.search(['user', 'product'], 'red', ['name', 'username'], 1, 10)
+    assert total == 2
+    assert sorted((hit['_index'], hit['_id']) for hit in hits) == [('product', '1'), ('user', '1')]
+    assert sorted(bucket['key'] for bucket in aggregations['type']) == ['product', 'user']
+
+    hits, total, _ = backend.search(['user', 'product'], 'red', ['name', 'username'], 2, 1)
+    assert total == 2
+    assert len(hits) == 1
+
+    hits, _, _ = backend.search(['product'], 'CHAIR', ['name'], 1, 10, source=True)
+    assert hits == [{'_index': 'product', '_id': '1', '_source': {
+        'name': 'Red chair', 'price': '10.50', 'timestamp': '2026-01-02T03:04:05'}}]
+
+
+def test_sqlite_search_escapes_query_syntax() -> None:
+    backend = make_backend()
+
+    assert backend.search(['product'], 'table" OR name:*', ['name'], 1, 10)[1] == 1
+    assert backend.search(['product'], '***', ['name'], 1, 10) == ([], 0, {'type': []})
+
+
+def test_sqlite_bulk_replaces_and_deletes() -> None:
+    backend = make_backend()
+    backend.bulk([
+        {'_op_type': 'index', '_index': 'product', '_id': 1, '_source': {'name': 'green chair'}},
+        {'_op_type': 'delete', '_index': 'product', '_id': 2},
+    ])
+
+    assert backend.search(['product'], 'red', ['name'], 1, 10)[1] == 0
+    assert backend.search(['product'], 'green', ['name'], 1, 10)[1] == 1
+    assert backend.search(['product'], 'table', ['name'], 1, 10)[1] == 0
+
+
+def test_sqlite_rebuild_swaps_table() -> None:
+    backend = make_backend()
+    chunks = [[(10, {'name': 'new lamp'}), (11, {'name': 'new sofa'})], [(12, {'name': 'new desk'})]]
+
+    assert list(backend.rebuild('product', iter(chunks))) == [2, 1]
+    assert backend.search(['product'], 'chair', ['name'], 1, 10)[1] == 0
+    assert backend.search(['product'], 'new', ['name'], 1, 10)[1] == 3
+
+
+def test_sqlite_search_filters_and_facets() -> None:
+    schema = {'product': dict(SCHEMA['product'], fields={
+        'price': {'type': 'scaled_float', 'scaling_factor': 100}, 'is_purchased': {'type': 'boolean'}},
+        facets={'price': {'type': 'histogram', 'interval': 100}, 'is_purchased': {'type': 'terms'}})}
+    backend = SqliteSearchBackend(':memory:', schema)
+    backend.bulk([{'_op_type': 'index', '_index': 'product', '_id': doc_id, '_source': {
+        'name': f'chair {doc_id}', 'price': Decimal(price), 'is_purchased': purchased}}
+        for doc_id, price, purchased in ((1, '50', False), (2, '150', True), (3, '170', False), (4, '420', False))])
+
+    hits, total, aggregations = backend.search(['product'], 'chair', ['name'], 1, 10,
+                                               filters={'price': {'gte': 100, 'lte': 400}})
+    assert total == 2
+    assert sorted(hit['_id'] for hit in hits) == ['2', '3']
+    assert aggregations['price'] == [{'key': 100, 'count': 2}]
+    assert aggregations['is_purchased'] == [{'key': False, 'count': 1}, {'key': True, 'count': 1}]
+
+    _, total, aggregations = backend.search(['product'], 'chair', ['name'], 1, 10, filters={'is_purchased': False})
+    assert total == 3
+    assert aggregations['price'] == [{'key': 0, 'count': 1}, {'key': 100, 'count': 1}, {'key': 400, 'count': 1}]
+
+
+def test_terms_facet_default_size_matches_across_backends() -> None:
+    schema = {'product': dict(SCHEMA['product'], fields={'user_id': {'type': 'integer'}},
+                              facets={'user_id': {'type': 'terms'}})}
+    backend = SqliteSearchBackend(':memory:', schema)
+    backend.bulk([{'_op_type': 'index', '_index': 'product', '_id': doc_id, '_source': {
+        'name': f'chair {doc_id}', 'user_id': doc_id}} for doc_id in range(1, FACET_SIZE + 6)])
+
+    _, total, aggregations = backend.search(['product'], 'chair', ['name'], 1, 10)
+    assert total == FACET_SIZE + 5
+    assert len(aggregations['user_id']) == FACET_SIZE
+
+    es_backend = ElasticsearchBackend(MagicMock(), ElasticsearchHealth(None), schema)
+    assert es_backend.aggregations_body(['product'])['user_id'] == {
+        'terms': {'field': 'user_id', 'size': FACET_SIZE}}
+
+
+def test_elasticsearch_search_filters_and_aggregations() -> None:
+    client = MagicMock()
+    client.search.return_value = {'hits': {'hits': [], 'total': {'value': 3}}, 'aggregations': {
+        'type': {'buckets': [{'key': 'product_20261018120000', 'doc_count': 3}]},
+        'price': {'buckets': [{'key': 100.0, 'doc_count': 3}]}}}
+    schema = {'product': dict(SCHEMA['product'], facets={'price': {'type': 'histogram', 'interval': 100}})}
+    backend = ElasticsearchBackend(client, ElasticsearchHealth(client), schema)
+
+    _, total, aggregations = backend.search(['product'], 'chair', ['name'], 1, 10,
+                                            filters={'price': {'gte': 100}, 'is_purchased': False})
+    assert total == 3
+    assert aggregations == {'type': [{'key': 'product', 'count': 3}], 'price': [{'key': 100, 'count': 3}]}
+    body = client.search.call_args.kwargs['body']
+    assert body['query']['bool']['filter'] == [{'range': {'price': {'gte': 100}}}, {'term': {'is_purchased': False}}]
+    assert body['aggs']['price'] == {'histogram': {'field': 'price', 'interval': 100, 'min_doc_count': 1}}
+
+
+def test_sqlite_suggest_prefix() -> None:
+    backend = make_backend()
+
+    assert backend.suggest(['user', 'product'], 'bl', 10) == [{'_index': 'product', '_id': '2', 'text': 'blue table'}]
+    assert {hit['text'] for hit in backend.suggest(['user', 'product'], 're', 10)} == {'red fox', 'Red chair'}
+    assert backend.suggest(['user', 'product'], 'red ch', 10) == [{'_index': 'product', '_id': '1', 'text': 'Red chair'}]
+    assert backend.suggest(['user', 'product'], 're', 1)[0]['text'] in ('red fox', 'Red chair')
+    assert backend.suggest(['product'], '"', 10) == []
+
+
+def test_elasticsearch_suggest_uses_search_as_you_type_fields() -> None:
+    client = MagicMock()
+    client.search.return_value = {'hits': {'hits': [
+        {'_index': 'product_20261018120000', '_id': '7', '_source': {'name': 'Red chair'}}]}}
+    backend = ElasticsearchBackend(client, ElasticsearchHealth(client), SCHEMA)
+
+    assert backend.suggest(['product'], 'red ch', 5) == [{'_index': 'product', '_id': '7', 'text': 'Red chair'}]
+    body = client.search.call_args.kwargs['body']
+    assert body['query']['multi_match']['type'] == 'bool_prefix'
+    assert body['query']['multi_match']['fields'] == ['name.suggest', 'name.suggest._2gram', 'name.suggest._3gram']
+    assert backend.mappings('product')['properties']['name']['fields']['suggest']['type'] == 'search_as_you_type'
+
+
+def test_elasticsearch_mappings_and_init() -> None:
+    client = MagicMock()
+    client.indices.exists_alias.side_effect = lambda name: name == 'user'
+    client.indices.exists.return_value = False
+    backend = ElasticsearchBackend(client, ElasticsearchHealth(client), SCHEMA)
+
+    mappings = backend.mappings('product')
+    assert mappings['dynamic'] is False
+    assert mappings['properties']['name']['fields']['keyword']['type'] == 'keyword'
+    assert mappings['properties']['price'] == {'type': 'scaled_float', 'scaling_factor': 100}
+
+    assert backend.init() == {'user': 'exists', 'product': 'created'}
+    assert client.indices.put_index_template.call_count == 2
+    assert client.indices.create.call_args.kwargs['aliases'] == {'product': {}}
+
+
+def test_sqlite_init_recreates_outdated_table() -> None:
+    backend = SqliteSearchBackend(':memory:', {'product': {'searchable': ['name'], 'boosts': {}, 'fields': {}}})
+    backend.bulk([{'_op_type': 'index', '_index': 'product', '_id': 1, '_source': {'name': 'chair'}}])
+    backend.schema = SCHEMA
+
+    assert backend.init() == {'user': 'created', 'product': 'created'}
+    assert backend.init() == {'user': 'exists', 'product': 'exists'}
+    assert backend.search(['product'], 'chair', ['name'], 1, 10)[:2] == ([], 0)
@@ -0,0 +1,98 @@
+import os
+from flask import Flask
+from sqlalchemy.orm import Session
+from app import db
+from app.models.counters import recount
+from app.models.image_job import ImageJob
+from app.models.picture import Picture, PictureFormat
+from app.models.product import Product, cart
+from app.models.search_outbox import SearchOutbox
+from app.models.user import User, followers
+from app.utils.accounts import delete_user_account
+from app.utils.image_jobs import process_image_job
+from tests.conftest import session, new_db, test_app, capture_statements
+
+
+def make_account(session: Session, name: str, products: int) -> User:
+    user = User(username=name, email=f'{name}@mail.ru')
+    session.add(user)
+    session.add(Picture(user=user, formats=[PictureFormat(filename=f'{name}.png', format='50x50')]))
+    for i in range(products):
+        product = Product(name=f'{name} product {i}', price=1, author=user)
+        session.add(Picture(product=product, formats=[PictureFormat(filename=f'{name}_{i}.png', format='300x300')]))
+    session.commit()
+    return user
+
+
+def test_delete_user_account(session: Session, test_app: Flask, mocker) -> None:
+    user = make_account(session, 'leaving', products=2)
+    fan = make_account(session, 'fan', products=0)
+    idol = make_account(session, 'idol', products=1)
+    fan.follow(user)
+    user.follow(idol)
+    user.products[0].add_to_cart(fan)
+    idol.products[0].add_to_cart(user)
+    session.commit()
+    user_id, fan_version, idol_product = user.id, fan.version, idol.products[0]
+    SearchOutbox.query.delete()
+    session.commit()
+    sweep = mocker.patch.object(test_app.image_jobs, 'sweep')
+
+    delete_user_account(user_id)
+
+    assert db.session.get(User, user_id) is None
+    assert Product.query.filter_by(user_id=user_id).count() == 0
+    assert Picture.query.count() == PictureFormat.query.count() == 3
+    assert db.session.query(cart).count() == 0
+    assert db.session.query(followers).count() == 0
+    assert (fan.followed_count, fan.product_liked_count) == (0, 0)
+    assert fan.version > fan_version
+    assert idol.followers_count == 0
+    assert idol_product.liked_count == 0
+    assert all(repaired == 0 for repaired in recount().values())
+    assert sorted(path.rsplit('/', 1)[1] for path in sweep.call_args.args[0]) == [
+        'leaving.png', 'leaving_0.png', 'leaving_1.png']
+    assert sorted((entry.index, entry.operation) for entry in SearchOutbox.query) == [
+        ('product', 'delete'), ('product', 'delete'), ('user', 'delete')]
+
+
+def test_delete_user_account_query_count_is_constant(session: Session, test_app: Flask,
+                                                     capture_statements, mocker) -> None:
+    mocker.patch.object(test_app.image_jobs, 'sweep')
+    small = make_account(session, 'small', products=1)
+    large = make_account(session, 'large', products=20)
+
+    with capture_statements() as small_statements:
+        delete_user_account(small.id)
+    with capture_statements() as large_statements:
+        delete_user_account(large.id)
+
+    assert len(small_statements) == len(large_statements)
+
+
+def test_delete_user_account_with_pending_upload(session: Session, test_app: Flask, tmp_path, mocker) -> None:
+    user = make_account(session, 'uploader', products=1)
+    mocker.patch('app.utils.accounts.picture_path', side_effect=lambda category, filename: str(tmp_path / filename))
+    os.makedirs(test_app.config['UPLOAD_STAGING_FOLDER'], exist_ok=True)
+    sources = [os.path.join(test_app.config['UPLOAD_STAGING_FOLDER'], f'pending_{i}.png') for i in range(2)]
+    for path in sources + [str(tmp_path / 'uploader.png')]:
+        with open(path, 'wb') as file:
+            file.write(b'image')
+    jobs = [ImageJob(category='profile', owner_id=user.id, source_path=sources[0]),
+            ImageJob(category='product', owner_id=user.id, product_id=user.products[0].id,
+                     source_path=sources[1], status='processing')]
+    session.add_all(jobs)
+    session.commit()
+    job_ids = [job.id for job in jobs]
+
+    delete_user_account(user.id)
+
+    assert ImageJob.query.count() == 0
+    # исходники задач удаляются сразу, свежая аватарка ждёт IMAGE_GC_GRACE и сборщика
+    assert not any(os.path.exists(path) for path in sources)
+    assert os.path.exists(tmp_path / 'uploader.png')
+    # воркер, уже захвативший задачу, не находит её и просто выходит
+    mocker.patch('app.utils.image_jobs.claim_job', return_value=True)
+    for job_id in job_ids:
+        process_image_job(job_id)
+    assert Picture.query.count() == 0
@@ -0,0 +1,40 @@
+import os
+from datetime import timedelta
+from time import time
+from flask import Flask
+from sqlalchemy.orm import Session
+from app.models.picture import Picture, PictureFormat
+from app.utils.image_gc import collect_orphans
+from tests.conftest import session, new_db, test_app, create_user
+
+
+def touch(path: str, age: float = 0) -> str:
+    with open(path, 'wb') as file:
+        file.write(b'image')
+    os.utime(path, (time() - age, time() - age))
+    return path
+
+
+def test_collect_orphans(session: Session, test_app: Flask, create_user, tmp_path, mocker) -> None:
+    mocker.patch.object(test_app, 'root_path', str(tmp_path))
+    profile_pics = tmp_path / 'static' / 'profile_pics'
+    product_pics = tmp_path / 'static' / 'product_pics'
+    profile_pics.mkdir(parents=True)
+    product_pics.mkdir(parents=True)
+    session.add(Picture(user=create_user, formats=[PictureFormat(filename='kept_50x50.jpg', format='50x50')]))
+    session.commit()
+    kept = touch(str(profile_pics / 'kept_50x50.jpg'), age=7200)
+    default = touch(str(profile_pics / 'default_pic_user_50x50.png'), age=7200)
+    fresh = touch(str(product_pics / 'fresh_300x300.jpg'))
+    orphans = [touch(str(folder / f'orphan_{i}.jpg'), age=7200) for folder in (profile_pics, product_pics)
+               for i in range(3)]
+
+    assert collect_orphans(batch_size=2, grace=timedelta(hours=1), dry_run=True) == 6
+    assert all(os.path.exists(path) for path in orphans)
+
+    assert collect_orphans(batch_size=2, grace=timedelta(hours=1)) == 6
+    assert not any(os.path.exists(path) for path in orphans)
+    assert all(os.path.exists(path) for path in (kept, default, fresh))
+
+    assert collect_orphans(grace=timedelta(0)) == 1
+    assert not os.path.exists(fresh)
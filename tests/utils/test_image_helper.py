@@ -1,7 +1,12 @@
+import os
 import pytest
+from datetime import timedelta
+from time import time
 from werkzeug.exceptions import RequestEntityTooLarge
 from app.models.picture import Picture
-from app.utils.image_helper import save_picture, check_file_size
+from app.utils import image_helper
+from app.utils.image_helper import save_picture, check_file_size, make_thumbnails, replace_picture, \
+    delete_pictures, unreferenced_files
 from app.models.user import User
 from app.models.product import Product
 from tests.conftest import create_product, create_user, session, new_db, test_app
@@ -71,3 +76,129 @@ def test_check_file_size_large_file(
 
     with pytest.raises(RequestEntityTooLarge):
         check_file_size(file)
+
+
+def test_make_thumbnails(mocker: MockerFixture) -> None:
+    source = io.BytesIO()
+    Image.new('RGB', size=(1600, 1200), color=(73, 109, 137)).save(source, format='JPEG')
+    source.seek(0, io.SEEK_END)
+    image_open = mocker.spy(Image, 'open')
+
+    thumbnails = make_thumbnails(source, ((50, 50), (450, 450)))
+
+    assert image_open.call_count == 1
+    assert [size for size, _ in thumbnails] == [(450, 450), (50, 50)]
+    assert thumbnails[0][1].size == (450, 338)
+    assert thumbnails[1][1].size == (50, 38)
+
+
+def test_save_picture_leaves_written_files_to_gc_on_error(
+        session: Session, mocker: MockerFixture, create_user: User, tmp_path) -> None:
+    mocker.patch('app.utils.image_helper.picture_path',
+                 side_effect=lambda category, filename: str(tmp_path / filename))
+    original_save = Image.Image.save
+    calls = []
+
+    def failing_save(image, fp, *args, **kwargs):
+        calls.append(fp)
+        if len(calls) > 2:
+            raise OSError('disk full')
+        return original_save(image, fp, *args, **kwargs)
+
+    mocker.patch('PIL.Image.Image.save', failing_save)
+    source = io.BytesIO()
+    Image.new('RGB', size=(600, 600)).save(source, format='PNG')
+    file_picture = FileStorage(stream=source, filename='test.png')
+
+    with pytest.raises(Exception):
+        save_picture(file_picture, create_user, 'profile', ((50, 50), (450, 450)))
+
+    assert len(calls) == 3
+    written = [str(path) for path in tmp_path.iterdir()]
+    assert len(written) == 1
+    assert unreferenced_files(written) == []
+    assert unreferenced_files(written, grace=timedelta(0)) == written
+
+
+def test_replace_picture(session: Session, mocker: MockerFixture, create_user: User, tmp_path) -> None:
+    mocker.patch('app.utils.image_helper.picture_path',
+                 side_effect=lambda category, filename: str(tmp_path / filename))
+    commits = mocker.spy(session, 'commit')
+
+    def upload() -> FileStorage:
+        source = io.BytesIO()
+        Image.new('RGB', size=(600, 600)).save(source, format='PNG')
+        return FileStorage(stream=source, filename='test.png')
+
+    first = replace_picture(upload(), create_user, 'profile')
+    first_files = sorted(path.name for path in tmp_path.iterdir())
+    second = replace_picture(upload(), create_user, 'profile')
+
+    assert commits.call_count == 2
+    assert len(first_files) == 2
+    assert sorted(path.name for path in tmp_path.iterdir()) == \
+        sorted(pic_format.filename for pic_format in second.formats)
+    assert Picture.query.filter_by(user_id=create_user.id).all() == [second]
+
+
+def test_save_picture_deduplicates_uploads(session: Session, mocker: MockerFixture, tmp_path) -> None:
+    mocker.patch('app.utils.image_helper.picture_path',
+                 side_effect=lambda category, filename: str(tmp_path / filename))
+    user = User(username='seller', email='seller@mail.ru')
+    first_product = Product(name='first', price=1, author=user)
+    second_product = Product(name='second', price=1, author=user)
+    session.add_all([first_product, second_product])
+    session.commit()
+
+    def upload() -> FileStorage:
+        source = io.BytesIO()
+        Image.new('RGB', size=(600, 600), color=(10, 20, 30)).save(source, format='PNG')
+        return FileStorage(stream=source, filename='listing.PNG')
+
+    first = replace_picture(upload(), first_product, 'product')
+    thumbnails = mocker.spy(image_helper, 'make_thumbnails')
+    second = replace_picture(upload(), second_product, 'product')
+
+    assert thumbnails.call_count == 0
+    assert sorted(f.filename for f in first.formats) == sorted(f.filename for f in second.formats)
+    assert all(f.filename.endswith(('_300x300.png', '_500x500.png')) for f in second.formats)
+    assert len(list(tmp_path.iterdir())) == 2
+
+    files = delete_pictures(first_product, 'product')
+    session.commit()
+
+    assert unreferenced_files(files) == []
+
+    files = delete_pictures(second_product, 'product')
+    session.commit()
+
+    assert unreferenced_files(files) == []
+    assert sorted(unreferenced_files(files, grace=timedelta(0))) == sorted(files)
+
+
+def test_reused_file_survives_sweep_before_commit(session: Session, mocker: MockerFixture, tmp_path) -> None:
+    mocker.patch('app.utils.image_helper.picture_path',
+                 side_effect=lambda category, filename: str(tmp_path / filename))
+    user = User(username='seller', email='seller@mail.ru')
+    first_product = Product(name='first', price=1, author=user)
+    second_product = Product(name='second', price=1, author=user)
+    session.add_all([first_product, second_product])
+    session.commit()
+
+    def upload() -> FileStorage:
+        source = io.BytesIO()
+        Image.new('RGB', size=(600, 600), color=(10, 20, 30)).save(source, format='PNG')
+        return FileStorage(stream=source, filename='listing.png')
+
+    replace_picture(upload(), first_product, 'product')
+    for path in tmp_path.iterdir():
+        os.utime(path, (time() - 7200, time() - 7200))
+
+    # вторая загрузка уже решила переиспользовать файлы, но её строки ещё не закоммичены
+    save_picture(upload(), second_product, 'product', ((300, 300), (500, 500)))
+    session.rollback()
+    files = delete_pictures(first_product, 'product')
+    session.commit()
+
+    assert len(files) == 2
+    assert unreferenced_files(files) == []
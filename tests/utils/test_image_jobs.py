@@ -0,0 +1,73 @@
+import io
+import os
+from flask import Flask
+from PIL import Image
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
+from werkzeug.datastructures import FileStorage
+from app.models.image_job import ImageJob
+from app.models.picture import Picture, PictureFormat
+from app.models.user import User
+from app.utils import image_jobs
+from app.utils.accounts import delete_user_account
+from app.utils.image_jobs import enqueue_picture, process_image_job
+from tests.conftest import session, new_db, test_app, create_user
+
+
+def upload(content: bytes = None) -> FileStorage:
+    if content is None:
+        source = io.BytesIO()
+        Image.new('RGB', size=(600, 600)).save(source, format='PNG')
+        content = source.getvalue()
+    return FileStorage(stream=io.BytesIO(content), filename='avatar.png')
+
+
+def test_failed_job_removes_staging_file(session: Session, test_app: Flask, create_user: User) -> None:
+    job = enqueue_picture(upload(b'not an image'), owner_id=create_user.id, category='profile')
+
+    assert job.status == 'failed'
+    assert not os.path.exists(job.source_path)
+
+
+def test_job_deleted_with_its_owner_is_skipped(session: Session, test_app: Flask, create_user: User,
+                                               mocker) -> None:
+    mocker.patch.object(test_app.image_jobs, 'submit')
+    job = enqueue_picture(upload(), owner_id=create_user.id, category='profile')
+    job_id, source_path = job.id, job.source_path
+    mocker.patch('app.utils.image_jobs.claim_job', return_value=True)
+    delete_user_account(create_user.id)
+
+    process_image_job(job_id)
+
+    assert session.get(ImageJob, job_id) is None
+    assert Picture.query.count() == 0
+    assert not os.path.exists(source_path)
+
+
+def test_owner_deleted_while_processing_discards_picture(session: Session, test_app: Flask, create_user: User,
+                                                          mocker) -> None:
+    mocker.patch.object(test_app.image_jobs, 'submit')
+    sweep = mocker.patch.object(test_app.image_jobs, 'sweep')
+    job = enqueue_picture(upload(), owner_id=create_user.id, category='profile')
+    job_id, source_path = job.id, job.source_path
+    original_replace = image_jobs.replace_picture
+
+    def replace_after_delete(*args, **kwargs):
+        # удаление аккаунта уже стёрло задачу, а воркер успел загрузить владельца: картинка коммитится
+        session.execute(delete(ImageJob).where(ImageJob.id == job_id),
+                        execution_options={'synchronize_session': False})
+        return original_replace(*args, **kwargs)
+
+    mocker.patch('app.utils.image_jobs.replace_picture', side_effect=replace_after_delete)
+    staged = lambda category, filename: os.path.join(test_app.config['UPLOAD_STAGING_FOLDER'], filename)
+    mocker.patch('app.utils.image_helper.picture_path', side_effect=staged)
+    mocker.patch('app.utils.image_jobs.picture_path', side_effect=staged)
+
+    process_image_job(job_id)
+
+    assert ImageJob.query.count() == 0
+    assert Picture.query.count() == PictureFormat.query.count() == 0
+    assert not os.path.exists(source_path)
+    assert len(sweep.call_args.args[0]) == 2
+    for path in sweep.call_args.args[0]:
+        os.remove(path)
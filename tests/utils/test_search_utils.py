@@ -0,0 +1,164 @@
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+import pytest
+from flask import Flask
+from sqlalchemy.orm import Session
+from app.models.product import Product
+from app.models.search_outbox import SearchOutbox
+from app.models.user import User
+from app.search_backends import ElasticsearchBackend, ElasticsearchHealth
+from app.utils.search import drain_outbox, search_multiple_models
+from tests.conftest import session, new_db, test_app, create_user, capture_statements
+
+
+def test_health_caches_ping() -> None:
+    client = MagicMock()
+    client.ping.return_value = True
+    health = ElasticsearchHealth(client, refresh_interval=60)
+
+    assert health.available()
+    assert health.available()
+    assert client.ping.call_count == 1
+
+
+def test_health_without_client() -> None:
+    assert not ElasticsearchHealth(None).available()
+
+
+def test_health_circuit_breaker() -> None:
+    client = MagicMock()
+    client.ping.side_effect = ConnectionError('refused')
+    health = ElasticsearchHealth(client, refresh_interval=0, failure_threshold=2, reset_timeout=60)
+
+    assert not health.available()
+    assert not health.available()
+    assert client.ping.call_count == 2
+
+    assert not health.available()
+    assert client.ping.call_count == 2
+
+    health.record_success()
+    client.ping.side_effect = None
+    client.ping.return_value = True
+
+    assert health.available()
+
+
+@pytest.fixture(scope='function')
+def es_backend(session: Session, test_app: Flask, mocker) -> ElasticsearchBackend:
+    health = ElasticsearchHealth(MagicMock())
+    mocker.patch.object(health, 'available', return_value=True)
+    backend = ElasticsearchBackend(health.client, health, test_app.search_backend.schema)
+    mocker.patch.object(test_app, 'search_backend', backend)
+    SearchOutbox.query.delete()
+    return backend
+
+
+def test_drain_outbox_bulk_indexes_latest_operations(
+        session: Session, es_backend: ElasticsearchBackend, mocker) -> None:
+    bulk = mocker.patch('app.search_backends.helpers.bulk', side_effect=lambda client, actions, **kwargs: (
+        len(list(actions)), []))
+    user = User(username='outbox', email='outbox@mail.ru')
+    session.add(user)
+    session.commit()
+    user.username = 'outbox_renamed'
+    session.commit()
+    gone = User(username='gone', email='gone@mail.ru')
+    session.add(gone)
+    session.commit()
+    session.delete(gone)
+    session.commit()
+
+    assert drain_outbox() == 4
+    assert bulk.call_count == 1
+    assert SearchOutbox.query.count() == 0
+    es_backend.client.index.assert_not_called()
+
+
+def test_drain_outbox_retries_with_backoff(
+        session: Session, es_backend: ElasticsearchBackend, mocker) -> None:
+    user = User(username='outbox', email='outbox@mail.ru')
+    session.add(user)
+    session.commit()
+    actions = []
+    mocker.patch('app.search_backends.helpers.bulk', side_effect=lambda client, items, **kwargs: (
+        0, [{'index': {'_index': 'user', '_id': str(action['_id']), 'status': 429}}
+            for action in items if actions.append(action) is None]))
+
+    assert drain_outbox() == 1
+    entry = SearchOutbox.query.one()
+    assert actions == [{'_op_type': 'index', '_index': 'user', '_id': user.id, '_source': {'username': 'outbox'}}]
+    assert entry.attempts == 1
+    assert entry.available_at > datetime.utcnow()
+    assert drain_outbox() == 0
+
+
+def test_drain_outbox_resumes_after_crashed_reindex(
+        session: Session, es_backend: ElasticsearchBackend, mocker) -> None:
+    bulk = mocker.patch('app.search_backends.helpers.bulk', side_effect=lambda client, actions, **kwargs: (
+        len(list(actions)), []))
+    sentinel = SearchOutbox(index='user', doc_id=0, operation='reindex',
+                            available_at=datetime.utcnow() + timedelta(minutes=5))
+    session.add(sentinel)
+    session.add(User(username='paused', email='paused@mail.ru'))
+    session.commit()
+
+    assert drain_outbox() == 0
+
+    # процесс reindex умер и не продлил аренду
+    sentinel.available_at = datetime.utcnow() - timedelta(seconds=1)
+    session.commit()
+
+    assert drain_outbox() == 1
+    assert bulk.call_count == 1
+    assert SearchOutbox.query.filter_by(operation='reindex').count() == 1
+
+
+def test_reindex_streams_chunks_and_swaps_alias(
+        session: Session, es_backend: ElasticsearchBackend, create_user: User, mocker) -> None:
+    client = es_backend.client
+    client.indices.exists_alias.return_value = False
+    client.indices.exists.return_value = True
+    session.add_all([User(username=f'reindex_{i}', email=f'reindex_{i}@mail.ru') for i in range(4)])
+    session.commit()
+    chunks = []
+
+    session.add(SearchOutbox(index='user', doc_id=0, operation='reindex',
+                             available_at=datetime.utcnow() - timedelta(hours=1)))
+    session.commit()
+
+    def streaming_bulk(client, actions, **kwargs):
+        sentinel = SearchOutbox.query.filter_by(index='user', operation='reindex').one()
+        assert sentinel.available_at > datetime.utcnow()
+        chunks.append(actions)
+        return [(True, {}) for _ in actions]
+
+    mocker.patch('app.search_backends.helpers.streaming_bulk', side_effect=streaming_bulk)
+    progress = MagicMock()
+
+    assert User.reindex(chunk_size=2, progress=progress) == 5
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    target = chunks[0][0]['_index']
+    assert target.startswith('user_')
+    assert progress.call_count == 3
+    assert client.indices.put_index_template.call_args.kwargs['index_patterns'] == ['user_*']
+    client.indices.update_aliases.assert_called_once_with(actions=[
+        {'remove_index': {'index': 'user'}}, {'add': {'index': target, 'alias': 'user'}}])
+    assert SearchOutbox.query.filter_by(operation='reindex').count() == 0
+
+
+def test_search_multiple_models_hydrates_in_score_order(
+        session: Session, test_app: Flask, create_user: User, capture_statements, mocker) -> None:
+    user = create_user
+    product = Product(name='hydrated', price=1, author=user)
+    session.add(product)
+    session.commit()
+    hits = [('product', product.id), ('user', user.id), ('user', 10 ** 6)]
+    mocker.patch('app.utils.search.query_index', return_value=(hits, 3, {'type': []}))
+
+    with capture_statements() as statements:
+        results, total, _ = search_multiple_models('hydrated', 1, 10)
+
+    assert results == [product, user]
+    assert total == 3
+    assert len(statements) == 2